@@ -0,0 +1,324 @@
+"""Benchmarks CriticEvolution over population sizes, song sizes and critic mixes.
+
+Every configuration evolves a population for a few generations and reports
+generations per second plus the time spent in each stage of a generation:
+
+- scoring: fingerprinting, fitness cache lookups and critic evaluation
+- selection: choosing parents (Evolution.get_parents less its scoring)
+- mutation: Evolution.mutate
+- crossover: building the next population (Evolution.mingle, copies and
+  Evolution.deduplicate included)
+- midi: writing the best song to a MIDI file once at the end
+
+Stage times are exclusive, so a stage nested in another (scoring during
+crossover, say) is only counted once. Results are printed as a table and
+written as JSON for comparing versions (`--compare old.json`). Nothing is
+played, so this runs without an audio device or display.
+
+`--import-time N` instead times starting an interpreter and importing music
+N times in each mode: with the synthesizers opened as they used to be on
+import (eager), as imported now (lazy), and with JYTHONMUSIC_HEADLESS set.
+
+To run, go into the jythonMusic directory and run
+`sh jython.sh ../benchmark.py --sizes 100,1000 --chords 24,1000 --mixes default,all`
+or run it with CPython and NumPy for the batch kernels.
+"""
+
+import os
+os.environ.setdefault("JYTHONMUSIC_HEADLESS", "1") # see music.HEADLESS
+try:
+	from java.lang import System
+	System.setProperty("java.awt.headless", "true")
+except ImportError:
+	pass
+
+import evolution
+import optparse
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from json_util import to_json, from_json
+from random_song import RandomSong as rs
+
+STAGES = ["scoring", "selection", "mutation", "crossover", "midi"]
+CRITIC_MIXES = {"default": "ChordProgression,Tempo",
+				"light": "Tempo,Length,ChordCount",
+				"melody": "AscendingMelody,DescendingMelody,Rhythm,RestRatio",
+				"all": "Tempo,Length,ChordCount,AscendingMelody,DescendingMelody,Rhythm,Major,Minor,"
+					   "ChordProgression,FollowingEm,MeterDuration,ChordDurationRepetition,RestRatio"}
+CHORDS_PER_PHRASE = 4
+PHRASES_PER_VERSE = 3
+
+
+def peak_memory():
+	"""Returns the peak memory of this process in kilobytes, or None if unknown.
+	Under Jython this is the JVM heap in use, the closest thing available."""
+	try:
+		import resource
+		peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+		if sys.platform == "darwin":
+			peak /= 1024 # bytes on macOS, kilobytes elsewhere
+		return peak
+	except ImportError:
+		pass
+	try:
+		from java.lang import Runtime
+		runtime = Runtime.getRuntime()
+		return (runtime.totalMemory()-runtime.freeMemory())/1024
+	except ImportError:
+		return None
+
+
+class StageTimer(object):
+	"""Accumulates exclusive wall time per stage"""
+	def __init__(self):
+		self.totals = dict([(stage, 0.0) for stage in STAGES])
+		self.stack = []
+		self.mark = None
+
+	def start(self, stage):
+		now = time.time()
+		if self.stack:
+			self.totals[self.stack[-1]] += now-self.mark
+		self.stack.append(stage)
+		self.mark = now
+
+	def stop(self):
+		now = time.time()
+		self.totals[self.stack.pop()] += now-self.mark
+		self.mark = now
+
+	def timed(self, stage, fn, *args):
+		self.start(stage)
+		try:
+			return fn(*args)
+		finally:
+			self.stop()
+
+
+class BenchmarkEvolution(evolution.CriticEvolution):
+	"""CriticEvolution with songs of num_chords chords and timed stages"""
+	def __init__(self, size, critics, num_chords, timer, genome="tree", batch=None):
+		self.num_chords = num_chords
+		self.timer = timer
+		super(BenchmarkEvolution, self).__init__(size, critics, genome=genome, batch=batch)
+
+	def random_song(self):
+		num_verses = max(1, self.num_chords/(CHORDS_PER_PHRASE*PHRASES_PER_VERSE))
+		return rs.random_song(self.root, self.legal_pitches, self.scale,
+							  num_phrases=PHRASES_PER_VERSE,
+							  phrase_length=CHORDS_PER_PHRASE,
+							  num_verses=num_verses)
+
+	def evaluate_population(self, songs):
+		return self.timer.timed("scoring", super(BenchmarkEvolution, self).evaluate_population, songs)
+
+	def get_fitness(self, song):
+		return self.timer.timed("scoring", super(BenchmarkEvolution, self).get_fitness, song)
+
+	def get_parents(self):
+		return self.timer.timed("selection", super(BenchmarkEvolution, self).get_parents)
+
+	def mutate(self, parents):
+		return self.timer.timed("mutation", super(BenchmarkEvolution, self).mutate, parents)
+
+	def mingle(self, mutated_parents, num_offspring):
+		return self.timer.timed("crossover", super(BenchmarkEvolution, self).mingle, mutated_parents, num_offspring)
+
+	def deduplicate(self, songs, present=()):
+		return self.timer.timed("crossover", super(BenchmarkEvolution, self).deduplicate, songs, present)
+
+
+def run_config(size, num_chords, mix, generations, genome="tree", batch=None, midi=True, seed=0):
+	"""Returns the result dict for one configuration"""
+	random.seed(seed)
+	timer = StageTimer()
+	evo = BenchmarkEvolution(size, evolution.parse_critics(CRITIC_MIXES.get(mix, mix)),
+							 num_chords, timer, genome, batch)
+	start = time.time()
+	for _ in xrange(generations):
+		evo.next_generation()
+	seconds = time.time()-start
+	best_song = evo.get_current_best_song()
+	if midi:
+		handle, path = tempfile.mkstemp(suffix=".mid")
+		os.close(handle)
+		try:
+			timer.timed("midi", best_song.write_to_midi, path)
+		finally:
+			os.remove(path)
+	return {"population": size,
+			"chords": num_chords,
+			"critics": mix,
+			"genome": genome,
+			"batch": evo.batch,
+			"generations": generations,
+			"seconds": seconds,
+			"generations_per_second": generations/max(seconds, 1e-9),
+			"stages": timer.totals,
+			"best_fitness": evo.get_fitness(best_song),
+			"peak_memory_kb": peak_memory()}
+
+
+def run_isolated(interpreter, args):
+	"""Runs one configuration in a fresh interpreter, so its peak memory is its own"""
+	command = interpreter + [os.path.abspath(__file__), "--single"] + args
+	process = subprocess.Popen(command, stdout=subprocess.PIPE)
+	output = process.communicate()[0]
+	if process.returncode != 0:
+		raise RuntimeError("Benchmark run failed: "+" ".join(args))
+	return from_json(output.strip().splitlines()[-1])
+
+
+def report(results):
+	print "%8s %7s %-12s %-10s %9s" % ("songs", "chords", "critics", "genome", "gens/s"),
+	print " ".join(["%9s" % stage for stage in STAGES]), "%10s" % "peak KB"
+	for r in results:
+		print "%8d %7d %-12s %-10s %9.3f" % (r["population"], r["chords"], r["critics"], r["genome"],
+											r["generations_per_second"]),
+		print " ".join(["%9.3f" % r["stages"][stage] for stage in STAGES]), "%10s" % r["peak_memory_kb"]
+
+
+def compare(results, old_path):
+	"""Prints the speed of each configuration relative to an earlier JSON report"""
+	f = open(old_path)
+	try:
+		old = from_json(f.read())["results"]
+	finally:
+		f.close()
+	def key(r):
+		return (r["population"], r["chords"], r["critics"], r["genome"])
+	old_by_key = dict([(key(r), r) for r in old])
+	for r in results:
+		if key(r) in old_by_key:
+			ratio = r["generations_per_second"]/old_by_key[key(r)]["generations_per_second"]
+			print "%8d %7d %-12s %-10s %6.2fx" % (key(r) + (ratio,))
+
+
+IMPORT_MODES = [("startup", "pass", False),
+				("eager", "import music; music.Java_synthesizer.getChannels(); music.jSyn.FRAMERATE", False),
+				("lazy", "import music", False),
+				("headless", "import music", True)]
+
+
+def time_imports(interpreter, repeats):
+	"""Returns [(mode, mean seconds)] to start interpreter and run each
+	IMPORT_MODES statement"""
+	timings = []
+	for mode, statement, headless in IMPORT_MODES:
+		env = os.environ.copy()
+		env.pop("JYTHONMUSIC_HEADLESS", None)
+		if headless:
+			env["JYTHONMUSIC_HEADLESS"] = "1"
+		total = 0.0
+		for _ in xrange(repeats):
+			start = time.time()
+			process = subprocess.Popen(interpreter+["-c", statement], env=env,
+									   stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+			process.communicate()
+			if process.returncode != 0:
+				raise RuntimeError("Import benchmark failed: "+statement)
+			total += time.time()-start
+		timings.append((mode, total/repeats))
+	return timings
+
+
+def int_list(text):
+	return [int(x) for x in text.split(",")]
+
+
+def main():
+	parser = optparse.OptionParser(usage="%prog [options]")
+	parser.add_option("--sizes", default="100,1000",
+					  help="comma separated population sizes, up to 100000 [default: %default]")
+	parser.add_option("--chords", default="24,1000",
+					  help="comma separated chords per song, up to 10000; 24 matches "
+						   "RandomSong.random_song [default: %default]")
+	parser.add_option("--mixes", default="default,all",
+					  help="comma separated critic mixes: "+", ".join(sorted(CRITIC_MIXES))+
+						   ", or critic names joined with + [default: %default]")
+	parser.add_option("--generations", type="int", default=5, help="generations per run [default: %default]")
+	parser.add_option("--genome", choices=evolution.GENOMES, default="tree")
+	parser.add_option("--batch", choices=["auto", "on", "off"], default="auto")
+	parser.add_option("--no-midi", dest="midi", action="store_false", default=True,
+					  help="skip timing MIDI export")
+	parser.add_option("--seed", type="int", default=0)
+	parser.add_option("--isolate", action="store_true", default=False,
+					  help="run every configuration in its own interpreter so peak memory is per configuration")
+	parser.add_option("--output", default="benchmark.json", help="JSON report path [default: %default]")
+	parser.add_option("--compare", default=None, help="earlier JSON report to compare speed against")
+	parser.add_option("--import-time", type="int", default=0, metavar="N",
+					  help="time importing music N times per mode instead of evolving")
+	parser.add_option("--interpreter", default=sys.executable,
+					  help="command that starts the interpreter for --import-time and --isolate, "
+						   "e.g. \"sh jython.sh\" [default: this interpreter]")
+	parser.add_option("--single", action="store_true", default=False, help=optparse.SUPPRESS_HELP)
+	options, args = parser.parse_args()
+
+	if options.import_time > 0:
+		timings = time_imports(options.interpreter.split(), options.import_time)
+		for mode, seconds in timings:
+			print "%-10s %8.3f s" % (mode, seconds)
+		timings = dict(timings)
+		print "Lazy import saves %.3f s, headless %.3f s" % (timings["eager"]-timings["lazy"],
+															  timings["eager"]-timings["headless"])
+		out = open(options.output, "w")
+		try:
+			out.write(to_json({"python": sys.version,
+							   "platform": sys.platform,
+							   "time": time.time(),
+							   "import_time": timings}, ""))
+			out.write("\n")
+		finally:
+			out.close()
+		sys.exit(0)
+
+	batch = {"auto": None, "on": True, "off": False}[options.batch]
+	configs = []
+	for size in int_list(options.sizes):
+		for num_chords in int_list(options.chords):
+			for mix in options.mixes.split(","):
+				configs.append((size, num_chords, mix.replace("+", ",")))
+
+	if options.single:
+		size, num_chords, mix = configs[0]
+		print to_json(run_config(size, num_chords, mix, options.generations, options.genome, batch,
+								 options.midi, options.seed))
+		sys.exit(0)
+
+	results = []
+	for size, num_chords, mix in configs:
+		print "Running", size, "songs of", num_chords, "chords with critics:", mix
+		if options.isolate:
+			args = ["--sizes", str(size), "--chords", str(num_chords), "--mixes", mix.replace(",", "+"),
+					"--generations", str(options.generations), "--genome", options.genome,
+					"--batch", options.batch, "--seed", str(options.seed)]
+			if not options.midi:
+				args.append("--no-midi")
+			results.append(run_isolated(options.interpreter.split(), args))
+		else:
+			results.append(run_config(size, num_chords, mix, options.generations, options.genome, batch,
+									  options.midi, options.seed))
+
+	print
+	report(results)
+	out = open(options.output, "w")
+	try:
+		out.write(to_json({"python": sys.version,
+						   "platform": sys.platform,
+						   "time": time.time(),
+						   "isolated": options.isolate,
+						   "results": results}, ""))
+		out.write("\n")
+	finally:
+		out.close()
+	print "\nWritten to", options.output
+	if options.compare is not None:
+		print "\nSpeed relative to", options.compare
+		compare(results, options.compare)
+
+
+if __name__ == '__main__':
+	evolution.run_cli(main)
@@ -0,0 +1,128 @@
+"""Checkpoint and resume support for long evolution runs.
+
+A checkpoint directory holds
+
+- genomes/<digest>: one zlib-compressed pickle per distinct song, named by
+  the digest of its pickle. Songs that are already on disk are not written
+  again, so each checkpoint only writes the individuals that changed.
+- manifest: the generation counter, the random module's state, the
+  Evolution's settings (critics, selection, survival rates, ...), the
+  digests of the population in order and the caller's extra values
+  (evolution.py keeps the first best song, the restart count, the plateau
+  history and the songs for --export-best there). It is replaced
+  atomically, so a run killed mid-write still resumes from the previous
+  checkpoint.
+
+Restoring a checkpoint and continuing gives exactly the same songs as a run
+that was never interrupted.
+"""
+
+import evolution
+import os
+import random
+import zlib
+
+try:
+	import cPickle as pickle
+except ImportError:
+	import pickle
+
+try:
+	from hashlib import md5
+except ImportError:
+	from md5 import new as md5
+
+CHECKPOINT_EVERY = 10
+# Evolution attributes rebuilt on load rather than saved
+TRANSIENT = ["population", "fitness_cache", "executor", "hooks"]
+
+
+class Checkpointer(object):
+	def __init__(self, directory, every=CHECKPOINT_EVERY):
+		self.directory = directory
+		self.every = every
+		self.genome_dir = os.path.join(directory, "genomes")
+		self.manifest_path = os.path.join(directory, "manifest")
+		if not os.path.isdir(self.genome_dir):
+			os.makedirs(self.genome_dir)
+		self.stored = set(os.listdir(self.genome_dir)) # digests already on disk
+		self.genomes_written = 0
+
+	def exists(self):
+		return os.path.exists(self.manifest_path)
+
+	def maybe_save(self, evo, extra=None):
+		"""Saves a checkpoint if evo.generation is a multiple of every"""
+		if self.every > 0 and evo.generation % self.every == 0:
+			self.save(evo, extra)
+			return True
+		return False
+
+	def save(self, evo, extra=None):
+		"""Writes a checkpoint of evo. extra is a dict of picklable values
+		(e.g. the generation 0 best song) returned again by load."""
+		digests = [self._store_genome(song) for song in evo.population]
+		settings = {}
+		for name, value in evo.__dict__.items():
+			if name not in TRANSIENT:
+				settings[name] = value
+		manifest = {"class": evo.__class__.__name__,
+					"settings": settings,
+					"random_state": random.getstate(),
+					"population": digests,
+					"extra": extra or {}}
+		tmp_path = self.manifest_path + ".tmp"
+		f = open(tmp_path, "wb")
+		try:
+			pickle.dump(manifest, f, 2)
+		finally:
+			f.close()
+		if os.path.exists(self.manifest_path) and os.name == "nt":
+			os.remove(self.manifest_path)
+		os.rename(tmp_path, self.manifest_path)
+		self._remove_unused(set(digests))
+
+	def load(self, executor=None):
+		"""Returns (evolution, extra) restored from the last checkpoint and
+		restores the random module's state"""
+		f = open(self.manifest_path, "rb")
+		try:
+			manifest = pickle.load(f)
+		finally:
+			f.close()
+		cls = getattr(evolution, manifest["class"])
+		evo = cls.__new__(cls)
+		evo.__dict__.update(manifest["settings"])
+		evo.fitness_cache = evolution.FitnessCache()
+		if executor is None:
+			executor = evolution.SerialExecutor()
+		evo.executor = executor
+		evo.hooks = []
+		evo.population = [self._load_genome(digest) for digest in manifest["population"]]
+		random.setstate(manifest["random_state"])
+		return evo, manifest["extra"]
+
+	def _store_genome(self, song):
+		data = pickle.dumps(song, 2)
+		digest = md5(data).hexdigest()
+		if digest not in self.stored:
+			f = open(os.path.join(self.genome_dir, digest), "wb")
+			try:
+				f.write(zlib.compress(data))
+			finally:
+				f.close()
+			self.stored.add(digest)
+			self.genomes_written += 1
+		return digest
+
+	def _load_genome(self, digest):
+		f = open(os.path.join(self.genome_dir, digest), "rb")
+		try:
+			return pickle.loads(zlib.decompress(f.read()))
+		finally:
+			f.close()
+
+	def _remove_unused(self, digests):
+		for digest in list(self.stored - digests):
+			os.remove(os.path.join(self.genome_dir, digest))
+			self.stored.discard(digest)
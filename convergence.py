@@ -0,0 +1,58 @@
+"""Plateau detection for evolution runs.
+
+A PlateauDetector is an Evolution hook (see Evolution.add_hook) that records
+the best and mean fitness of every generation. The run has stalled when,
+over the last `window` generations, the best fitness improved by no more
+than `best_tolerance` and the mean fitness moved by no more than
+`mean_tolerance`. Both tolerances are relative to the older value.
+
+The evolution.py loop then either stops early or restarts: it keeps the
+fittest songs, replaces the rest with new random songs (Evolution.restart)
+and waits for the next plateau. It stops for good after `max_restarts`.
+"""
+
+WINDOW = 50
+BEST_TOLERANCE = 1e-3
+MEAN_TOLERANCE = 1e-2
+ACTIONS = ["stop", "restart"]
+
+
+def relative_change(old, new):
+	return (new-old)/max(abs(old), 1e-12)
+
+
+class PlateauDetector(object):
+	def __init__(self, window=WINDOW, best_tolerance=BEST_TOLERANCE, mean_tolerance=MEAN_TOLERANCE):
+		self.window = window
+		self.best_tolerance = best_tolerance
+		self.mean_tolerance = mean_tolerance
+		self.best = [] # best fitness per generation since the last reset
+		self.mean = []
+		self.fitnesses = None
+
+	def before(self, evo, stage):
+		pass
+
+	def after(self, evo, stage, result):
+		# The first scoring of a generation is of the whole population
+		if stage == "scoring" and self.fitnesses is None:
+			self.fitnesses = result
+
+	def generation_done(self, evo):
+		if self.fitnesses:
+			self.best.append(max(self.fitnesses))
+			self.mean.append(sum(self.fitnesses)/float(len(self.fitnesses)))
+		self.fitnesses = None
+
+	def stalled(self):
+		"""Returns whether neither best nor mean fitness moved over the window"""
+		if self.window <= 0 or len(self.best) <= self.window:
+			return False
+		best_gain = relative_change(max(self.best[:-self.window]), max(self.best[-self.window:]))
+		mean_change = abs(relative_change(self.mean[-self.window-1], self.mean[-1]))
+		return best_gain <= self.best_tolerance and mean_change <= self.mean_tolerance
+
+	def reset(self):
+		"""Forgets the history, e.g. after a restart"""
+		self.best = []
+		self.mean = []
@@ -1,132 +1,417 @@
 from evolution import *
 import critic_util
-import music
+import theory
 import collections
+from flat_song import FlatSong, VERSE, PHRASE, CHORD
+from phrase_cache import PhraseCache
+from population_batch import np
 
 ROOT = 0
-SCALE = [music.C4+intv for intv in music.MAJOR_SCALE]
-LEGAL_PITCHES = SCALE+[music.REST, music.C5]
+SCALE = [theory.C4+intv for intv in theory.MAJOR_SCALE]
+LEGAL_PITCHES = SCALE+[theory.REST, theory.C5]
 SURVIVAL_RATE = 0.5
 
 class Critic(): 
-	def critique_song(self):
+	# Critics score a song tree through callbacks fed by a FusedEvaluator, which
+	# walks the song once for any number of critics:
+	#   begin(song)                            -> per-song state
+	#   on_chord(state, chord, index, phrase)  index within the phrase
+	#   finish(state, song)                    -> score
+	# A critic that needs no chords (Tempo) leaves out on_chord.
+	#
+	# Critics can also score a song phrase by phrase, through a PhraseEvaluator
+	# that caches the local scores of each phrase content:
+	#   phrase_score(phrase)      -> local score, from the phrase content alone
+	#   combine(scores, song)     -> score, from the local scores in song order
+	def begin(self, song):
+		return None
+
+	def finish(self, state, song):
 		raise UnimplementedError
 
+	def critique_song(self, song):
+		return FusedEvaluator([self]).evaluate(song)[0]
+
+	def critique_flat(self, flat):
+		# Scores a flat_song.FlatSong. Critics override this to read the arrays
+		# directly; this fallback converts back to a tree.
+		return self.critique_song(flat.to_song())
+
+	def critique_population(self, batch):
+		# Scores every song of a population_batch.PopulationBatch. Critics with a
+		# NumPy kernel (critique_matrices) score the packed matrices in one go;
+		# otherwise each song's flat arrays are scored in turn.
+		if batch.packed and hasattr(self, "critique_matrices"):
+			return self.critique_matrices(batch).tolist()
+		return [self.critique_flat(f) for f in batch.flats]
+
+class AdditiveCritic(Critic):
+	# A critic whose state is a list of sums that on_chord adds to, whatever
+	# came before, scores each phrase with a fresh state and adds them up
+	def phrase_score(self, phrase):
+		state = self.begin(None)
+		index = 0
+		for chord in phrase.sequence:
+			self.on_chord(state, chord, index, phrase)
+			index += 1
+		return tuple(state)
+
+	def combine(self, scores, song):
+		state = self.begin(song)
+		for score in scores:
+			for i in xrange(len(state)):
+				state[i] += score[i]
+		return self.finish(state, song)
+
+def supports_batch(critics):
+	"""Returns whether every critic can score a whole PopulationBatch"""
+	for critic in critics:
+		if not hasattr(critic, "critique_population"):
+			return False
+	return True
+
+class FusedEvaluator(object):
+	"""Walks a song tree once, feeding every critic's callbacks"""
+	def __init__(self, critics):
+		self.critics = critics
+		# Positions of the critics with on_chord, so a walk only calls those
+		self.chord_positions = [i for i, c in enumerate(critics) if hasattr(c, "on_chord")]
+
+	def evaluate(self, song):
+		"""Returns each critic's score for song"""
+		states = [c.begin(song) for c in self.critics]
+		callbacks = [(self.critics[i].on_chord, states[i]) for i in self.chord_positions]
+		if callbacks:
+			for verse in song.verse_seq:
+				for phrase in verse.sequence:
+					index = 0
+					for chord in phrase.sequence:
+						for callback, state in callbacks:
+							callback(state, chord, index, phrase)
+						index += 1
+		return [c.finish(state, song) for c, state in zip(self.critics, states)]
+
+class PhraseEvaluator(object):
+	"""Scores songs phrase by phrase for critics with phrase_score and combine.
+	The local scores of every phrase are kept in a PhraseCache keyed by the
+	phrase's fingerprint, so repeated phrase content is scored once. The
+	fingerprint leaves out the scale, which is the same for every song of an
+	evolution; use one evaluator per evolution.
+
+	The local scores are also stored on the phrase itself (critic_scores),
+	which song.Phrase drops when mutation records a change beneath it and
+	copies keep, and which persistent phrases never need to drop. Scoring a
+	child then only walks the phrases that changed since its parent was
+	scored, plus one combine step per critic."""
+	def __init__(self, critics, cache=None):
+		self.critics = critics
+		if cache is None: # an empty cache is false
+			cache = PhraseCache()
+		self.cache = cache
+
+	def _score_phrase(self, phrase):
+		return tuple([c.phrase_score(phrase) for c in self.critics])
+
+	def evaluate(self, song):
+		"""Returns each critic's score for song"""
+		phrase_scores = []
+		for verse in song.verse_seq:
+			for phrase in verse.sequence:
+				stored = phrase.critic_scores
+				if stored is None or stored[0] is not self:
+					stored = (self, self.cache.lookup(phrase.fingerprint(), self._score_phrase, phrase))
+					phrase.critic_scores = stored
+				phrase_scores.append(stored[1])
+		return [c.combine([scores[i] for scores in phrase_scores], song) for i, c in enumerate(self.critics)]
+
+class CriticScorer(object):
+	# Sums the scores of several critics, walking each song tree once for all
+	# of them. Critics that score phrase by phrase go through a PhraseEvaluator
+	# instead. Unlike a bound method this can be pickled and shipped to worker
+	# processes.
+	def __init__(self, critics):
+		self.critics = critics
+		self.phrase_positions = [i for i, c in enumerate(critics) if hasattr(c, "phrase_score")]
+		self.walk_positions = [i for i, c in enumerate(critics) if not hasattr(c, "phrase_score")]
+		self.phrase_evaluator = PhraseEvaluator([critics[i] for i in self.phrase_positions])
+		self.evaluator = FusedEvaluator([critics[i] for i in self.walk_positions])
+
+	def __call__(self, song):
+		fitnesses = []
+		if isinstance(song, FlatSong):
+			for critic in self.critics:
+				fitnesses.append(critic.critique_flat(song))
+		else:
+			fitnesses = [0.0]*len(self.critics)
+			for evaluator, positions in [(self.phrase_evaluator, self.phrase_positions),
+										 (self.evaluator, self.walk_positions)]:
+				if positions:
+					for position, fitness in zip(positions, evaluator.evaluate(song)):
+						fitnesses[position] = fitness
+		return sum(fitnesses)
+
+	def critique_population(self, batch):
+		"""Returns the summed score of every song in a PopulationBatch"""
+		scores = [critic.critique_population(batch) for critic in self.critics]
+		return [sum(song_scores) for song_scores in zip(*scores)]
+
 class TempoCritic(Critic):
 	def __init__(self, tempo=40):
 		self.tempo = tempo
 
-	def critique_song(self, song):
+	def finish(self, state, song):
 		fitness = 1.0/(1.0+abs(song.tempo-self.tempo))
 		return fitness
 
-class LengthCritic(Critic):
+	def phrase_score(self, phrase):
+		return None
+
+	def combine(self, scores, song):
+		return self.finish(None, song)
+
+	def critique_flat(self, flat):
+		return self.finish(None, flat)
+
+	def critique_matrices(self, batch):
+		return 1.0/(1.0+np.abs(batch.tempo-self.tempo))
+
+class LengthCritic(AdditiveCritic):
 	def __init__(self, length=16):
 		self.length = length
 
-	def critique_song(self, song):
-		total_notes = 0
-		for verse in song.verse_seq:
-			for phrase in verse.sequence:
-				for chord in phrase.sequence: 
-					if chord.note_seq is not None:
-						for note in chord.note_seq:
-							total_notes += 1
+	def begin(self, song):
+		return [0] # total notes
+
+	def on_chord(self, state, chord, index, phrase):
+		if chord.note_seq is not None:
+			state[0] += len(chord.note_seq)
+
+	def finish(self, state, song):
+		fitness = 1.0/(1.0+abs(state[0]-self.length))
+		return fitness
+
+	def critique_flat(self, flat):
+		total_notes = len(flat.note_pitch)
 		fitness = 1.0/(1.0+abs(total_notes-self.length))
 		return fitness
 
-class ChordCountCritic(Critic):
+	def critique_matrices(self, batch):
+		return 1.0/(1.0+np.abs(batch.num_notes-self.length))
+
+class ChordCountCritic(AdditiveCritic):
 	def __init__(self, length=4):
 		self.length = length
 
-	def critique_song(self, song):
-		total_chords = 0
-		for verse in song.verse_seq:
-			for phrase in verse.sequence:
-				for chord in phrase.sequence:
-					total_chords += 1
+	def begin(self, song):
+		return [0] # total chords
+
+	def on_chord(self, state, chord, index, phrase):
+		state[0] += 1
+
+	def finish(self, state, song):
+		fitness = 1.0/(1.0+abs(state[0]-self.length))
+		return fitness
+
+	def critique_flat(self, flat):
+		total_chords = flat.count(CHORD)
 		fitness = 1.0/(1.0+abs(total_chords-self.length))
 		return fitness
 
+	def critique_matrices(self, batch):
+		return 1.0/(1.0+np.abs(batch.num_chords-self.length))
+
+def melody_phrase_score(phrase, steps):
+	"""Returns (steps between notes of the phrase, notes, first pitch, last
+	pitch) for the melody critics; the step into the phrase is left to
+	combine_melody_scores"""
+	score = 0
+	num_notes = 0
+	first_pitch = previous_pitch = None
+	for chord in phrase.sequence:
+		if chord.note_seq is not None:
+			for note in chord.note_seq:
+				if previous_pitch is None:
+					first_pitch = note.pitch
+				elif note.pitch - previous_pitch in steps:
+					score += 1
+				previous_pitch = note.pitch
+			num_notes += len(chord.note_seq)
+	return (score, num_notes, first_pitch, previous_pitch)
+
+def combine_melody_scores(scores, steps):
+	total_score = 0
+	total_notes = 0
+	previous_pitch = 0
+	for score, num_notes, first_pitch, last_pitch in scores:
+		if num_notes:
+			if first_pitch - previous_pitch in steps:
+				total_score += 1
+			previous_pitch = last_pitch
+		total_score += score
+		total_notes += num_notes
+	return total_score/(1.0*total_notes)
+
 class AscendingMelodyCritic(Critic):
 	# Gives +1 if two adjacent notes are ascending by a step or half step
-	def critique_song(self, song):
+	def begin(self, song):
+		return [0, 0, 0] # total score, total notes, previous note pitch
+
+	def on_chord(self, state, chord, index, phrase):
+		if chord.note_seq is not None:
+			previous_note_pitch = state[2]
+			for note in chord.note_seq:
+				dist = note.pitch - previous_note_pitch
+				if dist == 1 or dist == 2:
+					state[0] += 1
+				previous_note_pitch = note.pitch
+			state[1] += len(chord.note_seq)
+			state[2] = previous_note_pitch
+
+	def finish(self, state, song):
+		return state[0]/(1.0*state[1])
+
+	def phrase_score(self, phrase):
+		return melody_phrase_score(phrase, (1, 2))
+
+	def combine(self, scores, song):
+		return combine_melody_scores(scores, (1, 2))
+
+	def critique_flat(self, flat):
 		previous_note_pitch = 0
-		total_notes = 0
 		total_score = 0
-		for verse in song.verse_seq:
-			for phrase in verse.sequence:
-				for chord in phrase.sequence:
-					if chord.note_seq is not None:
-						for note in chord.note_seq:
-							dist = note.pitch - previous_note_pitch
-							if dist == 1 or dist == 2:
-								total_score += 1
-							total_notes += 1
-							previous_note_pitch = note.pitch
-		return total_score/(1.0*total_notes)
+		for pitch in flat.note_pitch:
+			dist = pitch - previous_note_pitch
+			if dist == 1 or dist == 2:
+				total_score += 1
+			previous_note_pitch = pitch
+		return total_score/(1.0*len(flat.note_pitch))
+
+	def critique_matrices(self, batch):
+		previous_pitch = np.zeros_like(batch.note_pitch)
+		previous_pitch[:, 1:] = batch.note_pitch[:, :-1]
+		dist = batch.note_pitch - previous_pitch
+		steps = ((dist == 1) | (dist == 2)) & batch.note_mask
+		return steps.sum(axis=1)/(1.0*batch.num_notes)
 
 
 class DescendingMelodyCritic(Critic):
 	# Gives +1 if two adjacent notes are descending by a step or half step
-	def critique_song(self, song):
+	def begin(self, song):
+		return [0, 0, 0] # total score, total notes, previous note pitch
+
+	def on_chord(self, state, chord, index, phrase):
+		if chord.note_seq is not None:
+			previous_note_pitch = state[2]
+			for note in chord.note_seq:
+				dist = note.pitch - previous_note_pitch
+				if dist == -1 or dist == -2:
+					state[0] += 1
+				previous_note_pitch = note.pitch
+			state[1] += len(chord.note_seq)
+			state[2] = previous_note_pitch
+
+	def finish(self, state, song):
+		return state[0]/(1.0*state[1])
+
+	def phrase_score(self, phrase):
+		return melody_phrase_score(phrase, (-1, -2))
+
+	def combine(self, scores, song):
+		return combine_melody_scores(scores, (-1, -2))
+
+	def critique_flat(self, flat):
 		previous_note_pitch = 0
-		total_notes = 0
 		total_score = 0
-		for verse in song.verse_seq:
-			for phrase in verse.sequence:
-				for chord in phrase.sequence:
-					if chord.note_seq is not None:
-						for note in chord.note_seq:
-							dist = note.pitch - previous_note_pitch
-							if dist == -1 or dist == -2:
-								total_score += 1
-							total_notes += 1
-							previous_note_pitch = note.pitch
-		return total_score/(1.0*total_notes)						
-
-class RhythmCritic(Critic):
+		for pitch in flat.note_pitch:
+			dist = pitch - previous_note_pitch
+			if dist == -1 or dist == -2:
+				total_score += 1
+			previous_note_pitch = pitch
+		return total_score/(1.0*len(flat.note_pitch))
+
+	def critique_matrices(self, batch):
+		previous_pitch = np.zeros_like(batch.note_pitch)
+		previous_pitch[:, 1:] = batch.note_pitch[:, :-1]
+		dist = batch.note_pitch - previous_pitch
+		steps = ((dist == -1) | (dist == -2)) & batch.note_mask
+		return steps.sum(axis=1)/(1.0*batch.num_notes)
+
+class RhythmCritic(AdditiveCritic):
 	def __init__(self, rhythm=10.0):
 		self.best_rhythm = rhythm
 	# Assumes greater standard deviation in durations up to 10.0 means more sophisticated song
-	def critique_song(self, song):
-		sum_devs = 0.0
-		num_opps = 0
-		for verse in song.verse_seq:
-			for phrase in verse.sequence:
-				for chord in phrase.sequence:
-					if chord.note_seq is None:
-							sum_devs+=0.0
-							continue
-					else:
-						durations = [e.get_duration() for e in chord.note_seq]
-						num_opps+=1
-						sum_devs+=critic_util.stdev(durations)
-		avg_devs = sum_devs/num_opps
+	def begin(self, song):
+		return [0.0, 0] # sum of deviations, opportunities
+
+	def on_chord(self, state, chord, index, phrase):
+		if chord.note_seq is not None:
+			durations = [e.get_duration() for e in chord.note_seq]
+			state[1]+=1
+			state[0]+=critic_util.stdev(durations)
+
+	def finish(self, state, song):
+		avg_devs = state[0]/state[1]
 		return 1.0/(1.0+abs(self.best_rhythm - avg_devs))
 
+	def critique_flat(self, flat):
+		sum_devs = sum(critic_util.segment_stdevs(flat.note_duration, flat.bounds[CHORD]))
+		avg_devs = sum_devs/flat.count(CHORD)
+		return 1.0/(1.0+abs(self.best_rhythm - avg_devs))
+
+	def critique_matrices(self, batch):
+		stdevs = critic_util.masked_stdev(batch.chord_note_duration, batch.chord_note_mask)
+		avg_devs = np.where(batch.chord_mask, stdevs, 0.0).sum(axis=1)/batch.num_chords
+		return 1.0/(1.0+np.abs(self.best_rhythm - avg_devs))
 
-class MajorCritic(Critic):
+
+class MajorCritic(AdditiveCritic):
 	# Assumes more major chords are more pleasing to the year
-	def critique_song(self, song):
+	def begin(self, song):
+		return [0] # major chords
+
+	def on_chord(self, state, chord, index, phrase):
+		state[0]+= critic_util.is_major_chord(chord)
+
+	def finish(self, state, song):
+		return state[0]
+
+	def critique_flat(self, flat):
 		num_major_chords = 0
-		for verse in song.verse_seq:
-			for phrase in verse.sequence:
-				for chord in phrase.sequence:
-					num_major_chords+= critic_util.is_major_chord(chord)
+		for root in flat.chord_root:
+			num_major_chords+= critic_util.is_major_root(flat.scale, root)
 		return num_major_chords
 
-class MinorCritic(Critic):
+	def critique_matrices(self, batch):
+		major_scale = np.array([critic_util.is_major_scale(scale) for scale in batch.scales])
+		roots = batch.chord_root
+		major_roots = ((roots == 0) | (roots == 3) | (roots == 4) | (roots == 7)) & batch.chord_mask
+		return major_roots.sum(axis=1)*major_scale
+
+class MinorCritic(AdditiveCritic):
 	# Assumes more minor chords are more pleasing to the year
-	def critique_song(self, song):
+	def begin(self, song):
+		return [0, 0] # major chords, chords
+
+	def on_chord(self, state, chord, index, phrase):
+		state[0]+= critic_util.is_major_chord(chord)
+		state[1] += 1
+
+	def finish(self, state, song):
+		major_frac = state[0]/(1.0*state[1])
+		return 1.0-major_frac
+
+	def critique_flat(self, flat):
 		num_major_chords = 0
-		num_chords = 0
-		for verse in song.verse_seq:
-			for phrase in verse.sequence:
-				for chord in phrase.sequence:
-					num_major_chords+= critic_util.is_major_chord(chord)
-					num_chords += 1
-		major_frac = num_major_chords/(1.0*num_chords)
+		for root in flat.chord_root:
+			num_major_chords+= critic_util.is_major_root(flat.scale, root)
+		major_frac = num_major_chords/(1.0*flat.count(CHORD))
+		return 1.0-major_frac
+
+	def critique_matrices(self, batch):
+		major_scale = np.array([critic_util.is_major_scale(scale) for scale in batch.scales])
+		roots = batch.chord_root
+		major_roots = ((roots == 0) | (roots == 3) | (roots == 4) | (roots == 7)) & batch.chord_mask
+		major_frac = major_roots.sum(axis=1)*major_scale/(1.0*batch.num_chords)
 		return 1.0-major_frac
 
 
@@ -135,44 +420,111 @@ class ChordProgressionCritic(Critic):
 	def __init__(self, progression):
 		self.progression = progression
 
-	def critique_song(self, song):
+	def begin(self, song):
+		return [1, 0, 0] # progression score, opportunities, position in progression
+
+	def on_chord(self, state, chord, index, phrase):
+		state[1] += 1
+		if chord.root == self.progression[state[2]]:
+			state[0] += 1
+			state[2] += 1
+			state[2] %= len(self.progression)
+		else:
+			state[2] = 0
+
+	def finish(self, state, song):
+		return state[0]/(1.0*state[1])
+
+	def phrase_score(self, phrase):
+		# The score of a phrase depends on the position in the progression it
+		# starts at, so keep (matches, chords, position after) for each one
+		scores = []
+		for start in xrange(len(self.progression)):
+			state = [0, 0, start]
+			index = 0
+			for chord in phrase.sequence:
+				self.on_chord(state, chord, index, phrase)
+				index += 1
+			scores.append(tuple(state))
+		return tuple(scores)
+
+	def combine(self, scores, song):
+		state = self.begin(song)
+		for score in scores:
+			matches, chords, position = score[state[2]]
+			state[0] += matches
+			state[1] += chords
+			state[2] = position
+		return self.finish(state, song)
+
+	def critique_flat(self, flat):
 		total_progression_score = 1
-		total_opportunities = 0
 		position_in_progression = 0
+		for root in flat.chord_root:
+			if root == self.progression[position_in_progression]:
+				total_progression_score += 1
+				position_in_progression += 1
+				position_in_progression %= len(self.progression)
+			else:
+				position_in_progression = 0
+		return total_progression_score/(1.0*flat.count(CHORD))
 
-		num_major_chords = 0
-		for verse in song.verse_seq:
-			for phrase in verse.sequence:
-				for chord in phrase.sequence:
-					total_opportunities += 1
-					if chord.root == self.progression[position_in_progression]:
-						total_progression_score += 1
-						position_in_progression += 1
-						position_in_progression %= len(self.progression)
-					else:
-						position_in_progression = 0
-
-		return total_progression_score/(1.0*total_opportunities)
-
-class FollowingEmCritic(Critic):
-	def critique_song(self, song):
-		# Assumes em ->am or F as sign of better song beacuse 93% of songs follow this sequence
+	def critique_matrices(self, batch):
+		# The progression is a state machine, so step through chord positions
+		# while scoring every song at each step
+		progression = np.array(self.progression)
+		position = np.zeros(batch.size, dtype=np.int64)
+		total_progression_score = np.ones(batch.size)
+		for c in xrange(batch.chord_root.shape[1]):
+			active = batch.chord_mask[:, c]
+			match = (batch.chord_root[:, c] == progression[position]) & active
+			total_progression_score += match
+			position = np.where(match, (position+1) % len(progression), np.where(active, 0, position))
+		return total_progression_score/(1.0*batch.num_chords)
+
+class FollowingEmCritic(AdditiveCritic):
+	# Assumes em ->am or F as sign of better song beacuse 93% of songs follow this sequence
+	def begin(self, song):
+		return [0, 0] # progression count, progression opportunities
+
+	def on_chord(self, state, chord, index, phrase):
+		# e minor in C major 
+		if chord.root == 3 and (not index == len(phrase.sequence)) and chord.scale == theory.MAJOR_SCALE:
+			state[1]+=1
+			if phrase.sequence[index+1].root == 4 or phrase.sequence[index+1].root == 6: 
+				state[0]+=1
+
+	def finish(self, state, song):
+		if state[1] == 0:
+			return 0
+		return state[0]*1.0/state[1]
+
+	def critique_flat(self, flat):
 		progression_count = 0
 		progression_opps = 0
-		for verse in song.verse_seq:
-			for phrase in verse.sequence:
-				for index,chord in enumerate(phrase.sequence):
-					# e minor in C major 
-					if chord.root == 3 and (not index == len(phrase.sequence)) and chord.scale == music.MAJOR_SCALE:
-						progression_opps+=1
-						if phrase.sequence[index+1].root == 4 or phrase.sequence[index+1].root == 6: 
-							progression_count+=1
+		phrase_bounds = flat.bounds[PHRASE]
+		for p in xrange(flat.count(PHRASE)):
+			roots = flat.chord_root[phrase_bounds[p]:phrase_bounds[p+1]]
+			for index, root in enumerate(roots):
+				if root == 3 and (not index == len(roots)) and flat.scale == theory.MAJOR_SCALE:
+					progression_opps+=1
+					if roots[index+1] == 4 or roots[index+1] == 6:
+						progression_count+=1
 		if progression_opps == 0:
 			return 0
 		return progression_count*1.0/progression_opps
 
+	def critique_matrices(self, batch):
+		# Only songs whose chords use the bare MAJOR_SCALE can score, so those
+		# few are scored one by one
+		scores = np.zeros(batch.size)
+		for s, scale in enumerate(batch.scales):
+			if scale == theory.MAJOR_SCALE:
+				scores[s] = self.critique_flat(batch.flats[s])
+		return scores
+
 
-class MeterDurationCritic(Critic):
+class MeterDurationCritic(AdditiveCritic):
 	# Assumes rhythm that follows one of the poetic meters is better
 	@staticmethod
 	def get_patterns():
@@ -183,56 +535,113 @@ class MeterDurationCritic(Critic):
 		AMPHIBRACH = [0.5, 1, 0.5]
 		return [IAMB, ANAPEST, TROCHEE, DACTYL, AMPHIBRACH]
 
-	def critique_song(self, song):
-		patterns = self.get_patterns()
+	def begin(self, song):
+		return [0.0, 0] # metric matches, total notes
+
+	def on_chord(self, state, chord, index, phrase):
+		for index, note in enumerate(chord.note_seq):
+			state[1]+=1
+			if index % 3 == 0 and index > 2:
+				segment = [chord.note_seq[index-2].duration, chord.note_seq[index-1].duration, note.duration]
+				ratios = map(lambda x:1.0-x*1.0/max(segment), segment)
+				deviation_from_ratios = sum(ratios)
+				state[0]+=(1.0/(1+0.01+deviation_from_ratios))
+			if index % 2 == 0 and index > 1:
+				segment = [chord.note_seq[index-1].duration, note.duration]
+				ratios = map(lambda x: 1.0-x*1.0/max(segment), segment)
+				deviation_from_ratios = sum(ratios)
+				state[0]+=(1.0/(1+0.01+deviation_from_ratios))
+
+	def finish(self, state, song):
+		return state[0]/(state[1]*2.0)
+
+	def critique_flat(self, flat):
 		metric_matches = 0.0
-		total_notes = 0
-		for verse in song.verse_seq:
-			for phrase in verse.sequence:
-				for chord in phrase.sequence:
-					for index, note in enumerate(chord.note_seq):
-						total_notes+=1
-						if index % 3 == 0 and index > 2:
-							segment = [chord.note_seq[index-2].duration, chord.note_seq[index-1].duration, note.duration]
-							ratios = map(lambda x:1.0-x*1.0/max(segment), segment)
-							deviation_from_ratios = sum(ratios)
-							metric_matches+=(1.0/(1+0.01+deviation_from_ratios))
-						if index % 2 == 0 and index > 1:
-							segment = [chord.note_seq[index-1].duration, note.duration]
-							ratios = map(lambda x: 1.0-x*1.0/max(segment), segment)
-							deviation_from_ratios = sum(ratios)
-							metric_matches+=(1.0/(1+0.01+deviation_from_ratios))
-		return metric_matches/(total_notes*2.0)
+		chord_bounds = flat.bounds[CHORD]
+		for c in xrange(flat.count(CHORD)):
+			durations = flat.note_duration[chord_bounds[c]:chord_bounds[c+1]]
+			for index, duration in enumerate(durations):
+				if index % 3 == 0 and index > 2:
+					segment = [durations[index-2], durations[index-1], duration]
+					ratios = map(lambda x:1.0-x*1.0/max(segment), segment)
+					deviation_from_ratios = sum(ratios)
+					metric_matches+=(1.0/(1+0.01+deviation_from_ratios))
+				if index % 2 == 0 and index > 1:
+					segment = [durations[index-1], duration]
+					ratios = map(lambda x: 1.0-x*1.0/max(segment), segment)
+					deviation_from_ratios = sum(ratios)
+					metric_matches+=(1.0/(1+0.01+deviation_from_ratios))
+		return metric_matches/(len(flat.note_duration)*2.0)
+
+	def critique_matrices(self, batch):
+		durations = batch.chord_note_duration
+		mask = batch.chord_note_mask
+		metric_matches = np.zeros(batch.size)
+		for index in xrange(durations.shape[2]):
+			segments = []
+			if index % 3 == 0 and index > 2:
+				segments.append([durations[:, :, index-2], durations[:, :, index-1], durations[:, :, index]])
+			if index % 2 == 0 and index > 1:
+				segments.append([durations[:, :, index-1], durations[:, :, index]])
+			for segment in segments:
+				longest = np.where(mask[:, :, index], np.maximum.reduce(segment), 1.0)
+				deviation_from_ratios = sum([1.0-x*1.0/longest for x in segment])
+				matches = np.where(mask[:, :, index], 1.0/(1+0.01+deviation_from_ratios), 0.0)
+				metric_matches += matches.sum(axis=1)
+		return metric_matches/(batch.num_notes*2.0)
 
 class ChordDurationRepetitionCritic(Critic):
 	# Assumes fewer kinds of durations is better
-	def critique_song(self, song):
-		all_durations = {}
-		for verse in song.verse_seq:
-			for phrase in verse.sequence:
-				for chord in phrase.sequence:
-					for note in chord.note_seq:
-						if note in all_durations:
-							all_durations[note]+=1
-						else:
-							all_durations[note] = 1
-		return 1.0/len(all_durations)
-
-class RestRatioCritic(Critic):
+	def begin(self, song):
+		return {} # duration -> notes with it
+
+	def on_chord(self, state, chord, index, phrase):
+		critic_util.histogram((note.duration for note in chord.note_seq), state)
+
+	def finish(self, state, song):
+		return 1.0/len(state)
+
+	def critique_flat(self, flat):
+		return 1.0/len(set(flat.note_duration))
+
+	def critique_matrices(self, batch):
+		# Sorted, padding last, every real note that differs from the one
+		# before it starts a new kind of duration
+		durations = np.sort(np.where(batch.note_mask, batch.note_duration, np.inf), axis=1)
+		changes = (durations[:, 1:] != durations[:, :-1]) & batch.note_mask[:, 1:]
+		return 1.0/(1 + changes.sum(axis=1))
+
+class RestRatioCritic(AdditiveCritic):
 	# Assumes getting close to a ratio between notes and rests are better
 	def __init__(self, ratio=4.0):
 		self.ratio = ratio # non-rest to rest ratio
 
-	def critique_song(self, song):
+	def begin(self, song):
+		return [0.0, 0.0] # rest duration, note duration
+
+	def on_chord(self, state, chord, index, phrase):
+		for note in chord.note_seq:
+			if note.pitch == theory.REST:
+				state[0]+= note.duration
+			else:
+				state[1]+= note.duration
+
+	def finish(self, state, song):
+		return 1.0/(1.0+abs(self.ratio - (state[1]/(1.0+state[0]))))
+
+	def critique_flat(self, flat):
 		rest_duration = 0.0
 		note_duration = 0.0
-		for verse in song.verse_seq:
-			for phrase in verse.sequence:
-				for chord in phrase.sequence:
-					for note in chord.note_seq:
-						if note.pitch == music.REST:
-							rest_duration+= note.duration
-						else:
-							note_duration+= note.duration
+		for pitch, duration in zip(flat.note_pitch, flat.note_duration):
+			if pitch == theory.REST:
+				rest_duration+= duration
+			else:
+				note_duration+= duration
 		return 1.0/(1.0+abs(self.ratio - (note_duration/(1.0+rest_duration))))
 
+	def critique_matrices(self, batch):
+		rests = (batch.note_pitch == theory.REST) & batch.note_mask
+		notes = (batch.note_pitch != theory.REST) & batch.note_mask
+		rest_duration = np.where(rests, batch.note_duration, 0.0).sum(axis=1)
+		note_duration = np.where(notes, batch.note_duration, 0.0).sum(axis=1)
+		return 1.0/(1.0+np.abs(self.ratio - (note_duration/(1.0+rest_duration))))
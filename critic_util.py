@@ -1,19 +1,143 @@
+
 import math
-import music
+import theory
+
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+MAJOR_SCALE_PITCHES = [theory.C4+intv for intv in theory.MAJOR_SCALE]
+
+class RunningStats(object):
+	"""Count, mean, variance, min and max of a stream of numbers, updated in
+	one pass with Welford's algorithm (no sum of squares to lose precision)"""
+	def __init__(self, values=()):
+		self.count = 0
+		self.mean = 0.0
+		self.m2 = 0.0 # Sum of squared deviations from the mean
+		self.min = None
+		self.max = None
+		self.extend(values)
+
+	def add(self, x):
+		self.extend((x,))
+
+	@staticmethod
+	def update(count, mean, m2, values):
+		"""Returns the count, mean and sum of squared deviations after adding
+		values to those of earlier values; the one Welford loop, also used
+		directly by scoring loops that need no min and max"""
+		for x in values:
+			count += 1
+			delta = x - mean
+			mean += delta/count
+			m2 += delta*(x - mean)
+		return count, mean, m2
+
+	def extend(self, values):
+		values = list(values)
+		if not values:
+			return self
+		self.count, self.mean, self.m2 = RunningStats.update(self.count, self.mean, self.m2, values)
+		low = min(values)
+		high = max(values)
+		if self.min is None or low < self.min:
+			self.min = low
+		if self.max is None or high > self.max:
+			self.max = high
+		return self
+
+	def merge(self, other):
+		"""Adds the values summarized by another RunningStats"""
+		if other.count == 0:
+			return self
+		if self.count == 0:
+			self.count, self.mean, self.m2, self.min, self.max = other.count, other.mean, other.m2, other.min, other.max
+			return self
+		count = self.count + other.count
+		delta = other.mean - self.mean
+		self.mean += delta*other.count/count
+		self.m2 += other.m2 + delta*delta*self.count*other.count/count
+		self.count = count
+		self.min = min(self.min, other.min)
+		self.max = max(self.max, other.max)
+		return self
+
+	def variance(self):
+		"""Returns the population variance, 0.0 for no values"""
+		if self.count == 0:
+			return 0.0
+		return self.m2/self.count
+
+	def stdev(self):
+		return math.sqrt(self.variance())
 
-def average(s): 
-	return sum(s) * 1.0 / len(s)
+def moments(s):
+	"""Returns the count, mean and sum of squared deviations of s in one pass"""
+	return RunningStats.update(0, 0.0, 0.0, s)
 
-def variance(s): 
-	return map(lambda x: (x - average(s))**2, s)
+def average(s):
+	return moments(s)[1]
 
-def stdev(s): 
-	return math.sqrt(average(variance(s)))
+def variance(s):
+	count, mean, m2 = moments(s)
+	if count == 0:
+		return 0.0
+	return m2/count
+
+def stdev(s):
+	return math.sqrt(variance(s))
+
+def histogram(s, counts=None):
+	"""Returns a dict of how often each value occurs in s, added to counts if given"""
+	if counts is None:
+		counts = {}
+	for x in s:
+		counts[x] = counts.get(x, 0) + 1
+	return counts
+
+def batch_stats(sequences):
+	"""Returns a RunningStats for each sequence"""
+	return [RunningStats(s) for s in sequences]
+
+def segment_stats(values, bounds):
+	"""Returns a RunningStats for each segment values[bounds[i]:bounds[i+1]]
+	of a flat array (e.g. FlatSong.note_duration and its chord bounds)"""
+	return [RunningStats(values[bounds[i]:bounds[i+1]]) for i in xrange(len(bounds)-1)]
+
+def segment_stdevs(values, bounds):
+	"""Returns the standard deviation of each segment values[bounds[i]:bounds[i+1]]
+	of a flat array in one pass"""
+	update = RunningStats.update
+	stdevs = []
+	for i in xrange(len(bounds)-1):
+		count, mean, m2 = update(0, 0.0, 0.0, values[bounds[i]:bounds[i+1]])
+		if count == 0:
+			stdevs.append(0.0)
+		else:
+			stdevs.append(math.sqrt(m2/count))
+	return stdevs
+
+def masked_stdev(values, mask):
+	"""Returns the population standard deviation along the last axis of a
+	NumPy array, counting only the entries where mask is set (0.0 where none
+	are)"""
+	counts = np.maximum(mask.sum(axis=-1), 1)
+	means = np.where(mask, values, 0.0).sum(axis=-1)/counts
+	deviations = np.where(mask, values-means[..., None], 0.0)
+	return np.sqrt((deviations**2).sum(axis=-1)/counts)
 
 def is_major_chord(chord):
-		if not chord.scale == [music.C4+intv for intv in music.MAJOR_SCALE]:
+		return is_major_root(chord.scale, chord.root)
+
+def is_major_scale(scale):
+		return scale == MAJOR_SCALE_PITCHES
+
+def is_major_root(scale, root):
+		if not is_major_scale(scale):
 			return 0
 		else:
-			if chord.root == 0 or chord.root == 3 or chord.root == 4 or chord.root == 7:
+			if root == 0 or root == 3 or root == 4 or root == 7:
 				return 1
 			return 0
@@ -0,0 +1,374 @@
+"""Long-running evolution service.
+
+Every evolution.py run pays for starting the JVM, Jython and the music
+library, which dominates short runs. The daemon pays for that once and then
+runs jobs sent by clients over a local socket, several at a time:
+
+	sh jython.sh ../daemon.py --serve --workers 4
+	sh jython.sh ../daemon.py gen0_filename genx_filename critic1,critic2 num_gens --size 100
+
+A job holds the settings of one evolution.py run. The best songs of its first
+and last generation are written to the results directory, as with
+evolution.py, and the client waits for the job and prints its best fitness
+unless given --no-wait. `daemon.py --stop` shuts the daemon down once the
+running jobs are done.
+
+--address is host:port for TCP (default 127.0.0.1:7700) or, where the
+platform has them, a file path for a Unix socket. Requests and replies are
+length-prefixed JSON, so a client can submit jobs but never make the daemon
+run code of its own. Jobs run on a pool of processes (--pool process, the
+default under CPython) or of threads (--pool thread, the default under
+Jython, where threads run in parallel since it has no GIL). Jobs on threads
+share the random module, so a job's seed only reproduces its run with
+--workers 1 or the process pool. Output names are plain file names
+inside --results; the daemon refuses paths.
+"""
+
+import evolution
+import executors
+import islands
+import optparse
+import os
+import socket
+import sys
+import threading
+import time
+import Queue
+from json_util import to_json, from_json
+from midi_backends import MIDI_BACKENDS, MIDI_BACKEND
+
+ADDRESS = "127.0.0.1:7700"
+RESULTS_DIR = "../results"
+POOLS = ["thread", "process"]
+try:
+	import multiprocessing
+	DEFAULT_POOL = "process" # seedable, unlike threads
+except ImportError:
+	DEFAULT_POOL = "thread" # Jython
+ACCEPT_TIMEOUT = 0.5 # seconds between checks for a stop request
+MAX_MESSAGE = 1 << 20 # bytes
+
+
+def check_output_name(name):
+	"""Raises ValueError unless name is a plain file name, so a job can only
+	write inside the results directory"""
+	if not isinstance(name, basestring) or not name:
+		raise ValueError("Output names must be non-empty strings, got "+repr(name))
+	separators = [sep for sep in [os.sep, os.altsep] if sep]
+	if os.path.isabs(name) or ".." in name or [sep for sep in separators if sep in name]:
+		raise ValueError('Output name "'+name+'" is not a plain file name')
+
+
+def run_job(job, results_dir):
+	"""Runs one evolution job and writes its MIDI files; returns a summary dict"""
+	start = time.time()
+	evo = islands.build_evolution(job)
+	first_best_song = evo.get_current_best_song()
+	for _ in xrange(job["generations"]):
+		evo.next_generation()
+	last_best_song = evo.get_current_best_song()
+	outputs = []
+	for name, best_song in [(job["first_output"], first_best_song), (job["output"], last_best_song)]:
+		path = os.path.join(results_dir, name+".mid")
+		best_song.write_to_midi(path, job.get("midi_backend"))
+		outputs.append(path)
+	return {"first_fitness": evo.get_fitness(first_best_song),
+			"best_fitness": evo.get_fitness(last_best_song),
+			"seconds": time.time()-start,
+			"outputs": outputs}
+
+
+def warm_up():
+	"""Imports the music library up front when MIDI is written through jMusic,
+	so the first job does not pay for it"""
+	if MIDI_BACKEND == "jmusic":
+		import music
+
+
+def run_safely(fn, args):
+	"""Returns (True, fn(*args)), or (False, error) so failures reach the client"""
+	try:
+		return (True, fn(*args))
+	except Exception, e:
+		return (False, repr(e))
+
+
+class ThreadJobPool(object):
+	def __init__(self, workers):
+		self.tasks = Queue.Queue()
+		self.threads = []
+		for _ in xrange(workers):
+			thread = threading.Thread(target=self._work)
+			thread.setDaemon(True)
+			thread.start()
+			self.threads.append(thread)
+
+	def _work(self):
+		while True:
+			task = self.tasks.get()
+			if task is None:
+				return
+			fn, args, callback = task
+			callback(run_safely(fn, args))
+
+	def run(self, fn, args, callback):
+		"""Queues fn(*args) and calls callback with its run_safely reply"""
+		self.tasks.put((fn, args, callback))
+
+	def shutdown(self):
+		"""Waits for the queued jobs, then stops the workers"""
+		for _ in self.threads:
+			self.tasks.put(None)
+		for thread in self.threads:
+			thread.join()
+		self.threads = []
+
+
+class ProcessJobPool(object):
+	def __init__(self, workers):
+		try:
+			import multiprocessing
+		except ImportError:
+			raise ValueError("The process pool requires CPython's multiprocessing module")
+		self.pool = multiprocessing.Pool(workers)
+
+	def run(self, fn, args, callback):
+		self.pool.apply_async(run_safely, (fn, args), callback=callback)
+
+	def shutdown(self):
+		self.pool.close()
+		self.pool.join()
+
+
+def make_job_pool(name=DEFAULT_POOL, workers=None):
+	"""Returns a job pool from its short name (see POOLS)"""
+	if workers is None:
+		workers = executors.cpu_count()
+	if name == "thread":
+		return ThreadJobPool(workers)
+	if name == "process":
+		return ProcessJobPool(workers)
+	raise ValueError('Unknown job pool "'+str(name)+'"')
+
+
+def listen(address):
+	"""Returns a listening socket for "host:port" or a Unix socket path"""
+	if ":" in address:
+		host, port = address.rsplit(":", 1)
+		server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		server.bind((host, int(port)))
+	else:
+		server = unix_socket()
+		if os.path.exists(address):
+			os.remove(address)
+		server.bind(address)
+	server.listen(5)
+	return server
+
+
+def connect(address):
+	"""Returns a JsonChannel to a daemon at "host:port" or a Unix socket path"""
+	if ":" in address:
+		host, port = address.rsplit(":", 1)
+		sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		sock.connect((host, int(port)))
+	else:
+		sock = unix_socket()
+		sock.connect(address)
+	return JsonChannel(sock)
+
+
+def unix_socket():
+	if not hasattr(socket, "AF_UNIX"):
+		raise ValueError("Unix sockets are not available here, use a host:port address")
+	return socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+
+class JsonChannel(islands.SocketChannel):
+	"""Sends length-prefixed JSON over a connected socket. Jobs and replies
+	are plain dicts, lists, strings and numbers, and unlike a pickle a JSON
+	message cannot run code on the receiving end."""
+	def send(self, obj):
+		data = to_json(obj)
+		if isinstance(data, unicode):
+			data = data.encode("utf-8")
+		self.send_bytes(data)
+
+	def recv(self):
+		return from_json(self.recv_bytes(MAX_MESSAGE))
+
+
+class EvolutionDaemon(object):
+	def __init__(self, pool, results_dir=RESULTS_DIR):
+		self.pool = pool
+		self.results_dir = results_dir
+		self.jobs = [] # status dict per job id
+		self.changed = threading.Condition() # guards jobs, notified when a job finishes
+		self.stopping = False
+
+	def submit(self, job):
+		"""Queues a job; returns its id"""
+		check_output_name(job["first_output"])
+		check_output_name(job["output"])
+		self.changed.acquire()
+		try:
+			job_id = len(self.jobs)
+			self.jobs.append({"id": job_id, "state": "queued", "output": job["output"]})
+		finally:
+			self.changed.release()
+		self.pool.run(run_job, (job, self.results_dir), lambda reply: self.finish(job_id, reply))
+		return job_id
+
+	def finish(self, job_id, reply):
+		ok, value = reply
+		self.changed.acquire()
+		try:
+			status = self.jobs[job_id]
+			if ok:
+				status["state"] = "done"
+				status.update(value)
+			else:
+				status["state"] = "failed"
+				status["error"] = value
+			self.changed.notifyAll()
+		finally:
+			self.changed.release()
+		print "Job", job_id, status["state"]
+
+	def status(self, job_id):
+		self.changed.acquire()
+		try:
+			return dict(self.jobs[job_id])
+		finally:
+			self.changed.release()
+
+	def wait(self, job_id):
+		"""Returns the status of a job once it is done or failed"""
+		self.changed.acquire()
+		try:
+			while self.jobs[job_id]["state"] == "queued":
+				self.changed.wait()
+			return dict(self.jobs[job_id])
+		finally:
+			self.changed.release()
+
+	def handle(self, command, arg):
+		if command == "submit":
+			return self.submit(arg)
+		if command == "status":
+			return self.status(arg)
+		if command == "wait":
+			return self.wait(arg)
+		if command == "stop":
+			self.stopping = True
+			return None
+		raise ValueError('Unknown daemon command "'+str(command)+'"')
+
+	def converse(self, channel):
+		"""Answers one client's requests until it disconnects or sends
+		something that is not a request"""
+		try:
+			while True:
+				command, arg = channel.recv()
+				channel.send(run_safely(self.handle, (command, arg)))
+		except EOFError:
+			pass
+		except (ValueError, TypeError, islands.AuthenticationError), e: # not JSON, or too long
+			print "Dropped a client:", e
+		channel.close()
+
+	def serve(self, address=ADDRESS):
+		"""Accepts clients until a stop request, then waits for the queued jobs"""
+		server = listen(address)
+		server.settimeout(ACCEPT_TIMEOUT)
+		print "Serving evolution jobs on", address
+		while not self.stopping:
+			try:
+				conn, _ = server.accept()
+			except socket.timeout:
+				continue
+			conn.settimeout(None)
+			thread = threading.Thread(target=self.converse, args=(JsonChannel(conn),))
+			thread.setDaemon(True)
+			thread.start()
+		server.close()
+		if ":" not in address:
+			os.remove(address)
+		print "Stopping after the queued jobs"
+		self.pool.shutdown()
+
+
+def request(channel, command, arg=None):
+	"""Sends a request to the daemon and returns its reply"""
+	channel.send((command, arg))
+	ok, value = channel.recv()
+	if not ok:
+		raise RuntimeError("Daemon failed on "+command+": "+value)
+	return value
+
+
+def main():
+	parser = optparse.OptionParser(usage="%prog gen0_filename genx_filename critic1,critic2 num_gens\n"
+										 "       %prog --serve\n       %prog --stop")
+	parser.add_option("--address", default=ADDRESS,
+					  help="host:port or Unix socket path of the daemon [default: %default]")
+	parser.add_option("--serve", action="store_true", default=False, help="run the daemon")
+	parser.add_option("--workers", type="int", default=None,
+					  help="jobs run at once by the daemon [default: one per core]")
+	parser.add_option("--pool", choices=POOLS, default=DEFAULT_POOL,
+					  help=", ".join(POOLS)+" [default: %default]")
+	parser.add_option("--results", default=RESULTS_DIR,
+					  help="directory the daemon writes MIDI files to [default: %default]")
+	parser.add_option("--stop", action="store_true", default=False,
+					  help="stop the daemon once its queued jobs are done")
+	parser.add_option("--size", type="int", default=100, help="population size [default: %default]")
+	parser.add_option("--selection", choices=evolution.SELECTIONS, default="truncation")
+	parser.add_option("--genome", choices=evolution.GENOMES, default="tree")
+	parser.add_option("--seed", type="int", default=0)
+	parser.add_option("--midi-backend", choices=MIDI_BACKENDS, default=None,
+					  help="MIDI backend the daemon writes the job with [default: "+MIDI_BACKEND+" under the daemon]")
+	parser.add_option("--no-wait", dest="wait", action="store_false", default=True,
+					  help="print the job id and return without waiting for the job")
+	options, args = parser.parse_args()
+
+	if options.serve:
+		warm_up()
+		daemon = EvolutionDaemon(make_job_pool(options.pool, options.workers), options.results)
+		daemon.serve(options.address)
+		sys.exit(0)
+	if not options.stop:
+		if len(args) != 4:
+			parser.error("expected 4 arguments, got "+str(len(args)))
+		evolution.check_critics(parser, args[2]) # fail here rather than in the daemon
+	channel = connect(options.address)
+	if options.stop:
+		request(channel, "stop")
+		channel.close()
+		sys.exit(0)
+
+	job = {"first_output": args[0],
+		   "output": args[1],
+		   "critics": args[2],
+		   "generations": int(args[3]),
+		   "size": options.size,
+		   "seed": options.seed,
+		   "selection": options.selection,
+		   "genome": options.genome,
+		   "midi_backend": options.midi_backend}
+	job_id = request(channel, "submit", job)
+	print "Submitted job", job_id
+	if options.wait:
+		status = request(channel, "wait", job_id)
+		if status["state"] == "failed":
+			print "Job", job_id, "failed:", status["error"]
+			channel.close()
+			sys.exit(1)
+		print "Best fitness: ", status["best_fitness"], "after", round(status["seconds"], 1), "seconds"
+		for path in status["outputs"]:
+			print "Written to", path
+	channel.close()
+
+
+if __name__ == '__main__':
+	evolution.run_cli(main)
@@ -1,25 +1,74 @@
 from random_song import RandomSong as rs
+from flat_song import FlatSong
+from persistent_song import PersistentSong
+from midi_backends import MIDI_BACKENDS, MIDI_BACKEND
+from population_batch import PopulationBatch
+import population_batch
+from fitness_cache import FitnessCache
+from executors import SerialExecutor, make_executor, EXECUTORS
+from selection import TruncationSelection, TournamentSelection, make_selection, SELECTIONS
+import checkpoint
+import telemetry
+import convergence
+import smf
+import time
+import heapq
 import critic
 import random
-import music
+import theory
 import critic_util
+import os
 import sys
+import traceback
+import optparse
 
 ROOT = 0
-SCALE = [music.C4+intv for intv in music.MAJOR_SCALE]
-LEGAL_PITCHES = SCALE+[music.REST, music.C5]
+SCALE = [theory.C4+intv for intv in theory.MAJOR_SCALE]
+LEGAL_PITCHES = SCALE+[theory.REST, theory.C5]
 SURVIVAL_RATE = 0.5
 SURVIVAL_NOISE = 0.0
 CROSSOVER_RATE = 1.0
+RESTART_KEEP_RATE = 0.1
+GENOMES = ["tree", "flat", "persistent"]
+DEDUP_POLICIES = ["report", "random", "mutate"]
+DEDUP_MUTATIONS = 10 # most mutations tried to make a duplicate unique
+REPLACEMENTS = ["generational", "steady"]
+STEADY_OFFSPRING = 2 # children bred per steady-state step
+STAGES = ["scoring", "selection", "mutation", "mingle", "dedup", "replacement"]
+# Short critic name: (class in critic.py, constructor arguments). Classes are
+# looked up by name because critic.py imports this module.
+CRITICS = {"Tempo": ("TempoCritic", ()),
+		   "Length": ("LengthCritic", ()),
+		   "ChordCount": ("ChordCountCritic", ()),
+		   "AscendingMelody": ("AscendingMelodyCritic", ()),
+		   "DescendingMelody": ("DescendingMelodyCritic", ()),
+		   "Rhythm": ("RhythmCritic", ()),
+		   "Major": ("MajorCritic", ()),
+		   "Minor": ("MinorCritic", ()),
+		   "ChordProgression": ("ChordProgressionCritic", ([0,3,4],)),
+		   "FollowingEm": ("FollowingEmCritic", ()),
+		   "MeterDuration": ("MeterDurationCritic", ()),
+		   "ChordDurationRepetition": ("ChordDurationRepetitionCritic", ()),
+		   "RestRatio": ("RestRatioCritic", ())}
+CRITIC_NAMES = sorted(CRITICS)
 
 class Evolution(object):
+	replacement = "generational" # for evolutions pickled before steady-state replacement
+	steady_offspring = STEADY_OFFSPRING
+
 	def __init__(self,
 				 size,
 				 root=ROOT,
 				 scale=SCALE,
 				 legal_pitches=LEGAL_PITCHES,
 				 survival_rate=SURVIVAL_RATE, 
-				 survival_noise=SURVIVAL_NOISE):
+				 survival_noise=SURVIVAL_NOISE,
+				 executor=None,
+				 selection=None,
+				 genome="tree",
+				 dedup="report",
+				 replacement="generational",
+				 steady_offspring=STEADY_OFFSPRING):
 		self.size = size
 		self.generation = 0
 		self.root = root
@@ -27,32 +76,179 @@ class Evolution(object):
 		self.legal_pitches = legal_pitches
 		self.survival_rate = survival_rate
 		self.survival_noise = survival_noise
+		self.genome = genome # "tree" for song.Song, "flat" for flat_song.FlatSong,
+							 # "persistent" for persistent_song.PersistentSong
+		self.dedup = dedup # what to do with duplicate children, see deduplicate
+		self.duplicate_rate = 0.0 # share of duplicates among the last children
+		self.replacement = replacement # "generational" or "steady", see next_generation
+		self.steady_offspring = steady_offspring
+		self.fitness_cache = FitnessCache()
+		if executor is None:
+			executor = SerialExecutor()
+		self.executor = executor
+		if selection is None:
+			selection = TruncationSelection()
+		self.selection = selection
+		self.hooks = [] # instrumentation called around each stage, see add_hook
 		self.population = self.birth()
 
 	def birth(self):
 		"""Returns set of random Songs of size specified on initialization"""
-		return [rs.random_song(self.root, self.legal_pitches, self.scale) for x in xrange(self.size)]
+		return self.new_songs(self.size)
+
+	def new_songs(self, num_songs):
+		"""Returns num_songs random songs in the genome representation"""
+		songs = [self.random_song() for x in xrange(num_songs)]
+		if self.genome == "flat":
+			songs = [FlatSong.from_song(s) for s in songs]
+		elif self.genome == "persistent":
+			songs = [PersistentSong.from_song(s) for s in songs]
+		return songs
+
+	def random_song(self):
+		"""Returns a new random song.Song"""
+		return rs.random_song(self.root, self.legal_pitches, self.scale)
+
+	def new_unique_songs(self, num_songs, seen, present=()):
+		"""Returns num_songs new random songs, each made unique with
+		make_unique. New random songs all start out the same, so without the
+		mutations they would only duplicate each other."""
+		songs = self.new_songs(num_songs)
+		for s in songs:
+			self.make_unique(s, seen, present)
+		return songs
+
+	def make_unique(self, song, seen, present=()):
+		"""Mutates song until its fingerprint is in neither seen nor present
+		(up to DEDUP_MUTATIONS times), then adds the fingerprint to seen"""
+		key = song.fingerprint()
+		tries = 0
+		while (key in seen or key in present) and tries < DEDUP_MUTATIONS:
+			song.recursive_mutate()
+			key = song.fingerprint()
+			tries += 1
+		seen.add(key)
+
+	def restart(self, keep_rate=RESTART_KEEP_RATE):
+		"""Restores diversity by keeping the fittest keep_rate of the population
+		and replacing every other song with a new, unique random song"""
+		fitnesses = self.evaluate_population(self.population)
+		num_keep = max(1, int(len(self.population)*keep_rate))
+		ranked = sorted(xrange(len(self.population)), key=lambda i:fitnesses[i], reverse=True)
+		kept = [self.population[i] for i in ranked[:num_keep]]
+		seen = set([s.fingerprint() for s in kept])
+		self.population = kept + self.new_unique_songs(self.size-len(kept), seen)
 
 	def get_parents(self):
-		"""Calls fitness functions and sorts to return the most fit parents by surival rate"""
-		pop_data = []
-		for s in self.population:
-			fitness = self.get_fitness(s)
-			pop_data.append((s, fitness))
-		sorted(pop_data, key=lambda x:x[1], reverse=True)
-		survived = pop_data[:int(len(pop_data)*self.survival_rate)]
+		"""Calls fitness functions and selects the most fit parents by survival rate.
+		A song selected more than once is copied so each parent mutates independently."""
+		fitnesses = self.run_stage("scoring", self.evaluate_population, self.population)
+		num_elite = int(len(self.population)*self.survival_rate)
+		num_extra = 0
 		if self.survival_noise > 0.0:
-			to_choose = pop_data[int(len(pop_data)*self.survival_rate):]
-			spots_left = (int) (len(to_choose)*self.survival_noise)
-			survived += random.sample(to_choose, spots_left)
-		return [x[0] for x in survived]
+			num_extra = int((len(self.population)-num_elite)*self.survival_noise)
+		survived = self.run_stage("selection", self.selection.select, self.population, fitnesses, num_elite, num_extra)
+		parents = []
+		seen = set()
+		for s in survived:
+			if id(s) in seen:
+				s = s.copy()
+			seen.add(id(s))
+			parents.append(s)
+		return parents
 
 	def next_generation(self):
-		"""Calls mingle to create next generation"""
-		parents = self.get_parents()
-		[p.recursive_mutate() for p in parents]
-		self.population = self.mingle(parents, self.size)
+		"""Calls mingle to create next generation, or with steady-state
+		replacement breeds as many children into the population in place"""
+		if self.replacement == "steady":
+			self.steady_state_generation()
+		else:
+			parents = self.get_parents()
+			self.run_stage("mutation", self.mutate, parents)
+			self.run_stage("scoring", self.evaluate_population, parents) # warm the cache for crossover
+			self.population = self.run_stage("mingle", self.mingle, parents, self.size)
+			self.population = self.run_stage("dedup", self.deduplicate, self.population)
 		self.generation +=1
+		for hook in self.hooks:
+			hook.generation_done(self)
+		self.fitness_cache.advance()
+
+	def add_hook(self, hook):
+		"""Registers an object with before(evolution, stage), after(evolution,
+		stage, result) and generation_done(evolution) methods. Stages are those
+		in STAGES; result is the stage's return value (the fitnesses for
+		scoring, the survivors for selection, the children for mingle)."""
+		self.hooks.append(hook)
+
+	def run_stage(self, stage, fn, *args):
+		"""Returns fn(*args), calling the hooks around it. Without hooks this
+		is a plain call."""
+		if not self.hooks:
+			return fn(*args)
+		for hook in self.hooks:
+			hook.before(self, stage)
+		result = fn(*args)
+		for hook in self.hooks:
+			hook.after(self, stage, result)
+		return result
+
+	def steady_state_generation(self):
+		"""Breeds self.size children steady_offspring at a time. Each child is
+		crossed over from two parents drawn by tournament from the current
+		population (whatever self.selection is), mutated, scored and put in
+		place of the least fit song, found on a min-heap of (fitness, slot) in
+		O(log n). The population is never rebuilt, and songs only leave it by
+		being replaced."""
+		fitnesses = self.run_stage("scoring", self.evaluate_population, self.population)
+		heap = [(f, slot) for slot, f in enumerate(fitnesses)]
+		heapq.heapify(heap)
+		keys = [s.fingerprint() for s in self.population]
+		present = {} # fingerprint -> songs with it in the population
+		for key in keys:
+			present[key] = present.get(key, 0) + 1
+		selection = self.selection
+		if not isinstance(selection, TournamentSelection):
+			# Truncation would draw the same best songs every step, and rank and
+			# roulette sort or sum the whole population for every pair of parents
+			selection = TournamentSelection()
+		births = 0
+		duplicates = 0.0
+		while births < self.size:
+			num_children = min(self.steady_offspring, self.size-births)
+			parents = self.run_stage("selection", selection.select, self.population, fitnesses, 2*num_children, 0)
+			children = self.run_stage("mingle", self.breed, parents)
+			self.run_stage("mutation", self.mutate, children)
+			children = self.run_stage("dedup", self.deduplicate, children, present)
+			duplicates += self.duplicate_rate*len(children)
+			child_fitnesses = self.run_stage("scoring", self.evaluate_population, children)
+			self.run_stage("replacement", self.replace_worst, heap, fitnesses, keys, present,
+						   children, child_fitnesses)
+			births += num_children
+		self.duplicate_rate = duplicates/max(births, 1)
+
+	def breed(self, parents):
+		"""Returns one crossover child for each pair of parents; the parents are not changed"""
+		return [self.crossover(parents[i], parents[i+1]) for i in xrange(0, len(parents)-1, 2)]
+
+	def replace_worst(self, heap, fitnesses, keys, present, children, child_fitnesses):
+		"""Puts each child in place of the least fit song of the population,
+		keeping the heap, fitnesses, keys and present counts up to date"""
+		for child, fitness in zip(children, child_fitnesses):
+			slot = heap[0][1]
+			old_key = keys[slot]
+			present[old_key] -= 1
+			if present[old_key] == 0:
+				del present[old_key]
+			key = child.fingerprint()
+			present[key] = present.get(key, 0) + 1
+			keys[slot] = key
+			self.population[slot] = child
+			fitnesses[slot] = fitness
+			heapq.heapreplace(heap, (fitness, slot))
+
+	def mutate(self, parents):
+		"""Mutates each parent in place"""
+		[p.recursive_mutate() for p in parents]
 
 	def mingle(self, mutated_parents, num_offspring):
 		"""Returns the new population from the mutated parents"""
@@ -70,14 +266,34 @@ class Evolution(object):
 
 		return children
 
+	def deduplicate(self, songs, present=()):
+		"""Returns songs with their duplicates handled according to self.dedup:
+		"report" keeps them, "random" replaces each song identical to an earlier
+		one (or to a fingerprint in present) with a new random song, and
+		"mutate" mutates it; either way the song is then made unique with
+		make_unique. The share of duplicates before replacement is kept in
+		self.duplicate_rate."""
+		seen = set()
+		duplicates = []
+		for idx, s in enumerate(songs):
+			key = s.fingerprint()
+			if key in seen or key in present:
+				duplicates.append(idx)
+			else:
+				seen.add(key)
+		self.duplicate_rate = len(duplicates)/float(max(len(songs), 1))
+		if self.dedup == "random":
+			for idx, s in zip(duplicates, self.new_unique_songs(len(duplicates), seen, present)):
+				songs[idx] = s
+		elif self.dedup == "mutate":
+			for idx in duplicates:
+				self.make_unique(songs[idx], seen, present)
+		return songs
+
 	def get_current_best_song(self):
 		"""Returns the most fit song using current fitness function"""
-		pop_data = []
-		for s in self.population:
-			fitness = self.get_fitness(s)
-			pop_data.append((s, fitness))
-		sorted(pop_data, key=lambda x:x[1], reverse=True)
-		return pop_data[0][0]
+		pop_data = zip(self.population, self.evaluate_population(self.population))
+		return max(pop_data, key=lambda x:x[1])[0]
 
 	def crossover(self, parent_one, parent_two):
 		"""Simple crossover in which the more fit parent is chosen"""
@@ -86,11 +302,38 @@ class Evolution(object):
 		return parent_two.copy()
 
 	def get_fitness(self, song):
+		"""Returns the fitness of song, computing it only once per distinct genome"""
+		return self.fitness_cache.lookup(song, self.compute_fitness)
+
+	def evaluate_population(self, songs):
+		"""Returns the fitness of each song, scoring every uncached genome once on the executor"""
+		keys = [s.fingerprint() for s in songs]
+		pending = {}
+		for key, song in zip(keys, songs):
+			if key not in pending and key not in self.fitness_cache:
+				pending[key] = song
+		if pending:
+			pending_keys = pending.keys()
+			fitnesses = self.score_songs([pending[k] for k in pending_keys])
+			for key, fitness in zip(pending_keys, fitnesses):
+				self.fitness_cache.store(key, fitness)
+		self.fitness_cache.record_hits(len(keys) - len(pending))
+		return [self.fitness_cache.fetch(key) for key in keys]
+
+	def score_songs(self, songs):
+		"""Returns the fitness of each song without consulting the cache"""
+		return self.executor.map(self.fitness_function(), songs)
+
+	def fitness_function(self):
+		"""Returns the callable the executor uses to score a single song"""
+		return self.compute_fitness
+
+	def compute_fitness(self, song):
 		raise UnimplementedError
 
 class ConstantEvolution(Evolution):
 
-	def get_fitness(self, song):
+	def compute_fitness(self, song):
 		"""Only selects for Songs that are fast in order to test alg correctness"""
 		return song.tempo
 
@@ -102,16 +345,41 @@ class CriticEvolution(Evolution):
 				 scale=SCALE,
 				 legal_pitches=LEGAL_PITCHES,
 				 survival_rate=SURVIVAL_RATE,
-				 survival_noise=SURVIVAL_NOISE):
+				 survival_noise=SURVIVAL_NOISE,
+				 executor=None,
+				 selection=None,
+				 genome="tree",
+				 batch=None,
+				 dedup="report",
+				 replacement="generational",
+				 steady_offspring=STEADY_OFFSPRING):
 
 		self.critics = critics
-		super(CriticEvolution, self).__init__(size, root, scale, legal_pitches, survival_rate)
+		self.scorer = critic.CriticScorer(critics)
+		self.batch = self.use_batch(batch)
+		super(CriticEvolution, self).__init__(size, root, scale, legal_pitches, survival_rate, survival_noise,
+											  executor=executor, selection=selection, genome=genome, dedup=dedup,
+											  replacement=replacement, steady_offspring=steady_offspring)
 
-	def get_fitness(self, song):
-		fitnesses = []
-		for critic in self.critics:
-			fitnesses.append(critic.critique_song(song))
-		return sum(fitnesses)
+	def use_batch(self, batch):
+		"""Resolves the batch setting: None uses whole-population scoring when
+		NumPy is available and every critic supports it"""
+		if batch is None:
+			return population_batch.np is not None and critic.supports_batch(self.critics)
+		if batch and not critic.supports_batch(self.critics):
+			raise ValueError("Not every critic supports batch evaluation")
+		return batch
+
+	def score_songs(self, songs):
+		if self.batch:
+			return self.scorer.critique_population(PopulationBatch(songs))
+		return super(CriticEvolution, self).score_songs(songs)
+
+	def fitness_function(self):
+		return self.scorer
+
+	def compute_fitness(self, song):
+		return self.scorer(song)
 
 class CriticCrossoverEvolution(CriticEvolution):
 	def __init__(self,
@@ -122,47 +390,169 @@ class CriticCrossoverEvolution(CriticEvolution):
 				 legal_pitches=LEGAL_PITCHES,
 				 survival_rate=SURVIVAL_RATE,
 				 survival_noise=SURVIVAL_NOISE,
-				 crossover_rate=CROSSOVER_RATE):
+				 crossover_rate=CROSSOVER_RATE,
+				 executor=None,
+				 selection=None,
+				 genome="tree",
+				 batch=None,
+				 dedup="report",
+				 replacement="generational",
+				 steady_offspring=STEADY_OFFSPRING):
 
 		self.crossover_rate = crossover_rate
 		self.critics = critics
-		super(CriticEvolution, self).__init__(size, root, scale, legal_pitches, survival_rate)
+		self.scorer = critic.CriticScorer(critics)
+		self.batch = self.use_batch(batch)
+		super(CriticEvolution, self).__init__(size, root, scale, legal_pitches, survival_rate, survival_noise,
+											  executor=executor, selection=selection, genome=genome, dedup=dedup,
+											  replacement=replacement, steady_offspring=steady_offspring)
 
 	def crossover(self, parent_one, parent_two):
 		"""Simulates random crossover between parents over one and two points of crossover"""
 		prob = random.random() 
 		if prob > self.crossover_rate:
-			max_crossing_pt = min(len(parent_one.verse_seq), len(parent_two.verse_seq))
+			max_crossing_pt = min(parent_one.num_verses(), parent_two.num_verses())
 			pivot = random.randint(0, max_crossing_pt)
-			new_parent = parent_two.copy()
-			new_parent.verse_seq = parent_two.verse_seq[:pivot] + parent_one.verse_seq[pivot:]
-			return new_parent
+			return parent_two.spliced([(parent_two, 0, pivot), (parent_one, pivot, None)])
 		elif prob > self.crossover_rate*2:
 			better_parent = parent_two
 			other_parent = parent_one
 			if self.get_fitness(parent_one) > self.get_fitness(parent_two):
 				better_parent = parent_one
 				other_parent = parent_two
-			cross_pts = sorted(random.sample(xrange(len(other_parent.verse_seq)), 2))
-			insert_pts = sorted(random.sample(xrange(len(better_parent.verse_seq)), 2))
-			new_parent = better_parent.copy()
-			new_parent.verse_seq = better_parent.verse_seq[insert_pts[0]:] + other_parent.verse_seq[insert_pts[0]:insert_pts[1]] + better_parent.verse_seq[insert_pts[1]:]
-			return new_parent
+			cross_pts = sorted(random.sample(xrange(other_parent.num_verses()), 2))
+			insert_pts = sorted(random.sample(xrange(better_parent.num_verses()), 2))
+			return better_parent.spliced([(better_parent, insert_pts[0], None),
+										  (other_parent, insert_pts[0], insert_pts[1]),
+										  (better_parent, insert_pts[1], None)])
 		else:
 			return super(CriticCrossoverEvolution, self).crossover(parent_one, parent_two)			
 
 def parse_critics(critics_str):
-	critics_dict = {"Tempo": critic.TempoCritic(), "Length":critic.LengthCritic(), "ChordCount":critic.ChordCountCritic(), "AscendingMelody":critic.AscendingMelodyCritic(),"DescendingMelody": critic.DescendingMelodyCritic(), "Rhythm": critic.RhythmCritic(), "Major": critic.MajorCritic(), "Minor": critic.MinorCritic(), "ChordProgression": critic.ChordProgressionCritic([0,3,4]), "FollowingEm": critic.FollowingEmCritic(), "MeterDuration": critic.MeterDurationCritic(), "ChordDurationRepetition": critic.ChordDurationRepetitionCritic(), "RestRatio": critic.RestRatioCritic()}
+	"""Returns critic instances from a comma separated string (or list) of short names"""
+	if isinstance(critics_str, basestring):
+		critics_str = critics_str.split(",")
 	critics = []
-	for one_critic in input_critics:
-		critics.append(critics_dict[one_critic])
+	for one_critic in critics_str:
+		if one_critic not in CRITICS:
+			raise ValueError('Unknown critic "'+str(one_critic)+'"')
+		class_name, args = CRITICS[one_critic]
+		critics.append(getattr(critic, class_name)(*args))
 	return critics
 
-if __name__ == '__main__':
-	print "\n\nWriting initial MIDI to: ", sys.argv[1]
-	print "\nWriting final MIDI to: ", sys.argv[2]
+def unknown_critics(critics_str):
+	"""Returns the names in a comma separated string (or list) of critics that
+	are not in CRITICS, for command lines to reject"""
+	if isinstance(critics_str, basestring):
+		critics_str = critics_str.split(",")
+	return [name for name in critics_str if name not in CRITICS]
+
+def check_critics(parser, critics_str):
+	"""Exits through parser.error (status 2) if critics_str names an unknown critic"""
+	unknown = unknown_critics(critics_str)
+	if unknown:
+		parser.error("unknown critics: "+", ".join(unknown)+" (choose from "+", ".join(CRITIC_NAMES)+")")
 
-	input_critics = sys.argv[3].split(",")
+
+def shutdown_and_exit(status=0):
+	"""Stops everything the music library started, if it was imported, and
+	exits with status right away, even if library threads are still alive"""
+	music = sys.modules.get("music")
+	if music is not None and hasattr(music, "shutdown"):
+		music.shutdown()
+	sys.stdout.flush()
+	sys.stderr.flush()
+	try:
+		from java.lang import System
+	except ImportError:
+		sys.exit(status)
+	System.exit(status)
+
+
+def run_cli(main):
+	"""Runs a command line script's main() and exits through shutdown_and_exit
+	with status 0, the status main passed to sys.exit, or 1 after printing an
+	uncaught error"""
+	try:
+		status = main()
+	except SystemExit, e:
+		status = e.code
+	except:
+		traceback.print_exc()
+		status = 1
+	if isinstance(status, basestring):
+		print >> sys.stderr, status
+		status = 1
+	shutdown_and_exit(status or 0)
+
+
+def main():
+	parser = optparse.OptionParser(usage="%prog gen0_filename genx_filename critic1,critic2 num_gens")
+	parser.add_option("--executor", choices=EXECUTORS, default="serial",
+					  help="how to score the population: "+", ".join(EXECUTORS)+" [default: %default]")
+	parser.add_option("--workers", type="int", default=None,
+					  help="number of threads or processes for the executor [default: one per core]")
+	parser.add_option("--selection", choices=SELECTIONS, default="truncation",
+					  help="parent selection strategy: "+", ".join(SELECTIONS)+" [default: %default]")
+	parser.add_option("--tournament-size", type="int", default=3,
+					  help="songs per tournament for tournament selection [default: %default]")
+	parser.add_option("--survival-rate", type="float", default=SURVIVAL_RATE,
+					  help="fraction of the population kept as parents [default: %default]")
+	parser.add_option("--survival-noise", type="float", default=SURVIVAL_NOISE,
+					  help="fraction of the remaining songs also kept as parents [default: %default]")
+	parser.add_option("--genome", choices=GENOMES, default="tree",
+					  help="song representation: tree (song.Song), flat (flat_song.FlatSong) or "
+						   "persistent (persistent_song.PersistentSong) [default: %default]")
+	parser.add_option("--dedup", choices=DEDUP_POLICIES, default="report",
+					  help="what to do with children identical to another child: report them, replace them "
+						   "with random songs, or mutate them until unique [default: %default]")
+	parser.add_option("--replacement", choices=REPLACEMENTS, default="generational",
+					  help="generational rebuilds the population every generation; steady breeds a few "
+						   "children at a time into the place of the least fit songs [default: %default]")
+	parser.add_option("--steady-offspring", type="int", default=STEADY_OFFSPRING,
+					  help="children bred per step with steady-state replacement [default: %default]")
+	parser.add_option("--batch", choices=["auto", "on", "off"], default="auto",
+					  help="score the whole population at once with NumPy (CPython) or flat array kernels; "
+						   "auto uses NumPy when it is installed [default: %default]")
+	parser.add_option("--checkpoint", default=None,
+					  help="directory to write checkpoints to")
+	parser.add_option("--checkpoint-every", type="int", default=checkpoint.CHECKPOINT_EVERY,
+					  help="generations between checkpoints [default: %default]")
+	parser.add_option("--resume", action="store_true", default=False,
+					  help="continue the run saved in the --checkpoint directory")
+	parser.add_option("--seed", type="int", default=None,
+					  help="seed the random module for a reproducible run (a resumed run restores its saved state)")
+	parser.add_option("--plateau-window", type="int", default=0,
+					  help="generations over which best and mean fitness must stay flat to count as "
+						   "a plateau; 0 always runs every generation [default: %default]")
+	parser.add_option("--best-tolerance", type="float", default=convergence.BEST_TOLERANCE,
+					  help="largest relative gain in best fitness over the window that is still a plateau [default: %default]")
+	parser.add_option("--mean-tolerance", type="float", default=convergence.MEAN_TOLERANCE,
+					  help="largest relative change in mean fitness over the window that is still a plateau [default: %default]")
+	parser.add_option("--on-plateau", choices=convergence.ACTIONS, default="stop",
+					  help="stop the run, or restart keeping the fittest --restart-keep of the population [default: %default]")
+	parser.add_option("--restart-keep", type="float", default=RESTART_KEEP_RATE,
+					  help="fraction of the population kept on a restart [default: %default]")
+	parser.add_option("--max-restarts", type="int", default=3,
+					  help="restarts before a plateau stops the run [default: %default]")
+	parser.add_option("--telemetry", default=None,
+					  help="file to append a JSON line of per-generation statistics to (see telemetry.py)")
+	parser.add_option("--midi-backend", choices=MIDI_BACKENDS, default=MIDI_BACKEND,
+					  help="write MIDI through jmusic or the pure-Python smf writer [default: %default]")
+	parser.add_option("--export-best", default=None, metavar="DIR",
+					  help="write the best song of every generation to DIR as MIDI with the smf writer")
+	options, args = parser.parse_args()
+	if options.resume and options.checkpoint is None:
+		parser.error("--resume requires --checkpoint")
+	if len(args) != 4:
+		parser.error("expected 4 arguments, got "+str(len(args)))
+
+	check_critics(parser, args[2])
+
+	print "\n\nWriting initial MIDI to: ", args[0]
+	print "\nWriting final MIDI to: ", args[1]
+
+	input_critics = args[2].split(",")
 	critics = parse_critics(input_critics)
 	print_critics = ""
 	for index, single_critic in enumerate(critics):
@@ -172,17 +562,94 @@ if __name__ == '__main__':
 			print_critics+=(single_critic.__class__.__name__)
 	print "\nRunning critics: ", print_critics
 
-	print "\nRunning for ", sys.argv[4], " generations\n"
-	num_gens = int(sys.argv[4])
-	evo = CriticEvolution(100, critics)
-	first_best_song = evo.get_current_best_song()
-	for x in xrange(num_gens):
+	print "\nRunning for ", args[3], " generations\n"
+	num_gens = int(args[3])
+	executor = make_executor(options.executor, options.workers)
+	checkpointer = None
+	if options.checkpoint is not None:
+		checkpointer = checkpoint.Checkpointer(options.checkpoint, options.checkpoint_every)
+	best_songs = []
+	restarts = 0
+	plateau_history = None
+	if options.resume and checkpointer.exists():
+		evo, extra = checkpointer.load(executor)
+		first_best_song = extra["first_best_song"]
+		best_songs = extra.get("best_songs", [])
+		restarts = extra.get("restarts", 0)
+		plateau_history = extra.get("plateau_history")
+		print "Resuming from generation ", evo.generation
+	else:
+		if options.seed is not None:
+			random.seed(options.seed)
+		evo = CriticEvolution(100, critics,
+							  survival_rate=options.survival_rate,
+							  survival_noise=options.survival_noise,
+							  executor=executor,
+							  selection=make_selection(options.selection, options.tournament_size),
+							  genome=options.genome,
+							  batch={"auto": None, "on": True, "off": False}[options.batch],
+							  dedup=options.dedup,
+							  replacement=options.replacement,
+							  steady_offspring=options.steady_offspring)
+		first_best_song = evo.get_current_best_song()
+	telemetry_file = None
+	if options.telemetry is not None:
+		telemetry_file = open(options.telemetry, "a")
+		evo.add_hook(telemetry.Telemetry(telemetry_file))
+	detector = None
+	if options.plateau_window > 0:
+		detector = convergence.PlateauDetector(options.plateau_window, options.best_tolerance,
+												options.mean_tolerance)
+		if plateau_history is not None:
+			detector.best, detector.mean = plateau_history
+		evo.add_hook(detector)
+	start_generation = evo.generation
+	start_time = time.time()
+	for x in xrange(evo.generation, num_gens):
 		evo.next_generation()
+		if options.export_best is not None:
+			best_songs.append(evo.get_current_best_song().copy())
 		if x % 10 == 0: 
 			print "At generation: ", x 
 			print "Best fitness: ", evo.get_fitness(evo.get_current_best_song())
+			print "Fitness cache hits/misses: ", evo.fitness_cache.hits, "/", evo.fitness_cache.misses
+			phrase_cache = evo.scorer.phrase_evaluator.cache
+			if phrase_cache.hits or phrase_cache.misses:
+				print "Phrase cache hits/misses: ", phrase_cache.hits, "/", phrase_cache.misses
+			print "Duplicate children: ", str(round(100*evo.duplicate_rate, 1))+"%"
+		if detector is not None and detector.stalled():
+			if options.on_plateau == "restart" and restarts < options.max_restarts:
+				restarts += 1
+				print "Fitness plateaued at generation ", x, ", restart ", restarts
+				evo.restart(options.restart_keep)
+				detector.reset()
+			else:
+				elapsed = time.time()-start_time
+				saved = num_gens-evo.generation
+				print "Fitness plateaued at generation ", x, ", stopping early"
+				print "Saved ", saved, " generations, about ", \
+					  round(saved*elapsed/(evo.generation-start_generation), 1), " seconds"
+				break
+		if checkpointer is not None:
+			# After any restart, which changes the population and the random state
+			extra = {"first_best_song": first_best_song, "best_songs": best_songs, "restarts": restarts}
+			if detector is not None:
+				extra["plateau_history"] = (detector.best, detector.mean)
+			checkpointer.maybe_save(evo, extra)
 	last_best_song = evo.get_current_best_song()
-	first_best_song.write_to_midi("../results/"+ sys.argv[1]+".mid")
-	last_best_song.write_to_midi("../results/" + sys.argv[2]+".mid")
+	evo.executor.shutdown()
+	if telemetry_file is not None:
+		telemetry_file.close()
+	first_best_song.write_to_midi("../results/"+ args[0]+".mid", options.midi_backend)
+	last_best_song.write_to_midi("../results/" + args[1]+".mid", options.midi_backend)
+	if best_songs:
+		if not os.path.isdir(options.export_best):
+			os.makedirs(options.export_best)
+		first = evo.generation-len(best_songs)
+		outfiles = [os.path.join(options.export_best, "generation_%d.mid" % (first+i))
+					for i in xrange(len(best_songs))]
+		print "Exported ", smf.write_songs(best_songs, outfiles), " songs to ", options.export_best
 
 
+if __name__ == '__main__':
+	run_cli(main)
@@ -0,0 +1,116 @@
+"""Executors used to fan fitness evaluation out over a population.
+
+Each executor exposes map(fn, items), which returns [fn(item) for item in
+items] in the original order, and shutdown(). Fitness functions are
+deterministic, so every executor returns exactly what the serial one does.
+
+- SerialExecutor runs everything on the calling thread.
+- ThreadPoolExecutor keeps a pool of daemon worker threads. Jython has no
+  GIL, so this uses every core when running on the JVM.
+- ProcessPoolExecutor uses multiprocessing and is only available under
+  CPython. fn and the items must be picklable.
+"""
+
+import sys
+import threading
+import Queue
+
+EXECUTORS = ["serial", "thread", "process"]
+
+
+def cpu_count():
+	"""Returns the number of available processors"""
+	try:
+		import multiprocessing
+		return multiprocessing.cpu_count()
+	except (ImportError, NotImplementedError):
+		pass
+	try:
+		from java.lang import Runtime
+		return Runtime.getRuntime().availableProcessors()
+	except ImportError:
+		return 1
+
+
+class SerialExecutor(object):
+	def map(self, fn, items):
+		return [fn(item) for item in items]
+
+	def shutdown(self):
+		pass
+
+
+class ThreadPoolExecutor(object):
+	def __init__(self, workers=None):
+		if workers is None:
+			workers = cpu_count()
+		self.workers = workers
+		self.tasks = Queue.Queue()
+		self.threads = []
+		for _ in xrange(workers):
+			thread = threading.Thread(target=self._work)
+			thread.setDaemon(True)
+			thread.start()
+			self.threads.append(thread)
+
+	def _work(self):
+		while True:
+			task = self.tasks.get()
+			if task is None:
+				return
+			fn, idx, item, results, done = task
+			try:
+				results[idx] = (True, fn(item))
+			except Exception:
+				results[idx] = (False, sys.exc_info()) # keeps the worker's traceback
+			done.put(idx)
+
+	def map(self, fn, items):
+		results = [None]*len(items)
+		done = Queue.Queue()
+		for idx, item in enumerate(items):
+			self.tasks.put((fn, idx, item, results, done))
+		for _ in xrange(len(items)):
+			done.get()
+		values = []
+		for ok, value in results:
+			if not ok:
+				raise value[0], value[1], value[2]
+			values.append(value)
+		return values
+
+	def shutdown(self):
+		for _ in self.threads:
+			self.tasks.put(None)
+		self.threads = []
+
+
+class ProcessPoolExecutor(object):
+	def __init__(self, workers=None):
+		try:
+			import multiprocessing
+		except ImportError:
+			raise ValueError("The process executor requires CPython's multiprocessing module")
+		if workers is None:
+			workers = cpu_count()
+		self.workers = workers
+		self.pool = multiprocessing.Pool(workers)
+
+	def map(self, fn, items):
+		chunksize = max(1, len(items)/(4*self.workers))
+		return self.pool.map(fn, items, chunksize)
+
+	def shutdown(self):
+		self.pool.close()
+		self.pool.join()
+
+
+def make_executor(name="serial", workers=None):
+	"""Returns an executor from its short name (see EXECUTORS)"""
+	if name == "serial":
+		return SerialExecutor()
+	if name == "thread":
+		return ThreadPoolExecutor(workers)
+	if name == "process":
+		return ProcessPoolExecutor(workers)
+	raise ValueError('Unknown executor "'+str(name)+'"')
@@ -0,0 +1,68 @@
+"""Generation-scoped cache of song fitness values.
+
+Entries are keyed by the song's content fingerprint (see Song.fingerprint).
+Once a song is mutated its fingerprint changes and the next lookup misses,
+and identical copies made by crossover share a fingerprint and therefore
+share a single evaluation. This relies on every critic scoring a song by
+its content alone; a critic that looked at object identity (which notes are
+shared, say) would give a song and its copy different scores under one key.
+
+The cache keeps two generations of entries. advance() is called once per
+generation; entries that are not looked up during the following generation
+are dropped, which bounds memory to roughly two populations of genomes.
+"""
+
+
+class FitnessCache(object):
+	def __init__(self):
+		self.current = {} # fingerprint -> fitness, touched this generation
+		self.previous = {} # fingerprint -> fitness, from last generation
+		self.hits = 0
+		self.misses = 0
+
+	def lookup(self, song, fitness_fn):
+		"""Returns the fitness of song, calling fitness_fn(song) only on a miss"""
+		key = song.fingerprint()
+		if key in self:
+			self.hits += 1
+			return self.fetch(key)
+		fitness = fitness_fn(song)
+		self.store(key, fitness)
+		return fitness
+
+	def fetch(self, key):
+		"""Returns the cached fitness for key without touching the counters"""
+		if key in self.current:
+			return self.current[key]
+		fitness = self.previous.pop(key)
+		self.current[key] = fitness
+		return fitness
+
+	def store(self, key, fitness):
+		"""Records a freshly computed fitness, counting it as a miss"""
+		self.misses += 1
+		self.current[key] = fitness
+
+	def record_hits(self, count):
+		self.hits += count
+
+	def advance(self):
+		"""Ends the current generation, discarding entries unused since the last one"""
+		self.previous = self.current
+		self.current = {}
+
+	def clear(self):
+		self.current = {}
+		self.previous = {}
+
+	def hit_rate(self):
+		lookups = self.hits + self.misses
+		if lookups == 0:
+			return 0.0
+		return self.hits/(1.0*lookups)
+
+	def __contains__(self, key):
+		return key in self.current or key in self.previous
+
+	def __len__(self):
+		return len(self.current) + len(self.previous)
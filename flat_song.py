@@ -0,0 +1,378 @@
+"""Compact struct-of-arrays representation of a song.
+
+A FlatSong holds the same content as a song.Song tree in a handful of
+parallel arrays instead of one Python object per verse, phrase, chord and
+note:
+
+	chord_root, chord_inversion, chord_play    one entry per chord
+	note_pitch, note_duration                  one entry per note
+	bounds[VERSE]    phrase index where each verse starts
+	bounds[PHRASE]   chord index where each phrase starts
+	bounds[CHORD]    note index where each chord starts
+
+Each bounds array has one more entry than its level has elements, so the
+children of element i are bounds[level][i] up to bounds[level][i+1].
+
+FlatSong converts losslessly to and from the tree (from_song/to_song), has
+the same fingerprint as the equivalent tree, and supports mutation, copying,
+verse splicing and MIDI export directly. Mutation follows the tree's
+per-node probabilities exactly. The only difference is that a flat song
+never shares a phrase or verse between two places the way a freshly made
+random song does, so such a phrase mutates independently in each place.
+
+Since the arrays index every element of a level, mutation does not visit
+nodes one by one: it draws which elements of each level mutate with
+util.bernoulli_indices, so its cost follows the number of mutations rather
+than the size of the song.
+"""
+
+from array import array
+import theory
+import random
+import song
+import util
+
+VERSE = 0
+PHRASE = 1
+CHORD = 2
+NOTE = 3
+
+# Per-element arrays at each level
+ATTRIBUTES = {CHORD: ["chord_root", "chord_inversion", "chord_play"],
+			  NOTE: ["note_pitch", "note_duration"]}
+TYPECODES = {"chord_root": "i",
+			 "chord_inversion": "i",
+			 "chord_play": "b",
+			 "note_pitch": "i",
+			 "note_duration": "d"}
+
+
+def shift(bounds, start, delta):
+	"""Adds delta to bounds[start:]"""
+	if delta:
+		bounds[start:] = array("i", [b+delta for b in bounds[start:]])
+
+
+class FlatSong(object):
+	def __init__(self, root, tempo, legal_pitches, scale):
+		self.root = root # Key of the song, pitch from music library
+		self.tempo = tempo # beats per minute
+		self.legal_pitches = legal_pitches # Pitches from music library
+		self.scale = scale # Scale shared by every chord
+		self.bounds = [array("i", [0]), array("i", [0]), array("i", [0])]
+		for name, typecode in TYPECODES.items():
+			setattr(self, name, array(typecode))
+
+	@classmethod
+	def from_song(cls, tree):
+		"""Returns the FlatSong equivalent of a song.Song"""
+		flat = cls(tree.root, tree.tempo, tree.legal_pitches, None)
+		verse_bounds, phrase_bounds, chord_bounds = flat.bounds
+		for verse in tree.verse_seq:
+			for phrase in verse.sequence:
+				for chord in phrase.sequence:
+					if flat.scale is None:
+						flat.scale = chord.scale
+					assert chord.scale == flat.scale
+					flat.chord_root.append(chord.root)
+					flat.chord_inversion.append(chord.inversion)
+					flat.chord_play.append(int(chord.play))
+					for note in chord.note_seq:
+						flat.note_pitch.append(note.pitch)
+						flat.note_duration.append(note.duration)
+					chord_bounds.append(len(flat.note_pitch))
+				phrase_bounds.append(len(flat.chord_root))
+			verse_bounds.append(len(phrase_bounds)-1)
+		return flat
+
+	def to_song(self):
+		"""Returns the equivalent song.Song tree"""
+		tree = song.Song(self.root, self.tempo, self.legal_pitches)
+		verse_bounds, phrase_bounds, chord_bounds = self.bounds
+		verses = []
+		for v in xrange(self.count(VERSE)):
+			phrases = []
+			for p in xrange(verse_bounds[v], verse_bounds[v+1]):
+				chords = []
+				for c in xrange(phrase_bounds[p], phrase_bounds[p+1]):
+					notes = [song.Note(self.note_pitch[n], self.note_duration[n], tree)
+							 for n in xrange(chord_bounds[c], chord_bounds[c+1])]
+					chords.append(song.Chord(self.chord_root[c], self.scale, tree, notes,
+											 self.chord_inversion[c], bool(self.chord_play[c])))
+				phrases.append(song.Phrase(chords, tree))
+			verses.append(song.Verse(phrases, tree))
+		tree.add_verses(verses)
+		return tree
+
+	def copy(self):
+		flat = FlatSong(self.root, self.tempo, self.legal_pitches, self.scale)
+		flat.bounds = [b[:] for b in self.bounds]
+		for name in TYPECODES:
+			setattr(flat, name, getattr(self, name)[:])
+		return flat
+
+	def fingerprint(self):
+		"""Same value as Song.fingerprint for the equivalent tree"""
+		verse_bounds, phrase_bounds, chord_bounds = self.bounds
+		verses = []
+		for v in xrange(self.count(VERSE)):
+			phrases = []
+			for p in xrange(verse_bounds[v], verse_bounds[v+1]):
+				chords = []
+				for c in xrange(phrase_bounds[p], phrase_bounds[p+1]):
+					notes = tuple([(self.note_pitch[n], self.note_duration[n])
+								   for n in xrange(chord_bounds[c], chord_bounds[c+1])])
+					chords.append((self.chord_root[c], self.chord_inversion[c], bool(self.chord_play[c]), notes))
+				phrases.append(tuple(chords))
+			verses.append(tuple(phrases))
+		return (self.tempo, tuple(verses))
+
+	def count(self, level):
+		"""Returns the number of verses, phrases, chords or notes in the song"""
+		if level == NOTE:
+			return len(self.note_pitch)
+		return len(self.bounds[level])-1
+
+	def num_verses(self):
+		return self.count(VERSE)
+
+	def get_duration(self):
+		return sum(self.note_duration)
+
+	def spliced(self, segments):
+		"""Returns a copy of self whose verses are the concatenation of the
+		(song, start, stop) verse ranges in segments"""
+		flat = FlatSong(self.root, self.tempo, self.legal_pitches, self.scale)
+		for other, start, stop in segments:
+			start, stop, _ = slice(start, stop).indices(other.count(VERSE))
+			if stop > start:
+				flat._insert(VERSE, None, flat.count(VERSE), other._extract(VERSE, None, start, stop-start))
+		return flat
+
+	def _children(self, level, parent):
+		"""Returns the (start, stop) indices at level of parent's children.
+		Verses have no parent; their parent is the song itself (None)."""
+		if level == VERSE:
+			return 0, self.count(VERSE)
+		bounds = self.bounds[level-1]
+		return bounds[parent], bounds[parent+1]
+
+	def _note_range(self, level, start, stop):
+		"""Returns the (start, stop) note indices under elements start..stop-1 of level"""
+		for l in xrange(level, NOTE):
+			start, stop = self.bounds[l][start], self.bounds[l][stop]
+		return start, stop
+
+	def _element_duration(self, level, idx):
+		start, stop = self._note_range(level, idx, idx+1)
+		return sum(self.note_duration[start:stop])
+
+	def _scale_element(self, level, idx, scale_factor):
+		start, stop = self._note_range(level, idx, idx+1)
+		for n in xrange(start, stop):
+			self.note_duration[n] *= scale_factor
+
+	def _extract(self, level, parent, k, num=1):
+		"""Returns a copy of num children of parent starting at child k, with
+		everything beneath them, as (num, [(attributes, relative bounds)] per level)"""
+		start = self._children(level, parent)[0] + k
+		stop = start + num
+		levels = []
+		for l in xrange(level, NOTE+1):
+			attributes = [getattr(self, name)[start:stop] for name in ATTRIBUTES.get(l, [])]
+			bounds = None
+			if l < NOTE:
+				absolute = self.bounds[l][start:stop+1]
+				bounds = array("i", [b-absolute[0] for b in absolute])
+				start, stop = absolute[0], absolute[-1]
+			levels.append((attributes, bounds))
+		return (num, levels)
+
+	def _delete(self, level, parent, k, num=1):
+		"""Removes num children of parent starting at child k, with everything beneath them"""
+		if level != VERSE:
+			bounds = self.bounds[level-1]
+			shift(bounds, parent+1, -num)
+		start = self._children(level, parent)[0] + k
+		stop = start + num
+		for l in xrange(level, NOTE+1):
+			for name in ATTRIBUTES.get(l, []):
+				del getattr(self, name)[start:stop]
+			if l < NOTE:
+				bounds = self.bounds[l]
+				child_start, child_stop = bounds[start], bounds[stop]
+				del bounds[start:stop]
+				removed = child_stop - child_start
+				shift(bounds, start, -removed)
+				start, stop = child_start, child_stop
+
+	def _insert(self, level, parent, k, fragment):
+		"""Inserts a fragment from _extract as children of parent before child k"""
+		num, levels = fragment
+		pos = self._children(level, parent)[0] + k
+		if level != VERSE:
+			bounds = self.bounds[level-1]
+			shift(bounds, parent+1, num)
+		for l, (attributes, relative) in zip(xrange(level, NOTE+1), levels):
+			for name, values in zip(ATTRIBUTES.get(l, []), attributes):
+				getattr(self, name)[pos:pos] = values
+			if l < NOTE:
+				bounds = self.bounds[l]
+				child_pos = bounds[pos]
+				bounds[pos:pos] = array("i", [child_pos+r for r in relative[:-1]])
+				added = relative[-1]
+				shift(bounds, pos+num, added)
+				pos, num = child_pos, added
+
+	# Sequence operators mirroring util.random_*, applied to the children at
+	# level of parent
+
+	def _random_swap(self, level, parent):
+		start, stop = self._children(level, parent)
+		n = stop - start
+		a = random.randint(0, n-1)
+		b = random.randint(0, n-1)
+		if a == b:
+			return
+		a, b = min(a, b), max(a, b)
+		first = self._extract(level, parent, a)
+		second = self._extract(level, parent, b)
+		self._delete(level, parent, b)
+		self._insert(level, parent, b, first)
+		self._delete(level, parent, a)
+		self._insert(level, parent, a, second)
+
+	def _random_merge(self, level, parent):
+		start, stop = self._children(level, parent)
+		if stop - start >= 2:
+			k = random.randint(0, stop-start-2)
+			first_dur = self._element_duration(level, start+k)
+			second_dur = self._element_duration(level, start+k+1)
+			self._scale_element(level, start+k, (first_dur+second_dur)/(1.0*first_dur))
+			self._delete(level, parent, k+1)
+
+	def _random_split(self, level, parent):
+		start, stop = self._children(level, parent)
+		k = random.randint(0, stop-start-1)
+		note_start, note_stop = self._note_range(level, start+k, start+k+1)
+		for n in xrange(note_start, note_stop):
+			if self.note_duration[n] < 0.25:
+				return
+		self._scale_element(level, start+k, 0.5)
+		self._insert(level, parent, k+1, self._extract(level, parent, k))
+
+	def _random_repeat(self, level, parent):
+		start, stop = self._children(level, parent)
+		k = random.randint(0, stop-start-1)
+		fragment = self._extract(level, parent, k)
+		self._insert(level, parent, random.randint(0, stop-start), fragment)
+
+	# Mutation, following the _mutate methods of the tree classes
+
+	def recursive_mutate(self):
+		"""Mutates the song in place, one level at a time from the top. Every
+		element present when its level is reached mutates with its tree
+		class's probability, as in the tree's depth-first walk: a mutation only
+		changes the mutating element's own subtree, so the order in which
+		independent subtrees mutate does not matter. Mutating an element never
+		changes how many elements its own level has, so the indices drawn for a
+		level stay valid while it mutates."""
+		self._mutate_song()
+		for v in util.bernoulli_indices(self.count(VERSE), song.VERSE_MUTATE_PROB):
+			self._mutate_sequence(PHRASE, v)
+		for p in util.bernoulli_indices(self.count(PHRASE), song.PHRASE_MUTATE_PROB):
+			self._mutate_sequence(CHORD, p)
+		for c in util.bernoulli_indices(self.count(CHORD), song.CHORD_MUTATE_PROB):
+			self._mutate_chord(c)
+		for n in util.bernoulli_indices(self.count(NOTE), song.NOTE_MUTATE_PROB):
+			self._mutate_note(n)
+
+	def _mutate_song(self):
+		if random.random() < song.SONG_MUTATE_PROB:
+			# change tempo
+			if random.random() < 0.5:
+				self.tempo += random.randint(-10, 10)
+			# swap two verse sequences
+			if random.random() < 0.05:
+				self._random_swap(VERSE, None)
+
+	def _mutate_sequence(self, level, parent):
+		"""Mutates the children at level of parent, which was drawn to mutate"""
+		if random.random() < 0.1:
+			# merge two elements
+			if random.random() < 0.5:
+				self._random_merge(level, parent)
+			# split an element
+			else:
+				self._random_split(level, parent)
+
+		# swap 2 elements
+		if random.random() < 0.1:
+			self._random_swap(level, parent)
+
+		# repeat element
+		if random.random() < 0.1:
+			self._random_repeat(level, parent)
+
+		# copying an element only breaks sharing in the tree, and flat
+		# songs never share, so there is nothing to do for util.random_copy
+
+	def _mutate_chord(self, c):
+		"""Mutates chord c, which was drawn to mutate"""
+		# change inversion
+		if random.random() < 0.25:
+			self.chord_inversion[c] = random.choice(range(1, 4))
+
+		# change root
+		if random.random() < 0.25:
+			self.chord_root[c] = random.choice(range(7))
+			# have notes follow root change
+			self._reset_notes(c)
+
+		if random.random() < 0.05:
+			# merge two notes
+			if random.random() < 0.5:
+				self._random_merge(NOTE, c)
+			# split a note
+			else:
+				self._random_split(NOTE, c)
+
+		# swap 2 notes
+		if random.random() < 0.05:
+			self._random_swap(NOTE, c)
+
+		# turn on or off for playback
+		if random.random() < 0.5:
+			self.chord_play[c] = int(not self.chord_play[c])
+
+	def _reset_notes(self, c):
+		start, stop = self._children(NOTE, c)
+		pitches = [theory.REST]+song.chord_pitches(self.scale, self.chord_root[c], 1)
+		note_dur = sum(self.note_duration[start:stop])/(1.0*(stop-start))
+		for n in xrange(start, stop):
+			self.note_pitch[n] = random.choice(pitches)
+			self.note_duration[n] = note_dur
+
+	def _mutate_note(self, n):
+		"""A note can only mutate by changing its pitch."""
+		idx = random.randint(-3, 3) % len(self.legal_pitches)
+		self.note_pitch[n] = self.legal_pitches[idx]
+
+	def note_lists(self):
+		"""Returns the note lists of song.write_note_lists"""
+		all_chords_pitches = []
+		all_chords_durations = []
+		chord_bounds = self.bounds[CHORD]
+		for c in xrange(self.count(CHORD)):
+			if self.chord_play[c]:
+				all_chords_pitches.append(song.chord_pitches(self.scale, self.chord_root[c], self.chord_inversion[c]))
+			else:
+				all_chords_pitches.append(theory.REST)
+			all_chords_durations.append(sum(self.note_duration[chord_bounds[c]:chord_bounds[c+1]]))
+		return (self.tempo, all_chords_pitches, all_chords_durations,
+				list(self.note_pitch), list(self.note_duration))
+
+	def write_to_midi(self, outfile="out.mid", backend=None):
+		tempo, chords_pitches, chords_durations, melody_pitches, melody_durations = self.note_lists()
+		song.write_note_lists(tempo, chords_pitches, chords_durations, melody_pitches, melody_durations,
+							  outfile, backend)
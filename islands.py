@@ -0,0 +1,429 @@
+"""Island-model evolution: several independent populations with periodic migration.
+
+Each island is an ordinary CriticEvolution driven by its own next_generation
+loop inside a worker. Every `interval` generations the runner collects the
+best `migrants` songs from each island and sends them on according to the
+topology, where they replace the receiving island's worst songs:
+
+- ring: island i receives the migrants of island i-1
+- full: island i receives the best `migrants` songs among all other islands
+
+Workers talk to the runner over a channel (anything with send/recv):
+
+- thread: workers run on threads of this process (parallel under Jython)
+- process: one multiprocessing worker per island (CPython only, and the
+  default there)
+- socket: workers started elsewhere with `islands.py --serve PORT`
+
+Thread islands share the process's random module, so their seeds do not
+make runs reproducible; process and socket islands each seed their own.
+
+Socket islands exchange pickles, and unpickling runs code, so both ends
+first prove they hold the shared key in ISLANDS_AUTHKEY (an HMAC over a
+random challenge each way, as multiprocessing.connection does) and nothing
+is unpickled before that. Even so, never expose a --serve port beyond
+machines you trust: the key is all that stands between it and running
+code as the island's user.
+
+To run, go into the jythonMusic directory and run
+`sh jython.sh ../islands.py genx_filename critic1,critic2 num_gens --islands 4`
+"""
+
+import evolution
+import executors
+import selection
+import hashlib
+import heapq
+import hmac
+import optparse
+import os
+import random
+import socket
+import struct
+import threading
+import Queue
+
+try:
+	import cPickle as pickle
+except ImportError:
+	import pickle
+
+try:
+	import multiprocessing
+except ImportError:
+	multiprocessing = None # Jython
+
+TOPOLOGIES = ["ring", "full"]
+TRANSPORTS = ["thread", "process", "socket"]
+if multiprocessing is None:
+	DEFAULT_TRANSPORT = "thread"
+else:
+	DEFAULT_TRANSPORT = "process" # seedable, unlike threads
+INTERVAL = 10
+MIGRANTS = 2
+AUTHKEY_ENV = "ISLANDS_AUTHKEY" # shared key of socket islands and their runner
+CHALLENGE_SIZE = 20 # random bytes per authentication challenge
+WELCOME = "#WELCOME#"
+FAILURE = "#FAILURE#"
+
+
+class AuthenticationError(Exception):
+	pass
+
+
+def build_evolution(settings):
+	"""Returns a seeded CriticEvolution from a dict of plain, picklable settings.
+	The seed goes to the module-wide random, so it only holds for one island
+	per process."""
+	random.seed(settings["seed"])
+	return evolution.CriticEvolution(settings["size"],
+									  evolution.parse_critics(settings["critics"]),
+									  survival_rate=settings.get("survival_rate", evolution.SURVIVAL_RATE),
+									  survival_noise=settings.get("survival_noise", evolution.SURVIVAL_NOISE),
+									  selection=selection.make_selection(settings.get("selection", "truncation")),
+									  genome=settings.get("genome", "tree"))
+
+
+class IslandWorker(object):
+	"""Answers the runner's requests for a single island"""
+	def __init__(self, evolution):
+		self.evolution = evolution
+
+	def evolve(self, num_gens):
+		for _ in xrange(num_gens):
+			self.evolution.next_generation()
+		return self.best()[0]
+
+	def best(self):
+		"""Returns (fitness, song) for the fittest song on the island"""
+		song = self.evolution.get_current_best_song()
+		return (self.evolution.get_fitness(song), song)
+
+	def emigrants(self, num_migrants):
+		"""Returns (fitness, song) copies of the num_migrants fittest songs"""
+		population = self.evolution.population
+		fitnesses = self.evolution.evaluate_population(population)
+		best = heapq.nlargest(num_migrants, xrange(len(population)), key=lambda i:fitnesses[i])
+		return [(fitnesses[i], population[i].copy()) for i in best]
+
+	def immigrate(self, songs):
+		"""Replaces the island's worst songs with copies of songs"""
+		population = self.evolution.population
+		fitnesses = self.evolution.evaluate_population(population)
+		worst = heapq.nsmallest(len(songs), xrange(len(population)), key=lambda i:fitnesses[i])
+		for idx, song in zip(worst, songs):
+			population[idx] = song.copy()
+		return len(worst)
+
+	def handle(self, command, arg):
+		if command == "evolve":
+			return self.evolve(arg)
+		if command == "best":
+			return self.best()
+		if command == "emigrants":
+			return self.emigrants(arg)
+		if command == "immigrate":
+			return self.immigrate(arg)
+		raise ValueError('Unknown island command "'+str(command)+'"')
+
+
+def serve(channel):
+	"""Worker loop: builds an island from the "init" message and answers requests
+	until "stop". Replies are (ok, value) so errors reach the runner."""
+	worker = None
+	while True:
+		command, arg = channel.recv()
+		if command == "stop":
+			channel.send((True, None))
+			return
+		try:
+			if command == "init":
+				worker = IslandWorker(build_evolution(arg))
+				reply = None
+			else:
+				reply = worker.handle(command, arg)
+			channel.send((True, reply))
+		except Exception, e:
+			channel.send((False, repr(e)))
+
+
+class QueueChannel(object):
+	def __init__(self, inbox, outbox):
+		self.inbox = inbox
+		self.outbox = outbox
+
+	def send(self, obj):
+		self.outbox.put(obj)
+
+	def recv(self):
+		return self.inbox.get()
+
+	def close(self):
+		pass
+
+
+class SocketChannel(object):
+	"""Sends length-prefixed pickles over a connected socket. Only use it
+	after authenticate, since recv runs whatever code the peer pickled."""
+	def __init__(self, sock):
+		self.sock = sock
+
+	def send(self, obj):
+		self.send_bytes(pickle.dumps(obj, 2))
+
+	def recv(self):
+		return pickle.loads(self.recv_bytes())
+
+	def send_bytes(self, data):
+		self.sock.sendall(struct.pack("!I", len(data)) + data)
+
+	def recv_bytes(self, max_size=None):
+		size = struct.unpack("!I", self._read(4))[0]
+		if max_size is not None and size > max_size:
+			raise AuthenticationError("Unexpected message of "+str(size)+" bytes")
+		return self._read(size)
+
+	def _read(self, size):
+		chunks = []
+		while size > 0:
+			chunk = self.sock.recv(size)
+			if not chunk:
+				raise EOFError("Island connection closed")
+			chunks.append(chunk)
+			size -= len(chunk)
+		return "".join(chunks)
+
+	def close(self):
+		self.sock.close()
+
+
+def digest(authkey, challenge):
+	return hmac.new(authkey, challenge, hashlib.sha1).digest()
+
+
+def same_digest(a, b):
+	"""Compares digests in time independent of where they differ"""
+	if len(a) != len(b):
+		return False
+	difference = 0
+	for x, y in zip(a, b):
+		difference |= ord(x) ^ ord(y)
+	return difference == 0
+
+
+def deliver_challenge(channel, authkey):
+	"""Checks that the peer holds authkey, raising AuthenticationError if not"""
+	challenge = os.urandom(CHALLENGE_SIZE)
+	channel.send_bytes(challenge)
+	expected = digest(authkey, challenge)
+	if not same_digest(channel.recv_bytes(len(expected)), expected):
+		channel.send_bytes(FAILURE)
+		raise AuthenticationError("Digest received was wrong")
+	channel.send_bytes(WELCOME)
+
+
+def answer_challenge(channel, authkey):
+	"""Proves to the peer that we hold authkey, raising AuthenticationError if it disagrees"""
+	challenge = channel.recv_bytes(CHALLENGE_SIZE)
+	channel.send_bytes(digest(authkey, challenge))
+	if channel.recv_bytes(len(WELCOME)) != WELCOME:
+		raise AuthenticationError("Peer rejected the authentication key")
+
+
+def authenticate(channel, authkey, serving):
+	"""Authenticates both ends of a SocketChannel with the shared authkey
+	before anything is unpickled; the serving end challenges first"""
+	if serving:
+		deliver_challenge(channel, authkey)
+		answer_challenge(channel, authkey)
+	else:
+		answer_challenge(channel, authkey)
+		deliver_challenge(channel, authkey)
+
+
+def start_thread_islands(num_islands):
+	channels = []
+	for _ in xrange(num_islands):
+		to_worker = Queue.Queue()
+		to_runner = Queue.Queue()
+		thread = threading.Thread(target=serve, args=(QueueChannel(to_worker, to_runner),))
+		thread.setDaemon(True)
+		thread.start()
+		channels.append(QueueChannel(to_runner, to_worker))
+	return channels
+
+
+def start_process_islands(num_islands):
+	if multiprocessing is None:
+		raise ValueError("The process transport requires CPython's multiprocessing module")
+	channels = []
+	for _ in xrange(num_islands):
+		runner_end, worker_end = multiprocessing.Pipe()
+		process = multiprocessing.Process(target=serve, args=(worker_end,))
+		process.daemon = True
+		process.start()
+		channels.append(runner_end)
+	return channels
+
+
+def connect_socket_islands(addresses, authkey):
+	"""Connects to islands served with serve_socket, given "host:port" strings
+	and their shared key"""
+	channels = []
+	for address in addresses:
+		host, port = address.rsplit(":", 1)
+		sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		sock.connect((host, int(port)))
+		channel = SocketChannel(sock)
+		authenticate(channel, authkey, False)
+		channels.append(channel)
+	return channels
+
+
+def serve_socket(port, authkey, host="127.0.0.1"):
+	"""Hosts one island at a time for runners connecting over TCP that hold
+	authkey. Never expose the port to untrusted machines."""
+	server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+	server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+	server.bind((host, port))
+	server.listen(1)
+	print "Serving island on", host+":"+str(port)
+	while True:
+		conn, address = server.accept()
+		channel = SocketChannel(conn)
+		try:
+			authenticate(channel, authkey, True)
+			serve(channel)
+		except AuthenticationError, e:
+			print "Rejected", address[0]+":", e
+		except EOFError:
+			pass
+		channel.close()
+
+
+class IslandRunner(object):
+	def __init__(self, channels, settings, interval=INTERVAL, migrants=MIGRANTS, topology="ring"):
+		if topology not in TOPOLOGIES:
+			raise ValueError('Unknown topology "'+str(topology)+'"')
+		self.channels = channels
+		self.interval = interval
+		self.migrants = migrants
+		self.topology = topology
+		self.generation = 0
+		self.history = [] # (generation, [best fitness per island])
+		self._broadcast("init", settings)
+
+	def _broadcast(self, command, args):
+		"""Sends one request per island, then waits for every reply, so islands work in parallel"""
+		for channel, arg in zip(self.channels, args):
+			channel.send((command, arg))
+		replies = []
+		for idx, channel in enumerate(self.channels):
+			ok, value = channel.recv()
+			if not ok:
+				raise RuntimeError("Island "+str(idx)+" failed on "+command+": "+value)
+			replies.append(value)
+		return replies
+
+	def run(self, num_gens, verbose=True):
+		"""Evolves every island for num_gens generations, migrating every interval"""
+		target = self.generation + num_gens
+		while self.generation < target:
+			gens = min(self.interval, target-self.generation)
+			bests = self._broadcast("evolve", [gens]*len(self.channels))
+			self.generation += gens
+			self.history.append((self.generation, bests))
+			if verbose:
+				self.report(bests)
+			if self.generation < target:
+				self.migrate()
+
+	def report(self, bests):
+		print "At generation: ", self.generation
+		for idx, fitness in enumerate(bests):
+			print "Island", idx, "best fitness: ", fitness
+		print "Global best fitness: ", max(bests)
+
+	def migrate(self):
+		num_islands = len(self.channels)
+		emigrants = self._broadcast("emigrants", [self.migrants]*num_islands)
+		incoming = []
+		for idx in xrange(num_islands):
+			if self.topology == "ring":
+				arriving = emigrants[(idx-1) % num_islands]
+			else:
+				pooled = []
+				for other in xrange(num_islands):
+					if other != idx:
+						pooled.extend(emigrants[other])
+				arriving = heapq.nlargest(self.migrants, pooled, key=lambda x:x[0])
+			incoming.append([song for fitness, song in arriving])
+		self._broadcast("immigrate", incoming)
+
+	def best_song(self):
+		"""Returns the fittest song across all islands"""
+		bests = self._broadcast("best", [None]*len(self.channels))
+		return max(bests, key=lambda x:x[0])[1]
+
+	def stop(self):
+		self._broadcast("stop", [None]*len(self.channels))
+		for channel in self.channels:
+			channel.close()
+
+
+def main():
+	parser = optparse.OptionParser(usage="%prog genx_filename critic1,critic2 num_gens\n       %prog --serve PORT")
+	parser.add_option("--islands", type="int", default=executors.cpu_count(),
+					  help="number of islands [default: one per core]")
+	parser.add_option("--size", type="int", default=100, help="population per island [default: %default]")
+	parser.add_option("--interval", type="int", default=INTERVAL,
+					  help="generations between migrations [default: %default]")
+	parser.add_option("--migrants", type="int", default=MIGRANTS,
+					  help="songs sent per migration [default: %default]")
+	parser.add_option("--topology", choices=TOPOLOGIES, default="ring",
+					  help=", ".join(TOPOLOGIES)+" [default: %default]")
+	parser.add_option("--transport", choices=TRANSPORTS, default=DEFAULT_TRANSPORT,
+					  help=", ".join(TRANSPORTS)+" [default: %default]; thread islands are not seedable")
+	parser.add_option("--connect", default="",
+					  help="comma separated host:port islands for the socket transport; "
+						   "both ends need the same key in $"+AUTHKEY_ENV)
+	parser.add_option("--serve", type="int", default=None,
+					  help="host an island for a socket runner on this port of 127.0.0.1, for runners "
+						   "with the key in $"+AUTHKEY_ENV+"; never expose the port to untrusted machines")
+	parser.add_option("--selection", choices=selection.SELECTIONS, default="truncation")
+	parser.add_option("--genome", choices=evolution.GENOMES, default="tree")
+	parser.add_option("--seed", type="int", default=0, help="island i is seeded with seed+i (not with --transport thread)")
+	options, args = parser.parse_args()
+
+	# The key comes from the environment, since other users can read command lines
+	authkey = os.environ.get(AUTHKEY_ENV)
+	if not authkey and (options.serve is not None or options.transport == "socket"):
+		parser.error("socket islands need a shared key in the "+AUTHKEY_ENV+" environment variable")
+	if options.serve is not None:
+		serve_socket(options.serve, authkey)
+	if len(args) != 3:
+		parser.error("expected 3 arguments, got "+str(len(args)))
+	evolution.check_critics(parser, args[1])
+
+	if options.transport == "socket":
+		channels = connect_socket_islands(options.connect.split(","), authkey)
+	elif options.transport == "process":
+		channels = start_process_islands(options.islands)
+	else:
+		channels = start_thread_islands(options.islands)
+
+	settings = [{"critics": args[1],
+				 "size": options.size,
+				 "seed": options.seed+idx,
+				 "selection": options.selection,
+				 "genome": options.genome} for idx in xrange(len(channels))]
+	print "\nRunning", len(channels), "islands with critics: ", args[1]
+	runner = IslandRunner(channels, settings, options.interval, options.migrants, options.topology)
+	runner.run(int(args[2]))
+	best_song = runner.best_song()
+	runner.stop()
+	best_song.write_to_midi("../results/"+args[0]+".mid")
+
+
+if __name__ == '__main__':
+	evolution.run_cli(main)
@@ -0,0 +1,166 @@
+"""Minimal JSON support, since Jython 2.5 has no json module."""
+
+import re
+
+# Characters a JSON string cannot hold as they are
+STRING_ESCAPES = re.compile(r'[\x00-\x1f"\\]')
+NUMBER = re.compile(r'-?(?:0|[1-9][0-9]*)(\.[0-9]+)?([eE][-+]?[0-9]+)?')
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+UNESCAPES = {'"': u'"', "\\": u"\\", "/": u"/", "b": u"\b", "f": u"\f", "n": u"\n", "r": u"\r", "t": u"\t"}
+CONSTANTS = [("true", True), ("false", False), ("null", None)]
+
+
+def escape_char(match):
+	c = match.group(0)
+	if c == '"' or c == "\\":
+		return "\\"+c
+	return "\\u%04x" % ord(c)
+
+
+def to_json(value, indent=None):
+	"""Returns value (dicts, lists, strings, numbers, booleans, None) as JSON.
+	With indent (a string) nested values go on their own lines; without it
+	the result is a single line. NaN and infinite floats, which JSON cannot
+	express, are written as null."""
+	if value is None:
+		return "null"
+	if value is True:
+		return "true"
+	if value is False:
+		return "false"
+	if isinstance(value, (int, long)):
+		return str(value)
+	if isinstance(value, float):
+		if value-value != 0.0: # NaN or infinite
+			return "null"
+		return repr(value)
+	if isinstance(value, basestring):
+		return '"'+STRING_ESCAPES.sub(escape_char, value)+'"'
+	if indent is None:
+		if isinstance(value, dict):
+			return "{"+", ".join([to_json(str(k))+": "+to_json(value[k]) for k in sorted(value)])+"}"
+		return "["+", ".join([to_json(v) for v in value])+"]"
+	inner = indent+"  "
+	if isinstance(value, dict):
+		items = [inner+to_json(str(k))+": "+to_json(value[k], inner) for k in sorted(value)]
+		return "{\n"+",\n".join(items)+"\n"+indent+"}"
+	items = [inner+to_json(v, inner) for v in value]
+	return "[\n"+",\n".join(items)+"\n"+indent+"]"
+
+
+def from_json(text):
+	"""Parses JSON with the json module where there is one, else with parse_json"""
+	try:
+		import json
+	except ImportError:
+		return parse_json(text)
+	return json.loads(text)
+
+
+def parse_json(text):
+	"""Parses JSON in pure Python, for Jython. Strings come back as str when
+	they are ASCII, as unicode otherwise."""
+	if isinstance(text, str):
+		text = text.decode("utf-8")
+	value, end = parse_value(text, skip(text, 0))
+	end = skip(text, end)
+	if end != len(text):
+		raise ValueError("Extra data at position "+str(end))
+	return value
+
+
+def skip(text, pos):
+	return WHITESPACE.match(text, pos).end()
+
+
+def parse_value(text, pos):
+	"""Returns the value starting at pos and the position after it"""
+	if pos >= len(text):
+		raise ValueError("Expected a value at the end of the text")
+	c = text[pos]
+	if c == "{":
+		return parse_object(text, pos+1)
+	if c == "[":
+		return parse_array(text, pos+1)
+	if c == '"':
+		return parse_string(text, pos+1)
+	for name, constant in CONSTANTS:
+		if text.startswith(name, pos):
+			return constant, pos+len(name)
+	match = NUMBER.match(text, pos)
+	if match is None:
+		raise ValueError("Unexpected "+repr(c)+" at position "+str(pos))
+	if match.group(1) is None and match.group(2) is None:
+		return int(match.group(0)), match.end()
+	return float(match.group(0)), match.end()
+
+
+def parse_object(text, pos):
+	result = {}
+	pos = skip(text, pos)
+	if text.startswith("}", pos):
+		return result, pos+1
+	while True:
+		if not text.startswith('"', pos):
+			raise ValueError("Expected a string key at position "+str(pos))
+		key, pos = parse_string(text, pos+1)
+		pos = skip(text, pos)
+		if not text.startswith(":", pos):
+			raise ValueError("Expected ':' at position "+str(pos))
+		result[key], pos = parse_value(text, skip(text, pos+1))
+		pos = skip(text, pos)
+		if text.startswith("}", pos):
+			return result, pos+1
+		if not text.startswith(",", pos):
+			raise ValueError("Expected ',' or '}' at position "+str(pos))
+		pos = skip(text, pos+1)
+
+
+def parse_array(text, pos):
+	result = []
+	pos = skip(text, pos)
+	if text.startswith("]", pos):
+		return result, pos+1
+	while True:
+		value, pos = parse_value(text, pos)
+		result.append(value)
+		pos = skip(text, pos)
+		if text.startswith("]", pos):
+			return result, pos+1
+		if not text.startswith(",", pos):
+			raise ValueError("Expected ',' or ']' at position "+str(pos))
+		pos = skip(text, pos+1)
+
+
+def parse_string(text, pos):
+	"""Returns the string whose opening quote is just before pos"""
+	chunks = []
+	while True:
+		end = STRING_ESCAPES.search(text, pos)
+		if end is None:
+			raise ValueError("Unterminated string")
+		end = end.start()
+		chunks.append(text[pos:end])
+		c = text[end]
+		if c == '"':
+			pos = end+1
+			break
+		if c != "\\":
+			raise ValueError("Control character in string at position "+str(end))
+		code = text[end+1:end+2]
+		if code == "u":
+			digits = text[end+2:end+6]
+			if len(digits) != 4:
+				raise ValueError("Bad \\u escape at position "+str(end))
+			chunks.append(unichr(int(digits, 16)))
+			pos = end+6
+		elif code in UNESCAPES:
+			chunks.append(UNESCAPES[code])
+			pos = end+2
+		else:
+			raise ValueError("Bad escape at position "+str(end))
+	value = u"".join(chunks)
+	try:
+		return str(value), pos
+	except UnicodeError:
+		return value, pos
@@ -28,6 +28,16 @@
 #
 # REVISIONS:
 #
+# 3.5   17-Oct-2026     Added shutdown(), which stops all synthesizers, timers, MIDI and OSC objects, and
+#                   displays (using the registries behind JEM's Stop button), so scripts run from the
+#                   command line can exit instead of hanging on Java threads.
+#
+# 3.4   17-Oct-2026     The Java synthesizer and the jSyn synthesizer are now opened the first time they
+#                   are used, rather than on import, so scripts that only need constants and Write.midi()
+#                   start faster and never grab an audio device.  Also added a headless mode (set
+#                   JYTHONMUSIC_HEADLESS=1, or -Djythonmusic.headless=true) that skips the jMusic GUI,
+#                   image and javax.sound imports altogether - see HEADLESS.
+#
 # 3.3   06-May-2015 (cb)  Added LiveSample(), which implements live recording of audio, and offers 
 #                   an API similar to AudioSample.  Nice!
 #
@@ -125,11 +135,36 @@ from jm.util import *
 
 from jm.music.tools import *
 
-from jm.gui.cpn import *
-from jm.gui.helper import *
-from jm.gui.histogram import *
-from jm.gui.show import *
-from jm.gui.wave import *
+######################################################################################
+# Headless mode, for batch jobs that only need constants and Write.midi().  When on, the
+# GUI, image and javax.sound libraries are never imported, and playing anything raises
+# an error instead of opening an audio device.
+######################################################################################
+
+import os
+
+def __isHeadless__():
+   """Returns True if the JYTHONMUSIC_HEADLESS environment variable, or the
+      jythonmusic.headless Java system property, is set to something other than 0 or false.
+   """
+   
+   setting = os.environ.get("JYTHONMUSIC_HEADLESS", "")
+   if setting == "":
+      try:
+         from java.lang import System
+         setting = System.getProperty("jythonmusic.headless", "") or ""
+      except ImportError:
+         pass
+   return setting.lower() not in ["", "0", "false", "no"]
+
+HEADLESS = __isHeadless__()
+
+if not HEADLESS:
+   from jm.gui.cpn import *
+   from jm.gui.helper import *
+   from jm.gui.histogram import *
+   from jm.gui.show import *
+   from jm.gui.wave import *
 
 from jm.audio.io import *
 from jm.audio.synth import *
@@ -886,7 +921,8 @@ def fixWorkingDirForJEM( filename ):
 ######################################################################################
 
 from jm.util import Read as jRead  # needed to wrap more functionality below
-from image import *                # import Image class and related Java libraries
+if not HEADLESS:
+   from image import *             # import Image class and related Java libraries
 
 # Create Read.image("test.jpg") to return an image, in addition to Read's default functionality.
 # This class is not meant to be instantiated, hence no "self" in function definitions.
@@ -1062,17 +1098,29 @@ from jm.util import Play as jPlay  # needed to wrap more functionality below
 # This class is not meant to be instantiated, hence no "self" in function definitions.
 # Functions are made callable through class Callable, above.
 
-from javax.sound.midi import *
+if not HEADLESS:
+   from javax.sound.midi import *
 
-# NOTE: Opening the Java synthesizer below generates some low-level noise in the audio output.
-# But we need it to be open, in clase the end-user wishes to use functions like Play.noteOn(), below. 
-# (*** Is there a way to open it just-in-time, and/or close it when not used? I cannot think of one.)
- 
-Java_synthesizer = MidiSystem.getSynthesizer()  # get a Java synthesizer
-Java_synthesizer.open()                         # and activate it (should we worry about close()???)
+# NOTE: Opening the Java synthesizer generates some low-level noise in the audio output, and takes
+# a while.  So, we open it just-in-time, the first time a function like Play.noteOn(), below, uses it.
 
-# make all instruments available
-Java_synthesizer.loadAllInstruments(Java_synthesizer.getDefaultSoundbank())   
+class __LazyJavaSynthesizer__:
+   """Stands in for the Java synthesizer, opening it (with all instruments loaded) on first use."""
+   
+   def __init__(self):
+      self.synthesizer = None   # the real synthesizer, once opened
+   
+   def __getattr__(self, name):
+      if self.synthesizer is None:
+         if HEADLESS:
+            raise RuntimeError("The Java synthesizer is not available in headless mode (JYTHONMUSIC_HEADLESS).")
+         synthesizer = MidiSystem.getSynthesizer()   # get a Java synthesizer
+         synthesizer.open()                          # and activate it
+         synthesizer.loadAllInstruments(synthesizer.getDefaultSoundbank())   # make all instruments available
+         self.synthesizer = synthesizer
+      return getattr(self.synthesizer, name)
+
+Java_synthesizer = __LazyJavaSynthesizer__()
  
 # The MIDI specification stipulates that pitch bend be a 14-bit value, where zero is 
 # maximum downward bend, 16383 is maximum upward bend, and 8192 is the center (no pitch bend).
@@ -1566,9 +1614,25 @@ class jSyn_AudioEngine():
 # *** NOTE:  This synthesizer should be started only when an audio file (AudioSample) is created.
 #            Perhaps do the same with the Java synthesizer above?  Is that synthesizer needed?
 
-# create the jSyn synthesizer (again, only one for everything)
-jSyn = jSyn_AudioEngine()
-jSyn.start()                 # should this be happening here? (or inside the Audio class, when needed?) ***
+class __LazyAudioEngine__:
+   """Stands in for the jSyn synthesizer, creating and starting it on first use
+      (i.e., when the first AudioSample or LiveSample is created).
+   """
+   
+   def __init__(self):
+      self.engine = None   # the real jSyn_AudioEngine, once started
+   
+   def __getattr__(self, name):
+      if self.engine is None:
+         if HEADLESS:
+            raise RuntimeError("The jSyn synthesizer is not available in headless mode (JYTHONMUSIC_HEADLESS).")
+         engine = jSyn_AudioEngine()
+         engine.start()
+         self.engine = engine
+      return getattr(self.engine, name)
+
+# the jSyn synthesizer (again, only one for everything)
+jSyn = __LazyAudioEngine__()
 
 
 # used to keep track which AudioSample and LiveSample objects are active, so we can stop them when
@@ -2671,6 +2735,49 @@ except:  # otherwise (if we get an error), we are NOT inside JEM
 
 
 
+######################################################################################
+# Shutting down.  Synthesizers, timers, MIDI and OSC ports run on Java threads that keep
+# the JVM alive after a script ends.  shutdown() stops all of them, using the same
+# functions JEM's Stop button calls, so batch scripts can end (or call sys.exit()) cleanly.
+######################################################################################
+
+import sys
+
+def shutdown():
+   """Stops all MidiSynths, MidiSequences, AudioSamples, timers, MIDI and OSC objects, and
+      displays, and closes the Java and jSyn synthesizers (if they were ever opened).
+   """
+   
+   global __midiSynths__
+
+   __stopMidiSynths__()
+   for midiSynth in __midiSynths__:
+      try:
+         midiSynth.finalize()   # closes its sequencer and synthesizer
+      except:                   # never played, so there is nothing to close
+         pass
+   __midiSynths__ = []
+   __stopActiveMidiSequences__()
+   __stopActiveAudioSamples__()
+
+   # the other libraries' registries, for those that were imported
+   for module, stopFunction in [("timer", "__stopActiveTimers__"), ("midi", "_stopActiveMidiObjects_"),
+                                ("osc", "_stopActiveOscObjects_"), ("gui", "__stopActiveDisplays__"),
+                                ("image", "_stopActiveImages_")]:
+      if module in sys.modules and hasattr(sys.modules[module], stopFunction):
+         getattr(sys.modules[module], stopFunction)()
+
+   # finally, the synthesizers themselves (asking the lazy stand-ins directly would open them)
+   if Java_synthesizer.synthesizer is not None:
+      Java_synthesizer.synthesizer.close()
+      Java_synthesizer.synthesizer = None
+   if jSyn.engine is not None:
+      jSyn.engine.stop()
+      jSyn.engine = None
+      jSyn_AudioEngine.instance = None
+
+
+
 ##### Sound Synthesizer class ######################################
 
 class SoundSynth():
@@ -0,0 +1,66 @@
+"""Backends that write a song's note lists to a MIDI file.
+
+Every backend writes chords on piano (channel 1) and melody on vibes
+(channel 0) from the lists song.write_note_lists takes:
+
+- JMusicBackend builds a jMusic Score and calls music.Write.midi, so it
+  needs Jython and the music library. music is only imported when writing.
+- SmfBackend uses the pure-Python smf writer and runs on any interpreter.
+
+MIDI_BACKEND, the default, is jmusic under Jython and smf everywhere else.
+"""
+
+import smf
+import sys
+import theory
+
+MIDI_BACKENDS = ["jmusic", "smf"]
+if sys.platform.startswith("java"):
+	MIDI_BACKEND = "jmusic"
+else:
+	MIDI_BACKEND = "smf"
+
+
+class MidiBackend(object):
+	def write(self, tempo, all_chords_pitches, all_chords_durations,
+			  all_melody_pitches, all_melody_durations, outfile):
+		raise UnimplementedError
+
+
+class JMusicBackend(MidiBackend):
+	def write(self, tempo, all_chords_pitches, all_chords_durations,
+			  all_melody_pitches, all_melody_durations, outfile):
+		import music
+		song = music.Score("Song", tempo)
+		chords = music.Part(theory.PIANO, 1)
+		melody = music.Part(theory.VIBES, 0)
+		melody_phrase = music.Phrase(0.0)
+		chord_phrase = music.Phrase(0.0)
+
+		chord_phrase.addNoteList(all_chords_pitches, all_chords_durations)
+		melody_phrase.addNoteList(all_melody_pitches, all_melody_durations)
+		chords.addPhrase(chord_phrase)
+		melody.addPhrase(melody_phrase)
+		song.addPart(chords)
+		song.addPart(melody)
+
+		music.Write.midi(song, outfile)
+
+
+class SmfBackend(MidiBackend):
+	def write(self, tempo, all_chords_pitches, all_chords_durations,
+			  all_melody_pitches, all_melody_durations, outfile):
+		smf.write_note_lists(tempo, all_chords_pitches, all_chords_durations,
+							 all_melody_pitches, all_melody_durations, outfile)
+
+
+def make_midi_backend(name=None):
+	"""Returns a MIDI backend from its short name (see MIDI_BACKENDS), or the
+	default MIDI_BACKEND if name is None"""
+	if name is None:
+		name = MIDI_BACKEND
+	if name == "jmusic":
+		return JMusicBackend()
+	if name == "smf":
+		return SmfBackend()
+	raise ValueError('Unknown MIDI backend "'+str(name)+'"')
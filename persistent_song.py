@@ -0,0 +1,340 @@
+"""Persistent song trees that share structure between copies.
+
+A PersistentSong holds the same content as a song.Song tree, but its verses,
+phrases, chords and notes are immutable and do not point back to a song, so
+any number of songs can share them:
+
+- copy() only copies the root, whatever the size of the song
+- mutation rebuilds the path from the root down to each changed node (path
+  copying) and shares every unchanged subtree with the parent song
+- spliced() shares the verses it takes from each song
+
+The nodes use the tree's attribute names (verse_seq, sequence, note_seq,
+pitch, duration, root, ...) with tuples for sequences, so critics and
+FlatSong.from_song read them unchanged. Fingerprints and durations are worked
+out once per node, so shared subtrees are never walked twice.
+
+Mutation follows the tree's per-node probabilities exactly and uses the same
+util.random_* operators. As in flat_song, a phrase or verse that appears in
+several places mutates independently in each place.
+"""
+
+import theory
+import random
+import song
+import util
+
+
+class Node(object):
+	"""An immutable element of a song. Never change a node's attributes after
+	building it; other songs may share it."""
+	_fingerprint = None
+	_duration = None
+	critic_scores = None # (critic.PhraseEvaluator, local scores) of a Phrase
+
+	def __getstate__(self):
+		# Cached values are left out so equal nodes always pickle the same
+		state = self.__dict__.copy()
+		state.pop("_fingerprint", None)
+		state.pop("_duration", None)
+		state.pop("critic_scores", None)
+		return state
+
+	def copy(self):
+		return self
+
+	def fingerprint(self):
+		"""Same value as the fingerprint of the equivalent song.Song element"""
+		if self._fingerprint is None:
+			self._fingerprint = self._compute_fingerprint()
+		return self._fingerprint
+
+	def get_duration(self):
+		if self._duration is None:
+			self._duration = self._compute_duration()
+		return self._duration
+
+
+class Note(Node):
+	def __init__(self, pitch, duration):
+		self.pitch = pitch
+		self.duration = duration
+
+	def get_pitch(self):
+		return self.pitch
+
+	def get_duration(self):
+		return self.duration
+
+	def get_all_notes(self):
+		return [self]
+
+	def scaled(self, scale_factor):
+		return Note(self.pitch, self.duration*scale_factor)
+
+	def mutated(self, legal_pitches):
+		"""Returns the note after one generation of mutation (self if unchanged)"""
+		if random.random() < song.NOTE_MUTATE_PROB:
+			return self.with_new_pitch(legal_pitches)
+		return self
+
+	def with_new_pitch(self, legal_pitches):
+		"""Returns the note after a mutation, once it is decided that it mutates"""
+		idx = random.randint(-3, 3) % len(legal_pitches)
+		return Note(legal_pitches[idx], self.duration)
+
+	def _compute_fingerprint(self):
+		return (self.pitch, self.duration)
+
+
+def mutated_children(sequence, legal_pitches):
+	"""Returns (children after mutation, whether any child changed)"""
+	children = tuple([child.mutated(legal_pitches) for child in sequence])
+	for old, new in zip(sequence, children):
+		if old is not new:
+			return children, True
+	return sequence, False
+
+
+def mutated_notes(notes, legal_pitches):
+	"""mutated_children for a tuple of notes. The notes that mutate are drawn
+	with util.bernoulli_indices, so the others are never visited."""
+	indices = util.bernoulli_indices(len(notes), song.NOTE_MUTATE_PROB)
+	if not indices:
+		return notes, False
+	notes = list(notes)
+	for idx in indices:
+		notes[idx] = notes[idx].with_new_pitch(legal_pitches)
+	return tuple(notes), True
+
+
+class Chord(Node):
+	def __init__(self, root, scale, note_seq, inversion=1, play=True):
+		self.root = root # Index into scale
+		self.scale = scale # List of jython pitches
+		self.note_seq = note_seq # A tuple of Notes
+		self.inversion = inversion # Order of constituent pitches (1, 2, or 3)
+		self.play = play
+
+	def get_pitches(self, inversion=None):
+		if inversion is None:
+			inversion = self.inversion
+		return song.chord_pitches(self.scale, self.root, inversion)
+
+	def get_all_notes(self):
+		return list(self.note_seq)
+
+	def scaled(self, scale_factor):
+		notes = tuple([n.scaled(scale_factor) for n in self.note_seq])
+		return Chord(self.root, self.scale, notes, self.inversion, self.play)
+
+	def mutated(self, legal_pitches):
+		"""Returns the chord after one generation of mutation, following
+		song.Chord._mutate (self if unchanged)"""
+		root, inversion, play, notes = self.root, self.inversion, self.play, self.note_seq
+		changed = False
+		if random.random() < song.CHORD_MUTATE_PROB:
+			changed = True
+			# change inversion
+			if random.random() < 0.25:
+				inversion = random.choice(range(1, 4))
+
+			# change root
+			if random.random() < 0.25:
+				root = random.choice(range(7))
+				# have notes follow root change
+				pitches = [theory.REST]+song.chord_pitches(self.scale, root, 1)
+				note_dur = sum([n.duration for n in notes])/(1.0*len(notes))
+				notes = tuple([Note(random.choice(pitches), note_dur) for _ in notes])
+
+			if random.random() < 0.05:
+				note_list = list(notes)
+				# merge two notes
+				if random.random() < 0.5:
+					util.random_merge(note_list)
+				# split a note
+				else:
+					util.random_split(note_list)
+				notes = tuple(note_list)
+
+			# swap 2 notes
+			if random.random() < 0.05:
+				note_list = list(notes)
+				util.random_swap(note_list)
+				notes = tuple(note_list)
+
+			# turn on or off for playback
+			if random.random() < 0.5:
+				play = not play
+
+		notes, notes_changed = mutated_notes(notes, legal_pitches)
+		if changed or notes_changed:
+			return Chord(root, self.scale, notes, inversion, play)
+		return self
+
+	def _compute_fingerprint(self):
+		return (self.root, self.inversion, self.play, tuple([n.fingerprint() for n in self.note_seq]))
+
+	def _compute_duration(self):
+		return sum([n.duration for n in self.note_seq])
+
+
+class Sequence(Node):
+	"""An immutable tuple of nodes, mutating like song.MutatableSequence"""
+	mutate_prob = None
+
+	def __init__(self, sequence):
+		self.sequence = sequence # a tuple of Nodes
+
+	def get_all_notes(self):
+		all_notes = []
+		for child in self.sequence:
+			all_notes.extend(child.get_all_notes())
+		return all_notes
+
+	def scaled(self, scale_factor):
+		return self.__class__(tuple([e.scaled(scale_factor) for e in self.sequence]))
+
+	def mutated(self, legal_pitches):
+		"""Returns the sequence after one generation of mutation (self if unchanged)"""
+		sequence = self.sequence
+		changed = False
+		if random.random() < self.mutate_prob:
+			changed = True
+			elements = list(sequence)
+
+			if random.random() < 0.1:
+				# merge two elements
+				if random.random() < 0.5:
+					util.random_merge(elements)
+				# split an element
+				else:
+					util.random_split(elements)
+
+			# swap 2 elements
+			if random.random() < 0.1:
+				util.random_swap(elements)
+
+			# repeat element
+			if random.random() < 0.1:
+				util.random_repeat(elements)
+
+			# copy self (a no-op for shared immutable nodes, kept for the random draws)
+			if random.random() < 0.1:
+				util.random_copy(elements)
+
+			sequence = tuple(elements)
+
+		sequence, children_changed = mutated_children(sequence, legal_pitches)
+		if changed or children_changed:
+			return self.__class__(sequence)
+		return self
+
+	def _compute_fingerprint(self):
+		return tuple([e.fingerprint() for e in self.sequence])
+
+	def _compute_duration(self):
+		return sum([e.get_duration() for e in self.sequence])
+
+
+class Phrase(Sequence):
+	mutate_prob = song.PHRASE_MUTATE_PROB
+
+
+class Verse(Sequence):
+	mutate_prob = song.VERSE_MUTATE_PROB
+
+
+class PersistentSong(object):
+	"""Mutable root of a persistent song. Mutation replaces verse_seq with a
+	new tuple and never changes the nodes beneath it."""
+	def __init__(self, root, tempo, legal_pitches, verse_seq=()):
+		self.root = root # Key of the song, pitch from music library
+		self.tempo = tempo # beats per minute
+		self.legal_pitches = legal_pitches # Pitches from music library
+		self.verse_seq = verse_seq # tuple of Verses
+
+	@classmethod
+	def from_song(cls, tree):
+		"""Returns the PersistentSong equivalent of a song.Song, sharing nodes
+		wherever the tree shares objects"""
+		converted = {}
+		def convert(element):
+			key = id(element)
+			if key not in converted:
+				if isinstance(element, song.Note):
+					node = Note(element.pitch, element.duration)
+				elif isinstance(element, song.Chord):
+					node = Chord(element.root, element.scale, tuple([convert(n) for n in element.note_seq]),
+								 element.inversion, element.play)
+				elif isinstance(element, song.Phrase):
+					node = Phrase(tuple([convert(c) for c in element.sequence]))
+				else:
+					node = Verse(tuple([convert(p) for p in element.sequence]))
+				converted[key] = node
+			return converted[key]
+		return cls(tree.root, tree.tempo, tree.legal_pitches, tuple([convert(v) for v in tree.verse_seq]))
+
+	def to_song(self):
+		"""Returns the equivalent song.Song tree"""
+		tree = song.Song(self.root, self.tempo, self.legal_pitches)
+		verses = []
+		for verse in self.verse_seq:
+			phrases = []
+			for phrase in verse.sequence:
+				chords = []
+				for chord in phrase.sequence:
+					notes = [song.Note(n.pitch, n.duration, tree) for n in chord.note_seq]
+					chords.append(song.Chord(chord.root, chord.scale, tree, notes, chord.inversion, chord.play))
+				phrases.append(song.Phrase(chords, tree))
+			verses.append(song.Verse(phrases, tree))
+		tree.add_verses(verses)
+		return tree
+
+	def copy(self):
+		return PersistentSong(self.root, self.tempo, self.legal_pitches, self.verse_seq)
+
+	def fingerprint(self):
+		"""Same value as Song.fingerprint for the equivalent tree"""
+		return (self.tempo, tuple([v.fingerprint() for v in self.verse_seq]))
+
+	def num_verses(self):
+		return len(self.verse_seq)
+
+	def get_duration(self):
+		return sum([v.get_duration() for v in self.verse_seq])
+
+	def get_all_notes(self):
+		all_notes = []
+		for verse in self.verse_seq:
+			all_notes.extend(verse.get_all_notes())
+		return all_notes
+
+	def spliced(self, segments):
+		"""Returns a copy of self whose verses are the concatenated (song, start,
+		stop) verse ranges in segments. The verses are shared, not copied."""
+		verses = ()
+		for other, start, stop in segments:
+			verses += tuple(other.verse_seq[start:stop])
+		return PersistentSong(self.root, self.tempo, self.legal_pitches, verses)
+
+	def recursive_mutate(self):
+		"""Mutates the song, rebuilding only the paths to changed nodes"""
+		if random.random() < song.SONG_MUTATE_PROB:
+			# change tempo
+			if random.random() < 0.5:
+				self.tempo += random.randint(-10, 10)
+			# swap two verse sequences
+			if random.random() < 0.05:
+				verses = list(self.verse_seq)
+				util.random_swap(verses)
+				self.verse_seq = tuple(verses)
+		self.verse_seq = mutated_children(self.verse_seq, self.legal_pitches)[0]
+
+	def note_lists(self):
+		return song.tree_note_lists(self)
+
+	def write_to_midi(self, outfile="out.mid", backend=None):
+		tempo, chords_pitches, chords_durations, melody_pitches, melody_durations = self.note_lists()
+		song.write_note_lists(tempo, chords_pitches, chords_durations, melody_pitches, melody_durations,
+							  outfile, backend)
@@ -0,0 +1,98 @@
+"""Bounded cache of per-phrase critic scores.
+
+Critics that can score a song phrase by phrase (see critic.PhraseEvaluator)
+keep each phrase's local scores here, keyed by the phrase's content
+fingerprint. random_song reuses one Phrase across verses and mutation
+repeats and copies phrases, so the same phrase content turns up again and
+again across the population and across generations; it is scored once
+while it stays in the cache.
+
+Unlike the generation-scoped fitness cache, entries live until the cache is
+full and then the least recently used one is dropped. The cache is shared by
+executor threads, so lookups take a lock; a pickled cache (a checkpoint, or
+a scorer shipped to worker processes) starts out empty.
+"""
+
+import threading
+
+PHRASE_CACHE_SIZE = 10000 # phrases
+
+
+class PhraseCache(object):
+	def __init__(self, capacity=PHRASE_CACHE_SIZE):
+		self.capacity = capacity
+		self.hits = 0
+		self.misses = 0
+		self._reset()
+
+	def _reset(self):
+		self.lock = threading.Lock()
+		self.entries = {} # fingerprint -> [previous, next, fingerprint, scores]
+		self.order = [None, None, None, None] # sentinel of the recency list, newest first
+		self.order[0] = self.order[1] = self.order
+
+	def __getstate__(self):
+		return {"capacity": self.capacity, "hits": self.hits, "misses": self.misses}
+
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		self._reset()
+
+	def lookup(self, key, score_fn, phrase):
+		"""Returns the scores cached for key, calling score_fn(phrase) only on a miss"""
+		self.lock.acquire()
+		try:
+			entry = self.entries.get(key)
+			if entry is not None:
+				self.hits += 1
+				self._unlink(entry)
+				self._push(entry)
+				return entry[3]
+		finally:
+			self.lock.release()
+		scores = score_fn(phrase)
+		self.lock.acquire()
+		try:
+			self.misses += 1
+			if key not in self.entries:
+				entry = [None, None, key, scores]
+				self.entries[key] = entry
+				self._push(entry)
+				if len(self.entries) > self.capacity:
+					oldest = self.order[0]
+					self._unlink(oldest)
+					del self.entries[oldest[2]]
+		finally:
+			self.lock.release()
+		return scores
+
+	def _push(self, entry):
+		newest = self.order[1]
+		entry[0] = self.order
+		entry[1] = newest
+		newest[0] = entry
+		self.order[1] = entry
+
+	def _unlink(self, entry):
+		entry[0][1] = entry[1]
+		entry[1][0] = entry[0]
+
+	def clear(self):
+		self.lock.acquire()
+		try:
+			self.entries = {}
+			self.order[0] = self.order[1] = self.order
+		finally:
+			self.lock.release()
+
+	def hit_rate(self):
+		lookups = self.hits + self.misses
+		if lookups == 0:
+			return 0.0
+		return self.hits/(1.0*lookups)
+
+	def __contains__(self, key):
+		return key in self.entries
+
+	def __len__(self):
+		return len(self.entries)
@@ -0,0 +1,76 @@
+"""Packs a whole population into padded matrices for batch critic evaluation.
+
+With NumPy (CPython) a PopulationBatch holds one row per song:
+
+	tempo                (songs,)
+	note_pitch           (songs, notes)            note_mask marks real notes
+	note_duration        (songs, notes)
+	chord_root           (songs, chords)           chord_mask marks real chords
+	chord_num_notes      (songs, chords)
+	chord_note_duration  (songs, chords, notes)    chord_note_mask marks real notes
+	num_notes, num_chords (songs,)
+
+and critics score every row at once in critique_matrices. Without NumPy
+(Jython) the batch only holds each song's flat_song.FlatSong, whose `array`
+columns the critics' critique_flat kernels read directly.
+"""
+
+from flat_song import FlatSong, CHORD, NOTE
+
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+
+def to_flat(song):
+	if isinstance(song, FlatSong):
+		return song
+	return FlatSong.from_song(song)
+
+
+class PopulationBatch(object):
+	def __init__(self, songs, pack=True):
+		self.size = len(songs)
+		self.flats = [to_flat(s) for s in songs]
+		self.packed = False
+		if pack and np is not None and self.size > 0:
+			self._pack()
+
+	def _pack(self):
+		flats = self.flats
+		num_songs = len(flats)
+		self.tempo = np.array([f.tempo for f in flats], dtype=float)
+		self.num_notes = np.array([f.count(NOTE) for f in flats])
+		self.num_chords = np.array([f.count(CHORD) for f in flats])
+		self.scales = [f.scale for f in flats]
+		max_notes = max(1, self.num_notes.max())
+		max_chords = max(1, self.num_chords.max())
+
+		self.note_pitch = np.zeros((num_songs, max_notes), dtype=np.int64)
+		self.note_duration = np.zeros((num_songs, max_notes))
+		self.note_mask = np.arange(max_notes)[None, :] < self.num_notes[:, None]
+		self.chord_root = np.zeros((num_songs, max_chords), dtype=np.int64)
+		self.chord_mask = np.arange(max_chords)[None, :] < self.num_chords[:, None]
+		self.chord_num_notes = np.zeros((num_songs, max_chords), dtype=np.int64)
+
+		chord_ids = []
+		positions = []
+		for s, f in enumerate(flats):
+			num_notes = self.num_notes[s]
+			num_chords = self.num_chords[s]
+			self.note_pitch[s, :num_notes] = np.frombuffer(f.note_pitch, dtype=np.int32)
+			self.note_duration[s, :num_notes] = np.frombuffer(f.note_duration, dtype=float)
+			self.chord_root[s, :num_chords] = np.frombuffer(f.chord_root, dtype=np.int32)
+			bounds = np.frombuffer(f.bounds[CHORD], dtype=np.int32)
+			counts = np.diff(bounds)
+			self.chord_num_notes[s, :num_chords] = counts
+			chord_ids.append(np.repeat(np.arange(num_chords), counts))
+			positions.append(np.arange(num_notes) - np.repeat(bounds[:-1], counts))
+
+		max_chord_notes = max(1, self.chord_num_notes.max())
+		self.chord_note_duration = np.zeros((num_songs, max_chords, max_chord_notes))
+		self.chord_note_mask = np.arange(max_chord_notes)[None, None, :] < self.chord_num_notes[:, :, None]
+		for s in xrange(num_songs):
+			self.chord_note_duration[s, chord_ids[s], positions[s]] = self.note_duration[s, :self.num_notes[s]]
+		self.packed = True
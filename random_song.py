@@ -1,4 +1,4 @@
-from music import *
+from theory import REST
 
 import random
 import song
@@ -0,0 +1,104 @@
+"""Parent selection strategies for Evolution.get_parents.
+
+Every strategy exposes select(songs, fitnesses, num_elite, num_extra) and
+returns num_elite+num_extra songs. num_elite comes from the survival rate and
+num_extra from the survival noise (see Evolution.get_parents). Truncation
+keeps the num_elite best songs plus num_extra random others; the stochastic
+strategies simply draw num_elite+num_extra parents, so the population
+dynamics stay comparable between strategies. Stochastic strategies may pick
+the same song more than once.
+"""
+
+import heapq
+import random
+
+SELECTIONS = ["truncation", "tournament", "rank", "roulette"]
+
+
+def stochastic_universal_sampling(weights, num_samples):
+	"""Returns num_samples indices into weights, drawn proportionally to weight
+	with a single random offset and evenly spaced pointers"""
+	total = float(sum(weights))
+	if num_samples <= 0:
+		return []
+	if total <= 0.0:
+		return [random.randrange(len(weights)) for _ in xrange(num_samples)]
+	step = total/num_samples
+	pointer = random.random()*step
+	chosen = []
+	cumulative = 0.0
+	idx = -1
+	for _ in xrange(num_samples):
+		while cumulative <= pointer and idx < len(weights)-1:
+			idx += 1
+			cumulative += weights[idx]
+		chosen.append(idx)
+		pointer += step
+	return chosen
+
+
+class Selection(object):
+	def select(self, songs, fitnesses, num_elite, num_extra):
+		raise UnimplementedError
+
+
+class TruncationSelection(Selection):
+	# Keeps the fittest songs, found with an O(n log k) heap rather than a full sort
+	def select(self, songs, fitnesses, num_elite, num_extra):
+		indices = xrange(len(songs))
+		best = heapq.nlargest(num_elite, indices, key=lambda i:fitnesses[i])
+		survived = [songs[i] for i in best]
+		if num_extra > 0:
+			kept = set(best)
+			rest = [songs[i] for i in indices if i not in kept]
+			survived += random.sample(rest, min(num_extra, len(rest)))
+		return survived
+
+
+class TournamentSelection(Selection):
+	# Each parent is the fittest of tournament_size randomly drawn songs
+	def __init__(self, tournament_size=3):
+		self.tournament_size = tournament_size
+
+	def select(self, songs, fitnesses, num_elite, num_extra):
+		survived = []
+		size = min(self.tournament_size, len(songs))
+		for _ in xrange(num_elite+num_extra):
+			entrants = random.sample(xrange(len(songs)), size)
+			winner = max(entrants, key=lambda i:fitnesses[i])
+			survived.append(songs[winner])
+		return survived
+
+
+class RankSelection(Selection):
+	# Parents are drawn with probability proportional to their fitness rank
+	def select(self, songs, fitnesses, num_elite, num_extra):
+		ranked = sorted(xrange(len(songs)), key=lambda i:fitnesses[i])
+		weights = [rank+1 for rank in xrange(len(ranked))]
+		chosen = stochastic_universal_sampling(weights, num_elite+num_extra)
+		return [songs[ranked[c]] for c in chosen]
+
+
+class RouletteSelection(Selection):
+	# Parents are drawn with probability proportional to their fitness
+	def select(self, songs, fitnesses, num_elite, num_extra):
+		lowest = min(fitnesses)
+		if lowest < 0:
+			weights = [f-lowest for f in fitnesses]
+		else:
+			weights = fitnesses
+		chosen = stochastic_universal_sampling(weights, num_elite+num_extra)
+		return [songs[c] for c in chosen]
+
+
+def make_selection(name="truncation", tournament_size=3):
+	"""Returns a selection strategy from its short name (see SELECTIONS)"""
+	if name == "truncation":
+		return TruncationSelection()
+	if name == "tournament":
+		return TournamentSelection(tournament_size)
+	if name == "rank":
+		return RankSelection()
+	if name == "roulette":
+		return RouletteSelection()
+	raise ValueError('Unknown selection "'+str(name)+'"')
@@ -0,0 +1,114 @@
+"""Pure-Python Standard MIDI File writer.
+
+Writes the same music as the jMusic path in song.write_note_lists (a Score
+with a piano chord Part on channel 1 and a vibes melody Part on channel 0)
+without going through the JVM:
+
+- format 1, PPQN ticks per quarter note
+- track 0 holds the tempo and a 4/4 time signature
+- one track per part, starting with its program change
+- every note and every pitch of a chord starts together, lasts 90% of its
+  duration (jMusic's default note length) and has velocity 85, jMusic's
+  default dynamic; rests only move time on
+
+The file is built in memory and written in one go, so it also runs under
+plain CPython or PyPy. write_songs exports many songs in one call.
+"""
+
+import struct
+from theory import REST, PIANO, VIBES
+
+PPQN = 480
+LENGTH_MULTIPLIER = 0.9 # jMusic's Note.DEFAULT_LENGTH_MULTIPLIER
+DYNAMIC = 85 # jMusic's default note dynamic
+CHORD_CHANNEL = 1
+MELODY_CHANNEL = 0
+
+NOTE_OFF = 0x80
+NOTE_ON = 0x90
+PROGRAM_CHANGE = 0xC0
+
+
+def variable_length(value):
+	"""Returns value as a MIDI variable-length quantity"""
+	data = [chr(value & 0x7F)]
+	value >>= 7
+	while value:
+		data.append(chr((value & 0x7F) | 0x80))
+		value >>= 7
+	data.reverse()
+	return "".join(data)
+
+
+def track_chunk(events):
+	"""Returns an MTrk chunk from (tick, order, data) events, where order
+	sorts events at the same tick (note offs before note ons)"""
+	events.sort()
+	data = []
+	previous_tick = 0
+	for tick, order, event in events:
+		data.append(variable_length(tick-previous_tick))
+		data.append(event)
+		previous_tick = tick
+	data.append("\x00\xFF\x2F\x00") # end of track
+	body = "".join(data)
+	return "MTrk" + struct.pack(">I", len(body)) + body
+
+
+def part_events(pitches, durations, program, channel):
+	"""Returns the events of one part. Each pitch is a MIDI pitch, REST, or a
+	list of pitches played together as a chord."""
+	events = [(0, 0, chr(PROGRAM_CHANGE | channel) + chr(program))]
+	time = 0.0
+	for pitch, duration in zip(pitches, durations):
+		if isinstance(pitch, list):
+			chord = pitch
+		else:
+			chord = [pitch]
+		start = int(round(time*PPQN))
+		stop = int(round((time+duration*LENGTH_MULTIPLIER)*PPQN))
+		for p in chord:
+			if p != REST:
+				events.append((start, 2, chr(NOTE_ON | channel) + chr(p) + chr(DYNAMIC)))
+				events.append((stop, 1, chr(NOTE_OFF | channel) + chr(p) + chr(0)))
+		time += duration
+	return events
+
+
+def tempo_track(tempo):
+	microseconds = int(round(60000000.0/max(tempo, 1)))
+	microseconds = min(max(microseconds, 1), 0xFFFFFF)
+	events = [(0, 0, "\xFF\x51\x03" + struct.pack(">I", microseconds)[1:]),
+			  (0, 0, "\xFF\x58\x04\x04\x02\x18\x08")] # 4/4
+	return track_chunk(events)
+
+
+def note_lists_to_smf(tempo, all_chords_pitches, all_chords_durations,
+					  all_melody_pitches, all_melody_durations):
+	"""Returns the bytes of a MIDI file with chords on piano (channel 1) and
+	melody on vibes (channel 0), like song.write_note_lists"""
+	tracks = [tempo_track(tempo),
+			  track_chunk(part_events(all_chords_pitches, all_chords_durations, PIANO, CHORD_CHANNEL)),
+			  track_chunk(part_events(all_melody_pitches, all_melody_durations, VIBES, MELODY_CHANNEL))]
+	header = "MThd" + struct.pack(">IHHH", 6, 1, len(tracks), PPQN)
+	return header + "".join(tracks)
+
+
+def write_note_lists(tempo, all_chords_pitches, all_chords_durations,
+					 all_melody_pitches, all_melody_durations, outfile):
+	data = note_lists_to_smf(tempo, all_chords_pitches, all_chords_durations,
+							 all_melody_pitches, all_melody_durations)
+	f = open(outfile, "wb")
+	try:
+		f.write(data)
+	finally:
+		f.close()
+
+
+def write_songs(songs, outfiles):
+	"""Writes each song (anything with note_lists, e.g. song.Song or
+	flat_song.FlatSong) to the matching file name"""
+	for s, outfile in zip(songs, outfiles):
+		tempo, chords_pitches, chords_durations, melody_pitches, melody_durations = s.note_lists()
+		write_note_lists(tempo, chords_pitches, chords_durations, melody_pitches, melody_durations, outfile)
+	return len(outfiles)
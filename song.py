@@ -15,20 +15,102 @@ Example of song structure:
 
 """
 
-import music
 import random
+import theory
 import util
+from midi_backends import make_midi_backend
+
+
+ROOT = theory.C4
+LEGAL_PITCHES = [ROOT+intv for intv in theory.MAJOR_SCALE]
+
+# Probability of mutating per generation at each level of the tree
+SONG_MUTATE_PROB = 0.1
+VERSE_MUTATE_PROB = 0.1
+PHRASE_MUTATE_PROB = 0.15
+CHORD_MUTATE_PROB = 0.05
+NOTE_MUTATE_PROB = 0.005
+
+# Kinds of change records mutation leaves on the song (see Song.record_change)
+CHANGE_KINDS = ["pitch", "duration", "chord", "notes", "sequence", "tempo", "verses"]
+DURATION_CHANGE_KINDS = ["duration", "notes", "sequence"]
+
+
+def chord_pitches(scale, root, inversion):
+	"""Returns the pitches of the triad on scale[root] in the given inversion"""
+	pitches = []
+	# 1-3-5
+	if inversion == 1:
+		pitches.append(scale[root])
+		pitches.append(scale[(root+2)%7])
+		pitches.append(scale[(root+4)%7])
+	# 3-5-1
+	elif inversion == 2:
+		pitches.append(scale[root]+12)
+		pitches.append(scale[(root+2)%7])
+		pitches.append(scale[(root+4)%7])
+	# 5-3-1
+	elif inversion == 3:
+		pitches.append(scale[root]+12)
+		pitches.append(scale[(root+2)%7]+12)
+		pitches.append(scale[(root+4)%7])
+	else:
+		raise ValueError('Invalid inversion "'+str(inversion)+'"')
+
+	return pitches
+
+
+def tree_note_lists(song):
+	"""Returns (tempo, chord pitches, chord durations, melody pitches, melody
+	durations) for write_note_lists from anything shaped like a Song tree"""
+	all_chords_pitches = []
+	all_chords_durations = []
+	all_melody_pitches = []
+	all_melody_durations = []
+
+	for verse in song.verse_seq:
+		for phrase in verse.sequence:
+			for chord in phrase.sequence:
+				if chord.play:
+					all_chords_pitches.append(chord.get_pitches())
+				else:
+					all_chords_pitches.append(theory.REST)
+				all_chords_durations.append(chord.get_duration())
+				for note in chord.note_seq:
+					all_melody_pitches.append(note.get_pitch())
+					all_melody_durations.append(note.get_duration())
+
+	return (song.tempo, all_chords_pitches, all_chords_durations,
+			all_melody_pitches, all_melody_durations)
 
 
-ROOT = music.C4
-LEGAL_PITCHES = [ROOT+intv for intv in music.MAJOR_SCALE]
+def write_note_lists(tempo, all_chords_pitches, all_chords_durations,
+					 all_melody_pitches, all_melody_durations, outfile, backend=None):
+	"""Writes chords on piano (channel 1) and melody on vibes (channel 0) to a
+	MIDI file, with the backend named in midi_backends.MIDI_BACKENDS (the
+	default MIDI_BACKEND if None)"""
+	make_midi_backend(backend).write(tempo, all_chords_pitches, all_chords_durations,
+									 all_melody_pitches, all_melody_durations, outfile)
+	print "Written to "+outfile
 
 
 
 class Mutatable(object):
 	"""An element of a song that may mutate (e.g. chords,verses)"""
+	_duration = None # Songs pickled before duration caching lack these
+	_duration_epoch = None
+
 	def __init__(self):
 		self.mutated = False # To ensure mutation <= once per generation
+		self._duration = None # get_duration, cached while _duration_epoch is the song's duration_epoch
+		self._duration_epoch = None
+
+	def __getstate__(self):
+		# Cached durations are cleared so equal songs always pickle the same
+		state = self.__dict__.copy()
+		state["_duration"] = None
+		state["_duration_epoch"] = None
+		return state
 
 	def _get_children(self):
 		"""Returns list of immediate descendents"""
@@ -50,18 +132,44 @@ class Mutatable(object):
 	def _finish_generation(self):
 		self.mutated = False
 
-	def copy(self):
-		"""Return an identical object"""
+	def _content_changed(self):
+		"""Drops values kept from the content below this element"""
+		pass
+
+	def copy(self, song=None):
+		"""Return an identical object. The copy belongs to song if given,
+		otherwise to the same Song as the original."""
 		raise UnimplementedError
 
 	def get_duration(self):
-		"""Return the absolute duration of the object in the song"""
+		"""Return the absolute duration of the object in the song. The value is
+		cached until a duration anywhere in the song changes (see
+		Song.durations_changed); phrases are shared between places in a song
+		and have no parent links, so the whole song is invalidated at once."""
+		epoch = self.song.duration_epoch
+		if self._duration_epoch != epoch:
+			self._duration = self._compute_duration()
+			self._duration_epoch = epoch
+		return self._duration
+
+	def _compute_duration(self):
 		raise UnimplementedError
 
+	def scaled(self, scale_factor):
+		"""Returns a copy whose durations are multiplied by scale_factor"""
+		copy = self.copy()
+		copy.scale_duration(scale_factor)
+		return copy
+
 	def get_all_notes(self):
 		"""Returns a list of all leaf Notes"""
 		raise UnimplementedError
 
+	def fingerprint(self):
+		"""Returns a hashable value that is equal for objects with equal content.
+		Covers every attribute that mutation can change."""
+		raise UnimplementedError
+
 
 
 class Note(Mutatable):
@@ -70,7 +178,7 @@ class Note(Mutatable):
 		super(Note, self).__init__()
 		self.pitch = pitch # From the jython music library
 		self.duration = duration # A float, usually a power of 2
-		self.mutate_prob = 0.005 # Probability of mutating per generation
+		self.mutate_prob = NOTE_MUTATE_PROB # Probability of mutating per generation
 		self.song = song # Song that this Note belongs to
 
 	def get_pitch(self):
@@ -80,22 +188,32 @@ class Note(Mutatable):
 		"""A note can only mutate by changing its pitch."""
 		if not self.mutated:
 			if random.random() < self.mutate_prob:
-				idx = self.song.legal_pitches.index(self.pitch)
-				idx = random.randint(-3, 3) % len(self.song.legal_pitches)
-				self.pitch = self.song.legal_pitches[idx]
+				self.mutate_pitch()
+
+	def mutate_pitch(self):
+		"""Changes the pitch, once it is decided that the note mutates"""
+		idx = self.song.legal_pitches.index(self.pitch)
+		idx = random.randint(-3, 3) % len(self.song.legal_pitches)
+		if self.pitch != self.song.legal_pitches[idx]:
+			self.pitch = self.song.legal_pitches[idx]
+			self.song.record_change("pitch", self)
 
-	def copy(self):
-		return Note(self.pitch, self.duration, self.song)
+	def copy(self, song=None):
+		return Note(self.pitch, self.duration, song or self.song)
 
 	def get_duration(self):
 		return self.duration
 
 	def scale_duration(self, scaleFactor):
 		self.duration *= scaleFactor
+		self.song.record_change("duration", self)
 
 	def get_all_notes(self):
 		return [self]
 
+	def fingerprint(self):
+		return (self.pitch, self.duration)
+
 
 
 class Chord(Mutatable):
@@ -108,7 +226,7 @@ class Chord(Mutatable):
 		self.scale = scale # List of jython pitches (length 8)
 		self.note_seq = note_seq # A list of Notes
 		self.song = song # The Song this Chord belongs to
-		self.mutate_prob = 0.05 # Probability of mutating per generation
+		self.mutate_prob = CHORD_MUTATE_PROB # Probability of mutating per generation
 		self.inversion = inversion # Order of constituent pitches (1, 2, or 3)
 		self.play = play
 
@@ -116,32 +234,13 @@ class Chord(Mutatable):
 		assert len(self.scale) == 7, len(self.scale)
 
 	def get_pitches(self, inversion=None):
-		pitches = []
 		if inversion is None:
 			inversion = self.inversion
-		# 1-3-5
-		if inversion == 1:
-			pitches.append(self.scale[self.root])
-			pitches.append(self.scale[(self.root+2)%7])
-			pitches.append(self.scale[(self.root+4)%7])
-		# 3-5-1
-		elif inversion == 2:
-			pitches.append(self.scale[self.root]+12)
-			pitches.append(self.scale[(self.root+2)%7])
-			pitches.append(self.scale[(self.root+4)%7])
-		# 5-3-1
-		elif inversion == 3:
-			pitches.append(self.scale[self.root]+12)
-			pitches.append(self.scale[(self.root+2)%7]+12)
-			pitches.append(self.scale[(self.root+4)%7])
-		else:
-			raise('Invalid inversion "'+str(self.inversion)+'"')
-
-		return pitches
+		return chord_pitches(self.scale, self.root, inversion)
 
 	def notes_from_chord(self, num_notes=1):
 		"""Returns random notes belonging to the chord."""
-		pitches = [music.REST]+self.get_pitches(1)
+		pitches = [theory.REST]+self.get_pitches(1)
 		notes = []
 		note_dur = self.get_duration()/(1.0*num_notes)
 		for _ in range(num_notes):
@@ -153,50 +252,70 @@ class Chord(Mutatable):
 	def reset_notes(self):
 		num_notes = len(self.note_seq)
 		self.note_seq = self.notes_from_chord(num_notes=num_notes)
+		self.song.record_change("notes", self)
 
 	def _mutate(self):
 		if random.random() < self.mutate_prob:
 			# change inversion
 			if random.random() < 0.25:
 				self.inversion = random.choice(range(1, 4))
+				self.song.record_change("chord", self)
 
 			# change root
 			if random.random() < 0.25:
 				r = random.choice(range(7))
 				self.root = r
+				self.song.record_change("chord", self)
 				# have notes follow root change
 				self.reset_notes()
 			
 			if random.random() < 0.05:
 				# merge two notes
 				if random.random() < 0.5:
-					util.random_merge(self.note_seq)
+					changed = util.random_merge(self.note_seq)
 				# split a note
 				else:
-					util.random_split(self.note_seq)
+					changed = util.random_split(self.note_seq)
+				if changed:
+					self.song.record_change("notes", self)
 
 			# swap 2 notes
 			if random.random() < 0.05:
-				util.random_swap(self.note_seq)
+				if util.random_swap(self.note_seq):
+					self.song.record_change("notes", self)
 
 			# turn on or off for playback
 			if random.random() < 0.5:
 				self.play = not self.play
+				self.song.record_change("chord", self)
 
 	def initialize_note_seq(self, default=None):
 		if default is not None:
 			self.note_seq = [Note(default, 1.0, self.song)]
 		else:
 			self.note_seq = self.notes_from_chord()
+		self.song.record_change("notes", self)
 
 	def _get_children(self):
 		return self.note_seq
 
-	def copy(self):
-		new_seq = [n.copy() for n in self.note_seq]
-		return Chord(self.root, self.scale, self.song, new_seq, self.inversion)
+	def recursive_mutate(self):
+		"""Like Mutatable.recursive_mutate, but draws the notes that mutate
+		with util.bernoulli_indices and only visits those: a note mutates with
+		probability NOTE_MUTATE_PROB, so most generations visit none."""
+		if not self.mutated:
+			self._mutate()
+			self.mutated = True
+			for idx in util.bernoulli_indices(len(self.note_seq), NOTE_MUTATE_PROB):
+				self.note_seq[idx].mutate_pitch()
+			self._finish_generation()
+
+	def copy(self, song=None):
+		song = song or self.song
+		new_seq = [n.copy(song) for n in self.note_seq]
+		return Chord(self.root, self.scale, song, new_seq, self.inversion, self.play)
 
-	def get_duration(self):
+	def _compute_duration(self):
 		if self.note_seq is None:
 			return 1.0
 		return sum([e.get_duration() for e in self.note_seq])
@@ -209,6 +328,13 @@ class Chord(Mutatable):
 	def get_all_notes(self):
 		return self.note_seq
 
+	def fingerprint(self):
+		if self.note_seq is None:
+			notes = None
+		else:
+			notes = tuple([n.fingerprint() for n in self.note_seq])
+		return (self.root, self.inversion, self.play, notes)
+
 
 
 class MutatableSequence(Mutatable):
@@ -230,30 +356,39 @@ class MutatableSequence(Mutatable):
 			if random.random() < 0.1:
 				# merge two elements
 				if random.random() < 0.5:
-					util.random_merge(self.sequence)
+					changed = util.random_merge(self.sequence)
 				# split an element
 				else:
-					util.random_split(self.sequence)
+					changed = util.random_split(self.sequence)
+				if changed:
+					self.song.record_change("sequence", self)
 
 			# swap 2 elements
 			if random.random() < 0.1:
-				util.random_swap(self.sequence)
+				if util.random_swap(self.sequence):
+					self.song.record_change("sequence", self)
 
 			# repeat element
 			if random.random() < 0.1:
 				util.random_repeat(self.sequence)
+				self.song.record_change("sequence", self)
 
 			# copy self
 			if random.random() < 0.1:
 				util.random_copy(self.sequence)
 
-	def get_duration(self):
+	def _compute_duration(self):
 		return sum([e.get_duration() for e in self.sequence])
 
 	def scale_duration(self, scale_factor):
 		notes = set(self.get_all_notes())
 		for note in notes:
 			note.scale_duration(scale_factor)
+		self._content_changed()
+
+	def _content_changed(self):
+		for child in self.sequence:
+			child._content_changed()
 
 	def get_all_notes(self):
 		all_notes = []
@@ -261,90 +396,149 @@ class MutatableSequence(Mutatable):
 			all_notes.extend(child.get_all_notes())
 		return all_notes
 
+	def fingerprint(self):
+		return tuple([e.fingerprint() for e in self.sequence])
+
 
 class Phrase(MutatableSequence):
+	"""A sequence of chords. A phrase keeps its fingerprint and the local
+	critic scores of a critic.PhraseEvaluator until mutation records a change
+	beneath it or its durations are scaled, and its copies keep them too, so
+	an unchanged phrase is never walked again. Distinct phrases never share
+	chords (copies are deep), so every change beneath a phrase happens while
+	it mutates."""
+	_fingerprint = None # Phrases pickled before these were kept lack them
+	critic_scores = None
+
 	def __init__(self, sequence, song):
 		super(Phrase, self).__init__(sequence, song)
-		self.mutate_prob = 0.15
+		self.mutate_prob = PHRASE_MUTATE_PROB
+		self._fingerprint = None
+		self.critic_scores = None # (PhraseEvaluator, local scores), set by the evaluator
 
-	def copy(self):
-		return Phrase([x.copy() for x in self.sequence], self.song)	
+	def __getstate__(self):
+		state = super(Phrase, self).__getstate__()
+		state["_fingerprint"] = None
+		state["critic_scores"] = None
+		return state
+
+	def recursive_mutate(self):
+		num_changes = len(self.song.changes)
+		super(Phrase, self).recursive_mutate()
+		if len(self.song.changes) > num_changes:
+			self._content_changed()
+
+	def _content_changed(self):
+		self._fingerprint = None
+		self.critic_scores = None
+
+	def copy(self, song=None):
+		song = song or self.song
+		phrase = Phrase([x.copy(song) for x in self.sequence], song)
+		phrase._fingerprint = self._fingerprint
+		phrase.critic_scores = self.critic_scores
+		return phrase
+
+	def fingerprint(self):
+		if self._fingerprint is None:
+			self._fingerprint = super(Phrase, self).fingerprint()
+		return self._fingerprint
 
 
 
 class Verse(MutatableSequence):
 	def __init__(self, sequence, song):
 		super(Verse, self).__init__(sequence, song)
-		self.mutate_prob = 0.1
+		self.mutate_prob = VERSE_MUTATE_PROB
 
-	def copy(self):
-		return Verse([x.copy() for x in self.sequence], self.song)
+	def copy(self, song=None):
+		song = song or self.song
+		return Verse([x.copy(song) for x in self.sequence], song)
 
 
 
 class Song(Mutatable):
 	"""Top level object containing everything for a song."""
+	duration_epoch = 0 # for songs pickled before duration caching
+	changes = () # for songs pickled before change records
 	def __init__(self, root, tempo, legal_pitches):
 		super(Song, self).__init__()
 		self.tempo = tempo # beats per minute
 		self.verse_seq = [] # list of Verses
-		self.mutate_prob = 0.1 # Probability of mutating per generation
+		self.mutate_prob = SONG_MUTATE_PROB # Probability of mutating per generation
 		self.root = root # Key of the song, pitch from music library
 		self.legal_pitches = legal_pitches # Pitches from music library
+		self.duration_epoch = 0 # changes whenever a duration in the song may have changed
+		self.changes = [] # (kind, element) change records of the last mutation
+
+	def __getstate__(self):
+		state = super(Song, self).__getstate__()
+		state["duration_epoch"] = 0
+		state["changes"] = []
+		return state
 
 	def _get_children(self):
 		return self.verse_seq
 
+	def durations_changed(self):
+		"""Invalidates the cached durations of every element of the song"""
+		self.duration_epoch += 1
+
+	def record_change(self, kind, element):
+		"""Records that mutation changed element (kind is one of CHANGE_KINDS).
+		Phrases drop what they kept from their content when a change is
+		recorded while they mutate, so critics only rescore changed phrases."""
+		self.changes.append((kind, element))
+		if kind in DURATION_CHANGE_KINDS:
+			self.durations_changed()
+
+	def recursive_mutate(self):
+		"""Mutates the song, starting a new list of change records"""
+		self.changes = []
+		super(Song, self).recursive_mutate()
+
 	def _mutate(self):
 		if random.random() < self.mutate_prob:
 			# change tempo
 			if random.random() < 0.5:
 				self.tempo += random.randint(-10, 10)
+				self.record_change("tempo", self)
 			# swap two verse sequences
 			if random.random() < 0.05:
-				util.random_swap(self.verse_seq)
+				if util.random_swap(self.verse_seq):
+					self.record_change("verses", self)
 
-	def copy(self):
-		verse_seq = [v.copy() for v in self.verse_seq]
+	def copy(self, song=None):
 		song_copy = Song(self.root, self.tempo, self.legal_pitches)
+		verse_seq = [v.copy(song_copy) for v in self.verse_seq]
 		song_copy.add_verses(verse_seq)
 		return song_copy
 
 	def add_verses(self, verses):
 		self.verse_seq.extend(verses)
+		self.durations_changed()
+
+	def num_verses(self):
+		return len(self.verse_seq)
+
+	def get_duration(self):
+		return sum([v.get_duration() for v in self.verse_seq])
+
+	def spliced(self, segments):
+		"""Returns a copy of self whose verses are copies of the concatenated
+		(song, start, stop) verse ranges in segments"""
+		song_copy = Song(self.root, self.tempo, self.legal_pitches)
+		for other, start, stop in segments:
+			song_copy.add_verses([v.copy(song_copy) for v in other.verse_seq[start:stop]])
+		return song_copy
 
-	def write_to_midi(self, outfile="out.mid"):
-		song = music.Score("Song", self.tempo)
-		chords = music.Part(music.PIANO, 1)
-		melody = music.Part(music.VIBES, 0)
-		melody_phrase = music.Phrase(0.0)
-		chord_phrase = music.Phrase(0.0)
-
-		all_chords_pitches = []
-		all_chords_durations = []
-		all_melody_pitches = []
-		all_melody_durations = []
-
-		for verse in self.verse_seq:
-			for phrase in verse.sequence:
-				for chord in phrase.sequence:
-					if chord.play:
-						all_chords_pitches.append(chord.get_pitches())
-					else:
-						all_chords_pitches.append(music.REST)
-					all_chords_durations.append(chord.get_duration())
-					for note in chord.note_seq:
-						all_melody_pitches.append(note.get_pitch())
-						all_melody_durations.append(note.get_duration())
-
-		chord_phrase.addNoteList(all_chords_pitches, all_chords_durations)
-		melody_phrase.addNoteList(all_melody_pitches, all_melody_durations)
-		chords.addPhrase(chord_phrase)
-		melody.addPhrase(melody_phrase)
-		song.addPart(chords)
-		song.addPart(melody)
-
-		music.Write.midi(song, outfile)
-		print "Written to "+outfile
+	def fingerprint(self):
+		return (self.tempo, tuple([v.fingerprint() for v in self.verse_seq]))
 
+	def note_lists(self):
+		return tree_note_lists(self)
 
+	def write_to_midi(self, outfile="out.mid", backend=None):
+		tempo, chords_pitches, chords_durations, melody_pitches, melody_durations = self.note_lists()
+		write_note_lists(tempo, chords_pitches, chords_durations, melody_pitches, melody_durations,
+						 outfile, backend)
@@ -0,0 +1,200 @@
+"""Hyperparameter sweeps over critic sets, population size and survival settings.
+
+Every configuration is one CriticCrossoverEvolution run. The sweep covers the
+full grid of the given values, or --random N configurations drawn from it,
+and runs them on a pool of --workers processes (threads under Jython, see
+daemon.make_job_pool). Each finished run appends one CSV row:
+
+	critics, size, survival_rate, survival_noise, crossover_rate,
+	generations, seed   the configuration
+	final_fitness       best fitness of the last generation
+	best_fitness        best fitness seen during the run
+	threshold_generation, threshold_seconds
+	                    generations and time until the best fitness first
+	                    reached --threshold (empty if it never did, or
+	                    without --threshold)
+	seconds             wall time of the run
+
+Configurations already in the CSV are skipped, so an interrupted sweep picks
+up where it stopped. To run, go into the jythonMusic directory and run
+`python ../sweep.py --critics "ChordProgression,Tempo;Rhythm,RestRatio" --sizes 50,100 --survival-rates 0.3,0.5`
+"""
+
+import csv
+import daemon
+import evolution
+import optparse
+import os
+import random
+import threading
+import time
+
+KEY_COLUMNS = ["critics", "size", "survival_rate", "survival_noise", "crossover_rate", "generations", "seed"]
+COLUMNS = KEY_COLUMNS + ["final_fitness", "best_fitness", "threshold_generation", "threshold_seconds", "seconds"]
+
+
+def grid(critic_sets, sizes, survival_rates, survival_noises, crossover_rates, generations, seeds):
+	"""Returns every configuration dict of the grid"""
+	configs = []
+	for critics in critic_sets:
+		for size in sizes:
+			for survival_rate in survival_rates:
+				for survival_noise in survival_noises:
+					for crossover_rate in crossover_rates:
+						for seed in seeds:
+							configs.append({"critics": critics,
+											"size": size,
+											"survival_rate": survival_rate,
+											"survival_noise": survival_noise,
+											"crossover_rate": crossover_rate,
+											"generations": generations,
+											"seed": seed})
+	return configs
+
+
+def config_key(config):
+	"""Returns the configuration as a tuple of strings, as read back from the CSV"""
+	return tuple([str(config[column]) for column in KEY_COLUMNS])
+
+
+def run_config(config, threshold=None):
+	"""Evolves one configuration; returns its CSV row as a dict"""
+	random.seed(config["seed"])
+	start = time.time()
+	evo = evolution.CriticCrossoverEvolution(config["size"], evolution.parse_critics(config["critics"]),
+											 survival_rate=config["survival_rate"],
+											 survival_noise=config["survival_noise"],
+											 crossover_rate=config["crossover_rate"])
+	row = dict(config)
+	row["threshold_generation"] = ""
+	row["threshold_seconds"] = ""
+	fitness = best_fitness = evo.get_fitness(evo.get_current_best_song())
+	for _ in xrange(config["generations"]):
+		evo.next_generation()
+		fitness = evo.get_fitness(evo.get_current_best_song())
+		best_fitness = max(best_fitness, fitness)
+		if threshold is not None and fitness >= threshold and row["threshold_generation"] == "":
+			row["threshold_generation"] = evo.generation
+			row["threshold_seconds"] = time.time()-start
+	row["final_fitness"] = fitness
+	row["best_fitness"] = best_fitness
+	row["seconds"] = time.time()-start
+	return row
+
+
+def completed(path):
+	"""Returns the keys of the configurations already in the CSV at path"""
+	if not os.path.exists(path):
+		return set()
+	f = open(path, "rb")
+	try:
+		return set([tuple([row[column] for column in KEY_COLUMNS]) for row in csv.DictReader(f)])
+	finally:
+		f.close()
+
+
+class Sweep(object):
+	"""Runs configurations on a job pool and appends each result to a CSV file"""
+	def __init__(self, path, pool, threshold=None):
+		self.path = path
+		self.pool = pool
+		self.threshold = threshold
+		self.lock = threading.Lock() # guards the CSV file and counters
+		self.done = 0
+		self.failed = 0
+		self.total = 0
+
+	def run(self, configs):
+		"""Runs the configurations not yet in the CSV; returns how many were run"""
+		skip = completed(self.path)
+		pending = [c for c in configs if config_key(c) not in skip]
+		print "Running", len(pending), "of", len(configs), "configurations"
+		new_file = not os.path.exists(self.path)
+		self.out = open(self.path, "ab")
+		try:
+			self.writer = csv.DictWriter(self.out, COLUMNS)
+			if new_file:
+				self.writer.writerow(dict(zip(COLUMNS, COLUMNS)))
+			self.total = len(pending)
+			for config in pending:
+				self.pool.run(run_config, (config, self.threshold), self.record)
+			self.pool.shutdown()
+		finally:
+			self.out.close()
+		return len(pending)
+
+	def record(self, reply):
+		ok, value = reply
+		self.lock.acquire()
+		try:
+			if ok:
+				value.update(zip(KEY_COLUMNS, config_key(value))) # as completed() reads them back
+				self.writer.writerow(value)
+				self.out.flush()
+				self.done += 1
+				print "%d/%d" % (self.done+self.failed, self.total), value["critics"], \
+					  "size", value["size"], "best fitness", value["best_fitness"]
+			else:
+				self.failed += 1
+				print "%d/%d" % (self.done+self.failed, self.total), "failed:", value
+		finally:
+			self.lock.release()
+
+
+def float_list(text):
+	return [float(x) for x in text.split(",")]
+
+
+def int_list(text):
+	return [int(x) for x in text.split(",")]
+
+
+def main():
+	parser = optparse.OptionParser(usage="%prog [options]")
+	parser.add_option("--critics", default="ChordProgression,Tempo",
+					  help="semicolon separated critic sets, each a comma separated list of "
+						   "evolution.py critic names [default: %default]")
+	parser.add_option("--sizes", default="100", help="comma separated population sizes [default: %default]")
+	parser.add_option("--survival-rates", default=str(evolution.SURVIVAL_RATE),
+					  help="comma separated survival rates [default: %default]")
+	parser.add_option("--survival-noises", default=str(evolution.SURVIVAL_NOISE),
+					  help="comma separated survival noise values [default: %default]")
+	parser.add_option("--crossover-rates", default=str(evolution.CROSSOVER_RATE),
+					  help="comma separated crossover rates [default: %default]")
+	parser.add_option("--generations", type="int", default=100, help="generations per run [default: %default]")
+	parser.add_option("--seeds", default="0", help="comma separated seeds; each configuration runs once per seed")
+	parser.add_option("--random", type="int", default=0, metavar="N",
+					  help="run N configurations drawn at random from the grid instead of all of it")
+	parser.add_option("--sample-seed", type="int", default=0, help="seed for drawing --random configurations")
+	parser.add_option("--threshold", type="float", default=None,
+					  help="report when the best fitness first reaches this value")
+	parser.add_option("--workers", type="int", default=None,
+					  help="configurations run at once [default: one per core]")
+	parser.add_option("--pool", choices=daemon.POOLS, default=daemon.DEFAULT_POOL,
+					  help=", ".join(daemon.POOLS)+" [default: %default]")
+	parser.add_option("--output", default="sweep.csv",
+					  help="CSV file results are appended to [default: %default]")
+	options, args = parser.parse_args()
+	if args:
+		parser.error("unexpected arguments: "+" ".join(args))
+
+	critic_sets = options.critics.split(";")
+	for critics in critic_sets:
+		evolution.check_critics(parser, critics)
+	configs = grid(critic_sets, int_list(options.sizes), float_list(options.survival_rates),
+				   float_list(options.survival_noises), float_list(options.crossover_rates),
+				   options.generations, int_list(options.seeds))
+	if 0 < options.random < len(configs):
+		configs = random.Random(options.sample_seed).sample(configs, options.random)
+
+	sweep = Sweep(options.output, daemon.make_job_pool(options.pool, options.workers), options.threshold)
+	start = time.time()
+	sweep.run(configs)
+	print "Ran", sweep.done, "configurations in", round(time.time()-start, 1), "seconds,", sweep.failed, "failed"
+	print "Written to", options.output
+	if sweep.failed:
+		return 1
+
+
+if __name__ == '__main__':
+	evolution.run_cli(main)
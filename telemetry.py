@@ -0,0 +1,143 @@
+"""Per-generation telemetry for Evolution runs as a JSON Lines stream.
+
+Telemetry is an Evolution hook (see Evolution.add_hook) that writes one JSON
+record per generation:
+
+	generation   the generation that was scored and bred (0 for the first)
+	seconds      wall time of the generation
+	stages       wall time of scoring, selection, mutation, mingle, dedup and
+	             replacement (steady-state only)
+	cache        fitness cache hits and misses in the generation, their hit
+	             rate and the number of cached genomes
+	fitness      min, q25, median, q75, q90, max and mean fitness of the
+	             population the parents were selected from
+	population   number of songs
+	duplicate_rate   share of the new children identical to an earlier child
+	mean_chords, mean_notes   average genome size
+
+Lines are flushed as they are written, so a stream can be followed while the
+run goes on. An Evolution without hooks skips all of this.
+
+`python telemetry.py run.jsonl > run.csv` flattens a stream into CSV columns
+for plotting fitness and timing charts like those in tables/.
+"""
+
+import evolution
+import sys
+import time
+from flat_song import FlatSong, CHORD, NOTE
+from json_util import to_json, from_json
+
+QUANTILES = [("min", 0.0), ("q25", 0.25), ("median", 0.5), ("q75", 0.75), ("q90", 0.9), ("max", 1.0)]
+
+
+def song_size(song):
+	"""Returns (chords, notes) in song"""
+	if isinstance(song, FlatSong):
+		return song.count(CHORD), song.count(NOTE)
+	num_chords = 0
+	num_notes = 0
+	for verse in song.verse_seq:
+		for phrase in verse.sequence:
+			num_chords += len(phrase.sequence)
+			for chord in phrase.sequence:
+				num_notes += len(chord.note_seq)
+	return num_chords, num_notes
+
+
+def distribution(values):
+	"""Returns the quantiles and mean of values"""
+	values = sorted(values)
+	summary = {}
+	for name, q in QUANTILES:
+		summary[name] = values[int(round(q*(len(values)-1)))]
+	summary["mean"] = sum(values)/float(len(values))
+	return summary
+
+
+class Telemetry(object):
+	def __init__(self, stream):
+		self.stream = stream # file-like object the JSON lines go to
+		self.records = 0
+		self._reset()
+
+	def _reset(self):
+		self.stage_times = dict([(stage, 0.0) for stage in evolution.STAGES])
+		self.fitnesses = None
+		self.generation_start = None
+		self.stage_start = None
+		self.hits = 0 # fitness cache counters when the generation started
+		self.misses = 0
+
+	def before(self, evo, stage):
+		self.stage_start = time.time()
+		if self.generation_start is None:
+			self.generation_start = self.stage_start
+			self.hits = evo.fitness_cache.hits
+			self.misses = evo.fitness_cache.misses
+
+	def after(self, evo, stage, result):
+		self.stage_times[stage] += time.time()-self.stage_start
+		# The first scoring of a generation is of the whole population
+		if stage == "scoring" and self.fitnesses is None:
+			self.fitnesses = result
+
+	def generation_done(self, evo):
+		self.stream.write(to_json(self.record(evo))+"\n")
+		self.stream.flush()
+		self.records += 1
+		self._reset()
+
+	def record(self, evo):
+		"""Returns the telemetry record of the generation evo just finished"""
+		hits = evo.fitness_cache.hits-self.hits
+		misses = evo.fitness_cache.misses-self.misses
+		sizes = [song_size(s) for s in evo.population]
+		population = len(evo.population)
+		record = {"generation": evo.generation-1,
+				  "time": time.time(),
+				  "seconds": time.time()-self.generation_start,
+				  "stages": self.stage_times,
+				  "cache": {"hits": hits,
+							"misses": misses,
+							"hit_rate": hits/float(max(hits+misses, 1)),
+							"size": len(evo.fitness_cache)},
+				  "population": population,
+				  "duplicate_rate": evo.duplicate_rate,
+				  "mean_chords": sum([c for c, n in sizes])/float(max(population, 1)),
+				  "mean_notes": sum([n for c, n in sizes])/float(max(population, 1))}
+		if self.fitnesses:
+			record["fitness"] = distribution(self.fitnesses)
+		return record
+
+
+def to_csv(lines, out):
+	"""Writes the records of a telemetry stream as CSV"""
+	columns = ["generation", "seconds"] + ["stages."+s for s in evolution.STAGES] + \
+			  ["cache.hit_rate", "population", "duplicate_rate", "mean_chords", "mean_notes"] + \
+			  ["fitness."+name for name, q in QUANTILES] + ["fitness.mean"]
+	out.write(",".join(columns)+"\n")
+	for line in lines:
+		if not line.strip():
+			continue
+		record = from_json(line)
+		row = []
+		for column in columns:
+			value = record
+			for part in column.split("."):
+				value = value.get(part, {})
+			if value == {}:
+				value = ""
+			row.append(str(value))
+		out.write(",".join(row)+"\n")
+
+
+if __name__ == '__main__':
+	if len(sys.argv) != 2:
+		print "usage: telemetry.py run.jsonl > run.csv"
+		sys.exit(2)
+	f = open(sys.argv[1])
+	try:
+		to_csv(f, sys.stdout)
+	finally:
+		f.close()
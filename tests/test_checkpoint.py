@@ -0,0 +1,69 @@
+"""Checks that a resumed run produces exactly the songs of an uninterrupted one.
+
+Run from the repository root with `python -m unittest discover -s tests`.
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+# Restart on every plateau of two generations, so restarts happen between checkpoints
+OPTIONS = ["--plateau-window", "2", "--best-tolerance", "1", "--mean-tolerance", "1",
+		   "--on-plateau", "restart", "--max-restarts", "100", "--midi-backend", "smf", "--seed", "3"]
+
+
+def read(path):
+	f = open(path, "rb")
+	try:
+		return f.read()
+	finally:
+		f.close()
+
+
+class ResumeTest(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.work_dir = os.path.join(self.directory, "work") # evolution.py writes to ../results
+		os.makedirs(self.work_dir)
+		os.makedirs(os.path.join(self.directory, "results"))
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def run_evolution(self, name, num_gens, *options):
+		args = [sys.executable, os.path.join(ROOT_DIR, "evolution.py"), name+"_gen0", name+"_genx",
+				"Rhythm,Tempo", str(num_gens), "--export-best", name+"_best"]
+		process = subprocess.Popen(args+OPTIONS+list(options), cwd=self.work_dir,
+								   stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+		out, err = process.communicate()
+		self.assertEqual(process.returncode, 0, err)
+		return out
+
+	def outputs(self, name):
+		"""Returns the bytes of every MIDI file a run wrote, by file name"""
+		files = {}
+		for prefix in ["gen0", "genx"]:
+			files[prefix] = read(os.path.join(self.directory, "results", name+"_"+prefix+".mid"))
+		best_dir = os.path.join(self.work_dir, name+"_best")
+		for filename in os.listdir(best_dir):
+			files[filename] = read(os.path.join(best_dir, filename))
+		return files
+
+	def test_resume_matches_uninterrupted_run(self):
+		out = self.run_evolution("whole", 9, "--checkpoint", "whole_checkpoint")
+		self.assertTrue("restart" in out)
+		checkpoint_dir = "split_checkpoint"
+		self.run_evolution("split", 5, "--checkpoint", checkpoint_dir, "--checkpoint-every", "1")
+		out = self.run_evolution("split", 9, "--checkpoint", checkpoint_dir, "--checkpoint-every", "1", "--resume")
+		self.assertTrue("Resuming from generation  5" in out)
+		whole = self.outputs("whole")
+		self.assertEqual(len(whole), 2+9)
+		self.assertEqual(self.outputs("split"), whole)
+
+
+if __name__ == '__main__':
+	unittest.main()
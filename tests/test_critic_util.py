@@ -0,0 +1,103 @@
+"""Checks the one-pass statistics used by the critics against two-pass sums.
+
+Run from the repository root with `python -m unittest discover -s tests`.
+"""
+
+import math
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import critic_util
+from critic_util import RunningStats
+
+
+def two_pass(values):
+	"""Returns the mean and population variance of values, or (0.0, 0.0)"""
+	if not values:
+		return 0.0, 0.0
+	mean = sum(values)/float(len(values))
+	return mean, sum([(x-mean)**2 for x in values])/len(values)
+
+
+class RunningStatsTest(unittest.TestCase):
+	def setUp(self):
+		random.seed(1)
+		self.samples = [[], [3.5], [2, 2], [1, 2, 3, 4], [0.25, 0.5, 1.0, 2.0, 4.0]]
+		self.samples += [[random.uniform(-5.0, 5.0) for _ in xrange(n)] for n in [2, 7, 100, 1000]]
+		self.samples.append([1e6+random.random() for _ in xrange(1000)]) # a sum of squares would lose the variance here
+
+	def check(self, stats, values):
+		mean, variance = two_pass(values)
+		self.assertEqual(stats.count, len(values))
+		self.assertAlmostEqual(stats.mean, mean, delta=1e-12*max(1.0, abs(mean)))
+		self.assertAlmostEqual(stats.variance(), variance, delta=1e-9*max(1.0, variance))
+		self.assertAlmostEqual(stats.stdev(), math.sqrt(variance), delta=1e-9*max(1.0, math.sqrt(variance)))
+		if values:
+			self.assertEqual((stats.min, stats.max), (min(values), max(values)))
+		else:
+			self.assertEqual((stats.min, stats.max), (None, None))
+
+	def test_empty(self):
+		stats = RunningStats()
+		self.check(stats, [])
+		self.assertEqual(stats.variance(), 0.0)
+		self.assertEqual(critic_util.variance([]), 0.0)
+		self.assertEqual(critic_util.moments([]), (0, 0.0, 0.0))
+
+	def test_one_element(self):
+		stats = RunningStats([3.5])
+		self.check(stats, [3.5])
+		self.assertEqual((stats.mean, stats.variance()), (3.5, 0.0))
+
+	def test_update_matches_two_pass(self):
+		for values in self.samples:
+			self.check(RunningStats(values), values)
+			count, mean, m2 = critic_util.moments(values)
+			self.assertEqual(count, len(values))
+			self.assertAlmostEqual(critic_util.variance(values), two_pass(values)[1],
+								   delta=1e-9*max(1.0, two_pass(values)[1]))
+
+	def test_add_and_extend_match_two_pass(self):
+		for values in self.samples:
+			one_by_one = RunningStats()
+			for x in values:
+				one_by_one.add(x)
+			self.check(one_by_one, values)
+			in_chunks = RunningStats()
+			for start in xrange(0, len(values), 3):
+				in_chunks.extend(iter(values[start:start+3])) # any iterable
+			self.check(in_chunks, values)
+
+	def test_merge_matches_two_pass(self):
+		for values in self.samples:
+			for split in sorted(set([0, 1, len(values)//2, len(values)-1, len(values)])):
+				if not 0 <= split <= len(values):
+					continue
+				left, right = values[:split], values[split:]
+				self.check(RunningStats(left).merge(RunningStats(right)), values)
+				self.check(RunningStats(right).merge(RunningStats(left)), right+left)
+
+	def test_merge_with_empty(self):
+		stats = RunningStats([1.0, 2.0]).merge(RunningStats())
+		self.check(stats, [1.0, 2.0])
+		stats = RunningStats().merge(RunningStats([1.0, 2.0]))
+		self.check(stats, [1.0, 2.0])
+		self.check(RunningStats().merge(RunningStats()), [])
+
+	def test_segments_match_two_pass(self):
+		values = self.samples[-2]
+		bounds = [0, 0, 1, 10, 10, 500, 1000]
+		stats = critic_util.segment_stats(values, bounds)
+		stdevs = critic_util.segment_stdevs(values, bounds)
+		for i in xrange(len(bounds)-1):
+			segment = values[bounds[i]:bounds[i+1]]
+			self.check(stats[i], segment)
+			self.assertAlmostEqual(stdevs[i], math.sqrt(two_pass(segment)[1]))
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,49 @@
+"""Checks that critics give a song the same score whatever its representation.
+
+Run from the repository root with `python -m unittest discover -s tests`.
+"""
+
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import critic
+from flat_song import FlatSong
+from persistent_song import PersistentSong
+from population_batch import PopulationBatch, np
+from random_song import RandomSong as rs
+
+
+def random_songs(num_songs, num_mutations):
+	return [rs.random_song(critic.ROOT, critic.LEGAL_PITCHES, critic.SCALE, num_mutations=num_mutations)
+			for _ in xrange(num_songs)]
+
+
+class ChordDurationRepetitionTest(unittest.TestCase):
+	def setUp(self):
+		random.seed(1)
+		self.critic = critic.ChordDurationRepetitionCritic()
+		# Unmutated songs share one phrase and one verse throughout; mutation
+		# copies and repeats phrases, so some stay shared and some do not
+		self.songs = random_songs(3, 0) + random_songs(20, 30)
+
+	def test_copy_scores_like_original(self):
+		for s in self.songs:
+			self.assertEqual(self.critic.critique_song(s), self.critic.critique_song(s.copy()))
+
+	def test_genomes_and_matrices_agree(self):
+		tree_scores = [self.critic.critique_song(s) for s in self.songs]
+		flat_scores = [self.critic.critique_flat(FlatSong.from_song(s)) for s in self.songs]
+		self.assertEqual(tree_scores, flat_scores)
+		persistent_scores = [self.critic.critique_song(PersistentSong.from_song(s)) for s in self.songs]
+		self.assertEqual(tree_scores, persistent_scores)
+		if np is not None:
+			batch_scores = self.critic.critique_population(PopulationBatch(self.songs))
+			self.assertEqual(tree_scores, batch_scores)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,55 @@
+"""Checks that the evolution daemon only writes inside its results directory.
+
+Run from the repository root with `python -m unittest discover -s tests`.
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import daemon
+
+
+class RecordingPool(object):
+	"""Records the jobs it is given instead of running them"""
+	def __init__(self):
+		self.jobs = []
+
+	def run(self, fn, args, callback):
+		self.jobs.append(args[0])
+
+
+class OutputNameTest(unittest.TestCase):
+	def setUp(self):
+		self.pool = RecordingPool()
+		self.daemon = daemon.EvolutionDaemon(self.pool, "results")
+
+	def job(self, first_output, output):
+		return {"first_output": first_output, "output": output, "critics": "Rhythm",
+				"generations": 1, "size": 2, "seed": 0}
+
+	def test_plain_names_are_queued(self):
+		self.assertEqual(self.daemon.submit(self.job("gen0", "gen_100.x")), 0)
+		self.assertEqual(len(self.pool.jobs), 1)
+
+	def test_paths_are_refused(self):
+		bad_names = ["", None, 3, "..", "../gen0", "a..b", os.path.abspath("gen0"),
+					 os.path.join("sub", "gen0")]
+		if os.altsep:
+			bad_names.append("sub"+os.altsep+"gen0")
+		for name in bad_names:
+			self.assertRaises(ValueError, self.daemon.submit, self.job("gen0", name))
+			self.assertRaises(ValueError, self.daemon.submit, self.job(name, "gen100"))
+		self.assertEqual(self.pool.jobs, [])
+		self.assertEqual(self.daemon.jobs, [])
+
+	def test_refusal_reaches_the_client(self):
+		ok, error = daemon.run_safely(self.daemon.handle, ("submit", self.job("/tmp/gen0", "gen100")))
+		self.assertFalse(ok)
+		self.assertTrue("ValueError" in error)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,122 @@
+"""Checks that the cached durations of song trees match a fresh walk.
+
+Run from the repository root with `python -m unittest discover -s tests`.
+"""
+
+import os
+import pickle
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import critic
+import song
+from random_song import RandomSong as rs
+
+
+def fresh_duration(element):
+	"""Returns the duration of element summed from its notes, ignoring every cache"""
+	if isinstance(element, song.Note):
+		return element.duration
+	if isinstance(element, song.Song):
+		children = element.verse_seq
+	else:
+		children = element._get_children()
+	return sum([fresh_duration(child) for child in children])
+
+
+def elements(s):
+	"""Returns the song and every verse, phrase and chord in it"""
+	result = [s]
+	for verse in s.verse_seq:
+		result.append(verse)
+		for phrase in verse.sequence:
+			result.append(phrase)
+			result.extend(phrase.sequence)
+	return result
+
+
+class DurationCacheTest(unittest.TestCase):
+	def setUp(self):
+		random.seed(1)
+		self.songs = [rs.random_song(critic.ROOT, critic.LEGAL_PITCHES, critic.SCALE, num_mutations=num_mutations)
+					  for num_mutations in [0, 10, 40]]
+
+	def check_durations(self, s):
+		for element in elements(s):
+			self.assertAlmostEqual(element.get_duration(), fresh_duration(element))
+
+	def test_cached_durations_match_a_fresh_walk(self):
+		for s in self.songs:
+			self.check_durations(s)
+			self.check_durations(s) # now from the cache
+
+	def test_mutation_invalidates_the_cache(self):
+		for s in self.songs:
+			resized = 0
+			for _ in xrange(100):
+				self.check_durations(s) # fills the cache before each mutation
+				epoch = s.duration_epoch
+				s.recursive_mutate()
+				if [kind for kind, element in s.changes if kind in song.DURATION_CHANGE_KINDS]:
+					resized += 1
+					self.assertTrue(s.duration_epoch > epoch)
+				self.check_durations(s)
+			self.assertTrue(resized > 0)
+
+	def test_scaling_invalidates_the_cache(self):
+		for s in self.songs:
+			self.check_durations(s)
+			duration = s.get_duration()
+			chord = s.verse_seq[0].sequence[0].sequence[0]
+			chord.scale_duration(2.0) # the chord's phrase may appear in several places
+			self.assertTrue(s.get_duration() > duration)
+			self.check_durations(s)
+
+	def test_copy_keeps_its_own_cache(self):
+		for s in self.songs:
+			self.check_durations(s)
+			duplicate = s.copy()
+			self.check_durations(duplicate)
+			duration = s.get_duration()
+			for _ in xrange(50):
+				duplicate.recursive_mutate()
+				self.check_durations(duplicate)
+			self.assertEqual(s.get_duration(), duration)
+			self.check_durations(s)
+
+	def test_crossover_children_match_a_fresh_walk(self):
+		evo = critic.CriticCrossoverEvolution(4, critic.parse_critics("Rhythm,Tempo"), crossover_rate=0.5)
+		for _ in xrange(30):
+			parent_one, parent_two = random.sample(self.songs, 2)
+			self.check_durations(parent_one)
+			self.check_durations(parent_two)
+			child = evo.crossover(parent_one, parent_two)
+			self.check_durations(child)
+			child.recursive_mutate()
+			self.check_durations(child)
+			self.check_durations(parent_one)
+			self.check_durations(parent_two)
+
+	def test_spliced_durations_add_up(self):
+		one, two = self.songs[1], self.songs[2]
+		self.check_durations(one)
+		child = one.spliced([(one, 0, 1), (two, 1, None)])
+		expected = one.verse_seq[0].get_duration()+sum([v.get_duration() for v in two.verse_seq[1:]])
+		self.assertAlmostEqual(child.get_duration(), expected)
+		self.check_durations(child)
+
+	def test_pickles_leave_out_the_cache(self):
+		for s in self.songs:
+			self.check_durations(s)
+			restored = pickle.loads(pickle.dumps(s))
+			for element in elements(restored):
+				self.assertEqual(element._duration, None)
+			self.assertEqual(restored.fingerprint(), s.fingerprint())
+			self.check_durations(restored)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,79 @@
+"""Checks that the ways Evolution refills its population add diversity.
+
+Run from the repository root with `python -m unittest discover -s tests`.
+"""
+
+import os
+import random
+import subprocess
+import sys
+import unittest
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, ROOT_DIR)
+
+import critic
+import evolution
+
+SIZE = 30
+
+
+def distinct(songs):
+	return len(set([s.fingerprint() for s in songs]))
+
+
+class RefillTest(unittest.TestCase):
+	def setUp(self):
+		random.seed(1)
+
+	def make_evolution(self, genome="tree", dedup="report"):
+		return evolution.CriticEvolution(SIZE, [critic.RhythmCritic()], genome=genome, dedup=dedup)
+
+	def test_restart_adds_distinct_songs(self):
+		for genome in evolution.GENOMES:
+			e = self.make_evolution(genome)
+			before = distinct(e.population) # new random songs are all the same
+			e.restart(0.1)
+			self.assertEqual(len(e.population), SIZE)
+			self.assertTrue(distinct(e.population) > before)
+			self.assertTrue(distinct(e.population) > SIZE/2)
+
+	def test_dedup_replaces_duplicates_with_distinct_songs(self):
+		for dedup in ["random", "mutate"]:
+			e = self.make_evolution(dedup=dedup)
+			song = e.population[0]
+			for _ in xrange(20):
+				song.recursive_mutate()
+			songs = [song]+[song.copy() for _ in xrange(SIZE-1)]
+			songs = e.deduplicate(songs)
+			self.assertEqual(len(songs), SIZE)
+			self.assertTrue(distinct(songs) > SIZE/2)
+			self.assertEqual(e.duplicate_rate, (SIZE-1)/float(SIZE))
+
+
+
+class CommandLineTest(unittest.TestCase):
+	def run_script(self, *args):
+		process = subprocess.Popen([sys.executable, os.path.join(ROOT_DIR, "evolution.py")]+list(args),
+								   stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+		out, err = process.communicate()
+		return process.returncode, err
+
+	def test_unknown_critic_is_a_bad_argument(self):
+		status, err = self.run_script("gen0", "genx", "Tempo,NoSuchCritic", "1")
+		self.assertEqual(status, 2)
+		self.assertTrue("NoSuchCritic" in err)
+
+	def test_parse_critics_knows_every_name(self):
+		self.assertEqual(len(evolution.parse_critics(evolution.CRITIC_NAMES)), len(evolution.CRITIC_NAMES))
+		self.assertEqual(evolution.unknown_critics("Tempo,Rhythm"), [])
+		self.assertEqual(evolution.unknown_critics("Tempo,NoSuchCritic"), ["NoSuchCritic"])
+
+	def test_parse_critics_builds_fresh_critics(self):
+		first, second = evolution.parse_critics("ChordProgression,ChordProgression")
+		self.assertFalse(first is second)
+		self.assertEqual(first.__class__, second.__class__)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,65 @@
+"""Checks that every executor scores a population exactly like the serial one.
+
+Run from the repository root with `python -m unittest discover -s tests`.
+"""
+
+import os
+import random
+import sys
+import traceback
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import evolution
+import executors
+
+
+def failing_critic(song):
+	raise ValueError("critic failed")
+
+
+class ExecutorTest(unittest.TestCase):
+	def setUp(self):
+		random.seed(1)
+		self.evolution = evolution.CriticEvolution(40, evolution.parse_critics("Rhythm,Tempo,ChordProgression,Major"),
+												   batch=False)
+		for s in self.evolution.population:
+			for _ in xrange(random.randrange(20)):
+				s.recursive_mutate()
+
+	def executor_names(self):
+		names = ["serial", "thread"]
+		try:
+			import multiprocessing
+			names.append("process")
+		except ImportError:
+			pass # Jython
+		return names
+
+	def test_executors_agree(self):
+		songs = self.evolution.population
+		fitness_fn = self.evolution.fitness_function()
+		expected = [fitness_fn(s) for s in songs]
+		for name in self.executor_names():
+			executor = executors.make_executor(name, 2)
+			try:
+				self.assertEqual(executor.map(fitness_fn, songs), expected)
+			finally:
+				executor.shutdown()
+
+	def test_thread_failure_keeps_traceback(self):
+		executor = executors.ThreadPoolExecutor(2)
+		try:
+			try:
+				executor.map(failing_critic, self.evolution.population[:3])
+				self.fail("expected the critic's error")
+			except ValueError:
+				frames = traceback.extract_tb(sys.exc_info()[2])
+				self.assertEqual(frames[-1][2], "failing_critic")
+		finally:
+			executor.shutdown()
+
+
+if __name__ == '__main__':
+	unittest.main()
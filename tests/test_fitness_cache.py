@@ -0,0 +1,80 @@
+"""Checks the generation-scoped fitness cache.
+
+Run from the repository root with `python -m unittest discover -s tests`.
+"""
+
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import critic
+import evolution
+from fitness_cache import FitnessCache
+
+
+class Counter(object):
+	"""Fitness function that counts its calls"""
+	def __init__(self, fitness_fn):
+		self.fitness_fn = fitness_fn
+		self.calls = 0
+
+	def __call__(self, song):
+		self.calls += 1
+		return self.fitness_fn(song)
+
+
+class FitnessCacheTest(unittest.TestCase):
+	def setUp(self):
+		random.seed(1)
+		self.evolution = evolution.CriticEvolution(20, evolution.parse_critics("Rhythm,Tempo,ChordProgression"))
+		self.song = self.evolution.random_song()
+		for _ in xrange(20):
+			self.song.recursive_mutate()
+
+	def test_identical_content_hits(self):
+		cache = FitnessCache()
+		fitness_fn = Counter(self.evolution.compute_fitness)
+		fitness = cache.lookup(self.song, fitness_fn)
+		self.assertEqual(cache.lookup(self.song.copy(), fitness_fn), fitness)
+		self.assertEqual(fitness_fn.calls, 1)
+		self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+	def test_mutated_song_misses(self):
+		cache = FitnessCache()
+		fitness_fn = Counter(self.evolution.compute_fitness)
+		cache.lookup(self.song, fitness_fn)
+		child = self.song.copy()
+		key = child.fingerprint()
+		while child.fingerprint() == key:
+			child.recursive_mutate()
+		self.assertEqual(cache.lookup(child, fitness_fn), self.evolution.compute_fitness(child))
+		self.assertEqual(fitness_fn.calls, 2)
+		self.assertEqual((cache.hits, cache.misses), (0, 2))
+
+	def test_unused_entries_expire_after_two_generations(self):
+		cache = FitnessCache()
+		fitness_fn = Counter(self.evolution.compute_fitness)
+		cache.lookup(self.song, fitness_fn)
+		cache.advance()
+		self.assertTrue(self.song.fingerprint() in cache)
+		cache.advance()
+		self.assertFalse(self.song.fingerprint() in cache)
+
+	def test_cached_scores_equal_uncached(self):
+		population = self.evolution.population
+		for s in population:
+			for _ in xrange(random.randrange(10)):
+				s.recursive_mutate()
+		population.extend([s.copy() for s in population[:5]])
+		uncached = self.evolution.score_songs(population)
+		self.assertEqual(self.evolution.evaluate_population(population), uncached)
+		self.assertEqual(self.evolution.evaluate_population(population), uncached)
+		self.assertEqual([self.evolution.get_fitness(s) for s in population], uncached)
+		self.assertTrue(self.evolution.fitness_cache.hits > 0)
+
+
+if __name__ == '__main__':
+	unittest.main()
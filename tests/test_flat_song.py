@@ -0,0 +1,57 @@
+"""Checks that the flat genome stays equivalent to the song tree.
+
+Run from the repository root with `python -m unittest discover -s tests`.
+"""
+
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import critic
+from flat_song import FlatSong
+from random_song import RandomSong as rs
+
+
+class FlatSongTest(unittest.TestCase):
+	def setUp(self):
+		random.seed(1)
+		self.songs = [rs.random_song(critic.ROOT, critic.LEGAL_PITCHES, critic.SCALE, num_mutations=num_mutations)
+					  for num_mutations in [0, 5, 20, 50, 50]]
+
+	def test_fingerprint_matches_tree(self):
+		for s in self.songs:
+			self.assertEqual(FlatSong.from_song(s).fingerprint(), s.fingerprint())
+
+	def test_round_trip(self):
+		for s in self.songs:
+			flat = FlatSong.from_song(s)
+			tree = flat.to_song()
+			self.assertEqual(tree.fingerprint(), s.fingerprint())
+			self.assertAlmostEqual(tree.get_duration(), s.get_duration())
+			self.assertEqual(FlatSong.from_song(tree).fingerprint(), flat.fingerprint())
+
+	def test_mutated_flat_song_round_trips(self):
+		for s in self.songs:
+			flat = FlatSong.from_song(s)
+			for _ in xrange(20):
+				flat.recursive_mutate()
+				self.assertEqual(flat.to_song().fingerprint(), flat.fingerprint())
+				self.assertAlmostEqual(flat.to_song().get_duration(), flat.get_duration()) # summed in another order
+
+	def test_copy_is_independent(self):
+		for s in self.songs:
+			flat = FlatSong.from_song(s)
+			key = flat.fingerprint()
+			duplicate = flat.copy()
+			self.assertEqual(duplicate.fingerprint(), key)
+			while duplicate.fingerprint() == key:
+				duplicate.recursive_mutate()
+			self.assertEqual(flat.fingerprint(), key)
+			self.assertEqual(flat.to_song().fingerprint(), s.fingerprint())
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,53 @@
+"""Checks the authentication of socket islands.
+
+Run from the repository root with `python -m unittest discover -s tests`.
+"""
+
+import os
+import socket
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import islands
+
+
+class AuthenticationTest(unittest.TestCase):
+	def handshake(self, server_key, client_key):
+		"""Returns the errors (or None) of both ends of an authentication"""
+		server_sock, client_sock = socket.socketpair()
+		errors = [None, None]
+		def run(idx, sock, authkey, serving):
+			channel = islands.SocketChannel(sock)
+			try:
+				islands.authenticate(channel, authkey, serving)
+			except islands.AuthenticationError, e:
+				errors[idx] = e
+				channel.close() # lets the other end see the connection drop
+			except EOFError, e:
+				errors[idx] = e
+		server = threading.Thread(target=run, args=(0, server_sock, server_key, True))
+		server.start()
+		run(1, client_sock, client_key, False)
+		server.join()
+		server_sock.close()
+		client_sock.close()
+		return errors
+
+	def test_shared_key_authenticates(self):
+		if not hasattr(socket, "socketpair"):
+			return # Jython
+		self.assertEqual(self.handshake("key", "key"), [None, None])
+
+	def test_wrong_key_is_rejected_by_both_ends(self):
+		if not hasattr(socket, "socketpair"):
+			return
+		server_error, client_error = self.handshake("key", "other key")
+		self.assertTrue(isinstance(server_error, islands.AuthenticationError))
+		self.assertTrue(isinstance(client_error, islands.AuthenticationError))
+
+
+if __name__ == '__main__':
+	unittest.main()
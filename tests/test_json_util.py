@@ -0,0 +1,59 @@
+"""Checks the JSON writer and the pure-Python parser used under Jython.
+
+Run from the repository root with `python -m unittest discover -s tests`.
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from json_util import to_json, from_json, parse_json
+
+try:
+	import json
+except ImportError:
+	json = None # Jython
+
+VALUES = [None, True, False, 0, -12, 3.25, -1.5e-07, "", "plain", 'quote " and \\ backslash',
+		  "tab\tcarriage\rnewline\nnul\x00unit\x1f", u"caf\xe9", [], {}, [1, [2, [3]]],
+		  {"a": {"b": [1, 2.5, None]}, "c": "d"}]
+
+
+class JsonTest(unittest.TestCase):
+	def test_round_trip(self):
+		for value in VALUES:
+			for indent in [None, ""]:
+				self.assertEqual(parse_json(to_json(value, indent)), value)
+				self.assertEqual(from_json(to_json(value, indent)), value)
+
+	def test_control_characters_are_escaped(self):
+		text = to_json("a\tb\x01")
+		self.assertEqual(text, '"a\\u0009b\\u0001"')
+		for c in text:
+			self.assertTrue(ord(c) >= 0x20)
+
+	def test_non_finite_floats_are_null(self):
+		infinity = 1e300*1e300
+		self.assertEqual(to_json([infinity, -infinity, infinity-infinity]), "[null, null, null]")
+
+	def test_output_is_valid_json(self):
+		if json is None:
+			return
+		for value in VALUES:
+			self.assertEqual(json.loads(to_json(value)), value)
+
+	def test_parser_agrees_with_json_module(self):
+		if json is None:
+			return
+		text = '{"x": [1, -0.5, 2E3, "\\u00e9\\n\\/"], "y": true, "z": null, "w": {}}'
+		self.assertEqual(parse_json(text), json.loads(text))
+
+	def test_parser_rejects_code(self):
+		for text in ["__import__('os').system('true')", '{"a": 1} x', "[1,]", "'single'", '"\\q"', '{"a" 1}', ""]:
+			self.assertRaises(ValueError, parse_json, text)
+
+
+if __name__ == '__main__':
+	unittest.main()
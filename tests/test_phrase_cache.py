@@ -0,0 +1,130 @@
+"""Checks the bounded phrase score cache and the scores served from it.
+
+Run from the repository root with `python -m unittest discover -s tests`.
+"""
+
+import os
+import pickle
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import critic
+import evolution
+from phrase_cache import PhraseCache
+from random_song import RandomSong as rs
+
+
+class Counter(object):
+	"""A score function that counts its calls"""
+	def __init__(self):
+		self.calls = 0
+
+	def __call__(self, phrase):
+		self.calls += 1
+		return ("scores of", phrase)
+
+
+def phrase_critics():
+	return [c for c in evolution.parse_critics(evolution.CRITIC_NAMES) if hasattr(c, "phrase_score")]
+
+
+class PhraseCacheTest(unittest.TestCase):
+	def test_scores_once_per_key(self):
+		cache = PhraseCache(10)
+		score = Counter()
+		self.assertEqual(cache.lookup("a", score, "phrase a"), ("scores of", "phrase a"))
+		self.assertEqual(cache.lookup("a", score, "another phrase a"), ("scores of", "phrase a"))
+		self.assertEqual(score.calls, 1)
+		self.assertEqual((cache.hits, cache.misses), (1, 1))
+		self.assertEqual(cache.hit_rate(), 0.5)
+
+	def test_eviction_keeps_the_cache_bounded(self):
+		cache = PhraseCache(5)
+		score = Counter()
+		for key in xrange(100):
+			cache.lookup(key, score, key)
+			self.assertEqual(len(cache), min(key+1, 5))
+		self.assertEqual(sorted(cache.entries), range(95, 100))
+		self.assertEqual(score.calls, 100)
+
+	def test_least_recently_used_goes_first(self):
+		cache = PhraseCache(3)
+		score = Counter()
+		for key in ["a", "b", "c"]:
+			cache.lookup(key, score, key)
+		cache.lookup("a", score, "a") # now b is the oldest
+		cache.lookup("d", score, "d")
+		self.assertEqual(sorted(cache.entries), ["a", "c", "d"])
+		cache.lookup("c", score, "c")
+		cache.lookup("e", score, "e") # a is now the oldest
+		self.assertEqual(sorted(cache.entries), ["c", "d", "e"])
+		self.assertEqual(score.calls, 5)
+
+	def test_random_lookups_stay_bounded(self):
+		random.seed(1)
+		cache = PhraseCache(20)
+		score = Counter()
+		recent = []
+		for _ in xrange(2000):
+			key = random.randint(0, 50)
+			self.assertEqual(cache.lookup(key, score, key), ("scores of", key))
+			if key in recent:
+				recent.remove(key)
+			recent.append(key)
+			self.assertTrue(len(cache) <= 20)
+			self.assertEqual(sorted(cache.entries), sorted(recent[-20:])) # exactly the 20 most recent keys
+		self.assertEqual(score.calls, cache.misses)
+
+	def test_clear_and_pickle_empty_the_cache(self):
+		cache = PhraseCache(5)
+		for key in xrange(5):
+			cache.lookup(key, Counter(), key)
+		restored = pickle.loads(pickle.dumps(cache))
+		self.assertEqual((len(restored), restored.capacity, restored.misses), (0, 5, 5))
+		restored.lookup(1, Counter(), 1)
+		self.assertEqual(len(restored), 1)
+		cache.clear()
+		self.assertEqual(len(cache), 0)
+		self.assertFalse(0 in cache)
+
+
+class CachedScoresTest(unittest.TestCase):
+	def setUp(self):
+		random.seed(1)
+		self.songs = [rs.random_song(critic.ROOT, critic.LEGAL_PITCHES, critic.SCALE, num_mutations=num_mutations)
+					  for num_mutations in [0, 10, 30, 30, 60]]
+
+	def check_scores(self, evaluator, s):
+		"""Checks evaluator's scores of s against an uncached walk of the whole song"""
+		expected = [c.critique_song(s) for c in evaluator.critics]
+		scores = evaluator.evaluate(s)
+		self.assertEqual(len(scores), len(expected))
+		for score, full_walk in zip(scores, expected):
+			self.assertAlmostEqual(score, full_walk)
+
+	def test_cached_scores_match_a_full_walk_after_mutation(self):
+		for capacity in [1, 4, 10000]: # evicting constantly, sometimes and never
+			evaluator = critic.PhraseEvaluator(phrase_critics(), PhraseCache(capacity))
+			for s in self.songs:
+				s = s.copy()
+				for _ in xrange(30):
+					self.check_scores(evaluator, s)
+					self.assertTrue(len(evaluator.cache) <= capacity)
+					s.recursive_mutate()
+			self.assertTrue(evaluator.cache.hits > 0)
+
+	def test_scorer_matches_a_full_walk(self):
+		critics = evolution.parse_critics(evolution.CRITIC_NAMES)
+		scorer = critic.CriticScorer(critics)
+		for s in self.songs:
+			s = s.copy()
+			for _ in xrange(20):
+				self.assertAlmostEqual(scorer(s), sum([c.critique_song(s) for c in critics]))
+				s.recursive_mutate()
+
+
+if __name__ == '__main__':
+	unittest.main()
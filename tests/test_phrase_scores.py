@@ -0,0 +1,113 @@
+"""Checks that the critic scores kept on phrases always match a fresh score.
+
+Run from the repository root with `python -m unittest discover -s tests`.
+"""
+
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import critic
+import evolution
+from persistent_song import PersistentSong
+from random_song import RandomSong as rs
+
+
+def phrases(s):
+	return [phrase for verse in s.verse_seq for phrase in verse.sequence]
+
+
+def owners(s):
+	"""Returns the phrases each chord and note of s belongs to, by id"""
+	result = {}
+	for phrase in phrases(s):
+		result.setdefault(id(phrase), []).append(phrase)
+		for chord in phrase.sequence:
+			result.setdefault(id(chord), []).append(phrase)
+			for note in chord.note_seq:
+				result.setdefault(id(note), []).append(phrase)
+	return result
+
+
+class PhraseScoresTest(unittest.TestCase):
+	def setUp(self):
+		random.seed(1)
+		self.songs = [rs.random_song(critic.ROOT, critic.LEGAL_PITCHES, critic.SCALE, num_mutations=num_mutations)
+					  for num_mutations in [0, 10, 30, 60]]
+		self.evaluator = critic.PhraseEvaluator([c for c in evolution.parse_critics(evolution.CRITIC_NAMES)
+												 if hasattr(c, "phrase_score")])
+
+	def check_scores(self, s):
+		"""Checks that the incremental scores of s equal a full re-score"""
+		scores = self.evaluator.evaluate(s)
+		for phrase in phrases(s):
+			self.assertTrue(phrase.critic_scores[0] is self.evaluator)
+			self.assertEqual(phrase.critic_scores[1], self.evaluator._score_phrase(phrase))
+		expected = [c.critique_song(s) for c in self.evaluator.critics]
+		for score, full_walk in zip(scores, expected):
+			self.assertAlmostEqual(score, full_walk)
+
+	def test_recorded_changes_drop_the_scores_of_their_phrases(self):
+		for s in self.songs:
+			s = s.copy()
+			for _ in xrange(50):
+				self.check_scores(s)
+				before = owners(s)
+				s.recursive_mutate()
+				changed = set()
+				for kind, element in s.changes:
+					for phrase in before.get(id(element), []):
+						changed.add(id(phrase))
+				for phrase in phrases(s):
+					if id(phrase) in changed:
+						self.assertEqual(phrase.critic_scores, None)
+					elif phrase.critic_scores is not None:
+						self.assertEqual(phrase.critic_scores[1], self.evaluator._score_phrase(phrase))
+			self.check_scores(s)
+
+	def test_content_changed_drops_the_scores(self):
+		for s in self.songs:
+			s = s.copy()
+			self.check_scores(s)
+			phrase = s.verse_seq[0].sequence[0]
+			phrase.scale_duration(0.5) # calls _content_changed
+			self.assertEqual(phrase.critic_scores, None)
+			self.check_scores(s)
+			phrase = s.verse_seq[-1].sequence[-1]
+			phrase._content_changed()
+			self.assertEqual(phrase.critic_scores, None)
+			self.check_scores(s)
+
+	def test_single_phrase_mutation(self):
+		for s in self.songs:
+			s = s.copy()
+			for _ in xrange(20):
+				self.check_scores(s)
+				target = random.choice(phrases(s))
+				kept = [(phrase, phrase.critic_scores) for phrase in phrases(s) if phrase is not target]
+				s.changes = []
+				target.recursive_mutate()
+				if s.changes:
+					self.assertEqual(target.critic_scores, None)
+				for phrase, scores in kept:
+					self.assertTrue(phrase.critic_scores is scores) # untouched phrases keep theirs
+			self.check_scores(s)
+
+	def test_copies_and_persistent_songs_keep_correct_scores(self):
+		for s in self.songs:
+			self.check_scores(s)
+			duplicate = s.copy()
+			for phrase in phrases(duplicate):
+				self.assertTrue(phrase.critic_scores is not None)
+			self.check_scores(duplicate)
+			persistent = PersistentSong.from_song(s)
+			for _ in xrange(20):
+				self.check_scores(persistent)
+				persistent.recursive_mutate()
+
+
+if __name__ == '__main__':
+	unittest.main()
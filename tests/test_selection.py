@@ -0,0 +1,65 @@
+"""Checks that every selection strategy honours the survival rate and noise.
+
+Run from the repository root with `python -m unittest discover -s tests`.
+"""
+
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import evolution
+import selection
+
+SIZE = 40
+
+
+class SelectionTest(unittest.TestCase):
+	def setUp(self):
+		random.seed(1)
+		self.songs = range(SIZE) # select only indexes songs, so stand-ins will do
+		self.fitnesses = [float(i) for i in self.songs]
+
+	def test_parent_counts(self):
+		for name in selection.SELECTIONS:
+			for survival_rate, survival_noise in [(0.5, 0.0), (0.3, 0.5), (0.1, 1.0)]:
+				random.seed(1)
+				e = evolution.CriticEvolution(SIZE, evolution.parse_critics("Rhythm,Tempo"),
+											  survival_rate=survival_rate, survival_noise=survival_noise,
+											  selection=selection.make_selection(name))
+				num_elite = int(SIZE*survival_rate)
+				num_extra = int((SIZE-num_elite)*survival_noise)
+				parents = e.get_parents()
+				self.assertEqual(len(parents), num_elite+num_extra, name)
+				self.assertEqual(len(set([id(p) for p in parents])), len(parents), name) # copied when picked twice
+
+	def test_truncation_keeps_the_best(self):
+		survived = selection.TruncationSelection().select(self.songs, self.fitnesses, 10, 0)
+		self.assertEqual(sorted(survived), range(SIZE-10, SIZE))
+
+	def test_noise_perturbs_truncation(self):
+		survived = selection.TruncationSelection().select(self.songs, self.fitnesses, 10, 10)
+		self.assertEqual(len(set(survived)), 20)
+		self.assertEqual(sorted(survived[:10]), range(SIZE-10, SIZE))
+		self.assertTrue(min(survived[10:]) < SIZE-10)
+
+	def test_stochastic_strategies_favour_fitness(self):
+		mean = sum(self.fitnesses)/SIZE
+		for name in ["tournament", "rank", "roulette"]:
+			survived = selection.make_selection(name).select(self.songs, self.fitnesses, 100, 100)
+			self.assertEqual(len(survived), 200)
+			self.assertTrue(sum(survived)/200.0 > mean, name)
+
+	def test_seeded_selection_is_reproducible(self):
+		for name in selection.SELECTIONS:
+			runs = []
+			for _ in xrange(2):
+				random.seed(5)
+				runs.append(selection.make_selection(name).select(self.songs, self.fitnesses, 10, 5))
+			self.assertEqual(runs[0], runs[1], name)
+
+
+if __name__ == '__main__':
+	unittest.main()
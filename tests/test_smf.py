@@ -0,0 +1,76 @@
+"""Checks the bytes written by the pure-Python MIDI file writer.
+
+Run from the repository root with `python -m unittest discover -s tests`.
+"""
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import critic
+import smf
+from random_song import RandomSong as rs
+from theory import REST
+
+
+def read(path):
+	f = open(path, "rb")
+	try:
+		return f.read()
+	finally:
+		f.close()
+
+
+class SmfTest(unittest.TestCase):
+	def test_variable_length(self):
+		for value, data in [(0, "\x00"), (0x7F, "\x7F"), (0x80, "\x81\x00"), (432, "\x83\x30"),
+							(0x3FFF, "\xFF\x7F"), (0x4000, "\x81\x80\x00"), (0x0FFFFFFF, "\xFF\xFF\xFF\x7F")]:
+			self.assertEqual(smf.variable_length(value), data)
+
+	def test_small_song(self):
+		# A C/E chord then a rest on piano; C5, a rest and D5 on vibes, at 120 bpm
+		data = smf.note_lists_to_smf(120, [[60, 64], REST], [1.0, 1.0], [72, REST, 74], [0.5, 0.5, 1.0])
+		header = "MThd" "\x00\x00\x00\x06" "\x00\x01" "\x00\x03" "\x01\xE0" # format 1, 3 tracks, 480 PPQN
+		tempo = ("MTrk" "\x00\x00\x00\x13"
+				 "\x00" "\xFF\x51\x03\x07\xA1\x20" # 500000 microseconds per quarter note
+				 "\x00" "\xFF\x58\x04\x04\x02\x18\x08" # 4/4
+				 "\x00" "\xFF\x2F\x00")
+		chords = ("MTrk" "\x00\x00\x00\x18"
+				  "\x00" "\xC1\x00" # piano on channel 1
+				  "\x00" "\x91\x3C\x55"
+				  "\x00" "\x91\x40\x55"
+				  "\x83\x30" "\x81\x3C\x00" # off after 90% of a quarter note, 432 ticks
+				  "\x00" "\x81\x40\x00"
+				  "\x00" "\xFF\x2F\x00")
+		melody = ("MTrk" "\x00\x00\x00\x1A"
+				  "\x00" "\xC0\x0B" # vibes on channel 0
+				  "\x00" "\x90\x48\x55"
+				  "\x81\x58" "\x80\x48\x00" # 216 ticks
+				  "\x82\x08" "\x90\x4A\x55" # the rest: on at 480 ticks
+				  "\x83\x30" "\x80\x4A\x00"
+				  "\x00" "\xFF\x2F\x00")
+		self.assertEqual(data, header+tempo+chords+melody)
+
+	def test_write_songs(self):
+		random.seed(1)
+		songs = [rs.random_song(critic.ROOT, critic.LEGAL_PITCHES, critic.SCALE, num_mutations=20)
+				 for _ in xrange(3)]
+		directory = tempfile.mkdtemp()
+		try:
+			outfiles = [os.path.join(directory, "song_%d.mid" % i) for i in xrange(len(songs))]
+			self.assertEqual(smf.write_songs(songs, outfiles), len(songs))
+			for s, outfile in zip(songs, outfiles):
+				data = read(outfile)
+				self.assertEqual(data, smf.note_lists_to_smf(*s.note_lists()))
+				self.assertTrue(data.startswith("MThd"))
+		finally:
+			shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,106 @@
+"""Checks steady-state replacement: children take the place of the least fit songs.
+
+Run from the repository root with `python -m unittest discover -s tests`.
+"""
+
+import heapq
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import critic
+import evolution
+
+SIZE = 12
+
+
+class StandIn(object):
+	"""A song stand-in; replace_worst only needs fingerprints"""
+	def __init__(self, key):
+		self.key = key
+
+	def fingerprint(self):
+		return self.key
+
+
+class CheckedEvolution(evolution.CriticEvolution):
+	"""Checks every replacement of a steady-state step against the real fitnesses"""
+	test = None
+
+	def replace_worst(self, heap, fitnesses, keys, present, children, child_fitnesses):
+		for child, fitness in zip(children, child_fitnesses):
+			current = [self.get_fitness(s) for s in self.population]
+			before = list(self.population)
+			super(CheckedEvolution, self).replace_worst(heap, fitnesses, keys, present, [child], [fitness])
+			replaced = [slot for slot in xrange(len(before)) if before[slot] is not self.population[slot]]
+			self.test.assertEqual(len(replaced), 1)
+			self.test.assertEqual(current[replaced[0]], min(current))
+			self.test.assertTrue(self.population[replaced[0]] is child)
+			self.test.assertEqual(len(self.population), SIZE)
+			self.test.assertEqual(fitnesses, [self.get_fitness(s) for s in self.population])
+			self.test.assertEqual(sorted(heap), sorted([(f, slot) for slot, f in enumerate(fitnesses)]))
+
+
+class ReplaceWorstTest(unittest.TestCase):
+	def test_children_replace_the_current_worst(self):
+		e = evolution.CriticEvolution(4, [critic.RhythmCritic()], replacement="steady")
+		e.population = [StandIn("a"), StandIn("b"), StandIn("b"), StandIn("c")]
+		fitnesses = [0.5, 0.1, 0.3, 0.9]
+		heap = [(f, slot) for slot, f in enumerate(fitnesses)]
+		heapq.heapify(heap)
+		keys = ["a", "b", "b", "c"]
+		present = {"a": 1, "b": 2, "c": 1}
+		# The first child is the worst song once placed, so the second replaces it
+		children = [StandIn("d"), StandIn("e"), StandIn("a")]
+		e.replace_worst(heap, fitnesses, keys, present, children, [0.05, 0.7, 0.2])
+		self.assertEqual([s.key for s in e.population], ["a", "e", "a", "c"])
+		self.assertEqual(fitnesses, [0.5, 0.7, 0.2, 0.9])
+		self.assertEqual(keys, ["a", "e", "a", "c"])
+		self.assertEqual(present, {"a": 2, "e": 1, "c": 1})
+		self.assertEqual(heap[0], (0.2, 2))
+		self.assertEqual(sorted(heap), sorted([(f, slot) for slot, f in enumerate(fitnesses)]))
+
+
+class SteadyStateTest(unittest.TestCase):
+	def make_evolution(self, genome="tree", steady_offspring=evolution.STEADY_OFFSPRING, cls=evolution.CriticEvolution):
+		return cls(SIZE, evolution.parse_critics("Rhythm,Tempo,ChordProgression"), genome=genome,
+				   replacement="steady", steady_offspring=steady_offspring, dedup="mutate")
+
+	def test_each_child_evicts_the_current_worst(self):
+		random.seed(1)
+		for steady_offspring in [1, 2, 5]:
+			e = self.make_evolution(steady_offspring=steady_offspring, cls=CheckedEvolution)
+			e.test = self
+			for _ in xrange(3):
+				e.next_generation()
+				self.assertEqual(len(e.population), SIZE)
+
+	def test_best_fitness_never_drops(self):
+		random.seed(2)
+		for genome in evolution.GENOMES:
+			e = self.make_evolution(genome)
+			best = max(e.evaluate_population(e.population))
+			for _ in xrange(5):
+				e.next_generation()
+				self.assertEqual(len(e.population), SIZE)
+				fitnesses = e.evaluate_population(e.population)
+				self.assertTrue(max(fitnesses) >= best, genome)
+				best = max(fitnesses)
+
+	def test_seeded_runs_are_reproducible(self):
+		for genome in evolution.GENOMES:
+			runs = []
+			for _ in xrange(2):
+				random.seed(3)
+				e = self.make_evolution(genome)
+				for _ in xrange(4):
+					e.next_generation()
+				runs.append(([s.fingerprint() for s in e.population], e.duplicate_rate))
+			self.assertEqual(runs[0], runs[1], genome)
+
+
+if __name__ == '__main__':
+	unittest.main()
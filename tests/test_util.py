@@ -0,0 +1,62 @@
+"""Checks the geometric-gap sampling that picks the elements that mutate.
+
+Run from the repository root with `python -m unittest discover -s tests`.
+"""
+
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import util
+
+
+class BernoulliIndicesTest(unittest.TestCase):
+	def setUp(self):
+		random.seed(1)
+
+	def check_indices(self, indices, n):
+		self.assertEqual(indices, sorted(set(indices)))
+		for idx in indices:
+			self.assertTrue(0 <= idx < n)
+
+	def test_edge_cases(self):
+		for p in [0.0, 0.005, 0.5, 1.0]:
+			self.assertEqual(util.bernoulli_indices(0, p), [])
+		for n in [1, 10, 1000]:
+			self.assertEqual(util.bernoulli_indices(n, 0.0), [])
+			self.assertEqual(util.bernoulli_indices(n, 1.0), range(n))
+
+	def test_indices_are_sorted_unique_and_in_range(self):
+		for n in [1, 2, 10, 1000]:
+			for p in [0.005, 0.1, 0.5, 0.9, 0.999]:
+				self.check_indices(util.bernoulli_indices(n, p), n)
+
+	def test_hit_rate_matches_p(self):
+		n = 200000
+		for p in [0.005, 0.05, 0.15, 0.5, 0.9]:
+			hits = len(util.bernoulli_indices(n, p))
+			stdev = (n*p*(1.0-p))**0.5
+			self.assertTrue(abs(hits-n*p) < 5*stdev, (p, hits))
+
+	def test_every_index_is_equally_likely(self):
+		n, p, trials = 20, 0.1, 20000
+		counts = [0]*n
+		for _ in xrange(trials):
+			for idx in util.bernoulli_indices(n, p):
+				counts[idx] += 1
+		stdev = (trials*p*(1.0-p))**0.5
+		for count in counts:
+			self.assertTrue(abs(count-trials*p) < 5*stdev, counts)
+
+	def test_seeded_draws_are_reproducible(self):
+		random.seed(3)
+		first = util.bernoulli_indices(1000, 0.05)
+		random.seed(3)
+		self.assertEqual(util.bernoulli_indices(1000, 0.05), first)
+
+
+if __name__ == '__main__':
+	unittest.main()
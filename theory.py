@@ -0,0 +1,18 @@
+"""Music theory constants the GA core needs, in pure Python.
+
+The values are jMusic's (the music library's) own, so songs, critics and
+MIDI files are the same whichever interpreter runs the evolution. Only MIDI
+output through jMusic needs the JVM; see midi_backends.py.
+"""
+
+# MIDI pitches
+C4 = 60
+C5 = 72
+REST = -2147483648 # jMusic's REST pitch (Integer.MIN_VALUE)
+
+# Scales as semitone intervals from the root
+MAJOR_SCALE = [0, 2, 4, 5, 7, 9, 11]
+
+# General MIDI programs
+PIANO = 0
+VIBES = 11
@@ -1,11 +1,16 @@
+import math
 import random
 
 
+# The random_* operators return whether they changed the content of l, so
+# callers only record changes that happened (see song.Song.record_change)
+
 def random_swap(l):
 	n = len(l)
 	a = random.randint(0, n-1)
 	b = random.randint(0, n-1)
 	l[b], l[a] = l[a], l[b]
+	return a != b
 
 def random_copy(l):
 	d = sum([e.get_duration() for e in l])
@@ -14,22 +19,24 @@ def random_copy(l):
 	elm_copy = elm.copy()
 	l[idx] = elm_copy
 	assert d == sum([e.get_duration() for e in l])
+	return False # the copy has the same content
 
 def random_merge(l):
 	d = sum([e.get_duration() for e in l])
+	merged = len(l) >= 2
 
-	if len(l) >= 2:
+	if merged:
 		firstIdx = random.randint(0, len(l)-2)
 		firstDur = l[firstIdx].get_duration()
 		secondDur = l[firstIdx+1].get_duration()
 		duration_scale = (firstDur+secondDur)/(1.0*firstDur)
-		l[firstIdx] = l[firstIdx].copy()
-		l[firstIdx].scale_duration(duration_scale)
+		l[firstIdx] = l[firstIdx].scaled(duration_scale)
 		del l[firstIdx+1]
 
 	temp_sum = sum([e.get_duration() for e in l])
 	if not abs(round(d, 4) - round(temp_sum, 4)) < 0.0002: print round(d, 4), round(temp_sum, 4)
 	assert abs(round(d, 4) - round(temp_sum, 4)) < 0.0002
+	return merged
 
 def random_repeat(l):
 	idx = random.randint(0, len(l)-1)
@@ -37,6 +44,7 @@ def random_repeat(l):
 	elm_copy = elm_to_repeat.copy()
 	random_idx = random.randint(0, len(l))
 	l.insert(random_idx, elm_copy)
+	return True
 
 def random_split(l):
 	d = sum([e.get_duration() for e in l])
@@ -45,16 +53,34 @@ def random_split(l):
 	elm_to_split = l[idx]
 	for note in elm_to_split.get_all_notes():
 		if note.duration < 0.25:
-			return
-	elm_to_split = elm_to_split.copy()
+			return False
+	elm_to_split = elm_to_split.scaled(0.5)
 	l[idx] = elm_to_split
-	elm_to_split.scale_duration(0.5)
 	elm_copy = elm_to_split.copy()
 	l.insert(idx+1, elm_copy)
 	
 	temp_sum = sum([e.get_duration() for e in l])
 	if not abs(round(d, 4) - round(temp_sum, 4)) < 0.0002: print round(d, 4), round(temp_sum, 4)
 	assert abs(round(d, 4) - round(temp_sum, 4)) < 0.0002
+	return True
 
 def chord_list_to_melody(chords):
 	return [c.note_from_chord() for c in chords]
+
+def bernoulli_indices(n, p):
+	"""Returns the sorted indices in range(n) that each independently come up
+	with probability p, drawing one geometric gap per chosen index instead of
+	one random number per index"""
+	if p <= 0.0:
+		return []
+	if p >= 1.0:
+		return range(n)
+	log_miss = math.log(1.0-p)
+	indices = []
+	idx = -1
+	while True:
+		# P(gap >= k) = (1-p)**k, the chance of k misses in a row
+		idx += 1 + int(math.log(1.0-random.random())/log_miss)
+		if idx >= n:
+			return indices
+		indices.append(idx)